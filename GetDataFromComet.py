@@ -5,203 +5,427 @@ from PyQt5.QtWidgets import QMessageBox, QProgressBar, QLabel, QPushButton, QSpa
 from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from bs4 import BeautifulSoup
 # Python standard library is PSF licenced
+import os
 import time
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from urllib import parse
 from datetime import datetime
+from instrumentation import span, instrumented
+from competency_store import pending_status
+import registrar_files
+
+comet_url = 'https://cometlms.medcast.com.au'
+
+# As far as I can tell, the IDs for the 8 modules
+status_ids = ['325', '326', '327', '332', '333', '328', '330', '329']
+
+
+@instrumented()
+def parse_dashboard_page(html: str):
+    """
+    Finds the link to the users profile on the COMET dashboard
+    :param html: HTML of the dashboard page
+    :return: The profile url and the COMET user id
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    tag = soup.find(lambda tag: tag.name == "a" and "Profile" in tag.text)
+    profile_url = tag['href']
+    user_id = parse.parse_qs(parse.urlparse(profile_url).query)['id'][0]
+    return profile_url, user_id
+
+
+@instrumented()
+def parse_profile_page(html: str):
+    """
+    Pulls the registrar name, program start date and program length off their profile page
+    :param html: HTML of the profile page
+    :return: Dictionary of profile data
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    name = soup.find("div", class_="page-header-headings").text
+    start_date = datetime.strptime(soup.find('dt', text='Program Start').parent.find('dd').text, "%d %B %Y")
+    end_date = datetime.strptime(soup.find('dt', text='Expected Program End Date').parent.find('dd').text,
+                                 "%d %B %Y")
+    program_length = round((end_date - start_date).days / 365)
+
+    return {'name': name, 'start_date': start_date, 'program_length': program_length}
+
+
+@instrumented()
+def parse_grade_report_page(html: str, comp_data: dict):
+    """
+    Parses the user grade report for one module, adding each competency and the module/category summaries found to
+    comp_data
+    :param html: HTML of the grade report page
+    :param comp_data: The dictionary being built up by GetDataFromCometThread, which is modified in place
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    table = soup.find_all("table")[0].find_all('tbody')[0]
+
+    comp_total = 0
+    for line in table.find_all('tr'):
+        line_txt: str = line.text.replace('<span class="sr-only">Assignment</span>', '').strip()
+        if line_txt.startswith('Assignment'):
+            url = line.find_all('a')[0]['href']
+            line_txt = line_txt.replace('Assignment', 'Assignment ', 1)
+            data = line_txt.split('Assignment')[1].split('\n')
+            comp = data[0].strip()
+            score = 0 if data[1] == '-' else float(data[1])
+            if len(data) > 2:
+                feedback = data[2]
+            else:
+                feedback = 'N/A'
+
+            comp_data['competencies'].append(
+                {'name': comp, 'score': score, 'feedback': feedback, 'url': url})
+        else:
+
+            if line_txt.startswith('Mean of grades'):
+                line_txt = line_txt.replace('Mean of grades', '')
+                data = line_txt.split('\n')
+                module = data[0].split('.')[0]
+                category = '.'.join(data[0].split('.')[0:2]).replace(' total', '')
+                score = 0 if data[1] == '-' else float(data[1])
+                comp_data['points']['modules'][module][category] = score
+            elif line_txt.startswith('Weighted mean of grades'):
+                line_txt = line_txt.replace('Weighted mean of grades', '').replace(
+                    '. Include empty grades.', '')
+                data = line_txt.split('\n')
+                category = data[0].replace('Competency ', '')
+                module = category.split('.')[0]
+                score = 0 if data[1] == '-' else float(data[1])
+                comp_data['points']['summary'][module][category] = score
+            elif line_txt.startswith('NaturalCourse'):
+                data = line_txt.split('\n')
+                score = 0 if data[1] == '-' else float(data[1])
+                comp_total += score
+
+
+def set_grade_date(competency: dict, grade_date):
+    """
+    Sets when a competency was graded, which also catches competencies signed off without evidence
+    :param competency: Competency dictionary with its last_modify_date already set, which is modified in place
+    :param grade_date: datetime, or None if it hasn't been graded
+    """
+    competency['grade_date'] = grade_date
+    if grade_date is not None and competency['last_modify_date'] is not None and grade_date < \
+            competency['last_modify_date']:
+        competency['last_modify_date'] = grade_date
+    if grade_date is not None and competency['last_modify_date'] is None:
+        competency['last_modify_date'] = grade_date
+        competency['submission_status'] = 'Submitted'
+
+
+def _date_string(date):
+    # The same format the dates are saved in the JSON
+    return date.strftime('%Y-%m-%d %H:%M:%S') if isinstance(date, datetime) else date
+
+
+def partial_profile(profile_data: dict):
+    """
+    :return: Copy of the profile data in the same format as the saved JSON, for showing while a sync is running
+    """
+    partial = dict(profile_data)
+    if 'start_date' in partial:
+        partial['start_date'] = _date_string(partial['start_date'])
+    return partial
+
+
+def partial_competency(competency: dict):
+    """
+    :return: Copy of a competency in the same format as the saved JSON, for showing while a sync is running. Details
+    that haven't been got yet are pending_status, with no dates
+    """
+    partial = {'submission_status': pending_status, 'grading_status': pending_status, 'last_modify_date': None,
+               'grade_date': None, 'assessor': None}
+    partial.update(competency)
+    partial['last_modify_date'] = _date_string(partial['last_modify_date'])
+    partial['grade_date'] = _date_string(partial['grade_date'])
+    return partial
+
+
+def page_key(url: str):
+    # The page without the site address, so competencies still match if COMET moves
+    parts = parse.urlsplit(url)
+    return parts.path, parts.query
+
+
+def fetch_priority(competency: dict, cached: dict = None):
+    """
+    How likely a competency's page is to have changed since the last sync, so the pages with news are got first
+    :param competency: Competency from the grade report, with its current score and feedback
+    :param cached: The same competency from the last sync, or None if it hasn't been got before
+    :return: Priority, lowest first, or None if the page doesn't need getting again
+    """
+    if cached is None or cached.get('submission_status') in (None, 'Invalid', pending_status):
+        return 0
+    if cached['submission_status'] == 'Submitted' and cached['grading_status'] != 'Graded':
+        return 0
+    if (competency['score'], competency['feedback']) != (cached['score'], cached['feedback']):
+        return 1
+    if cached['submission_status'] == 'Draft (not submitted)' or 0 < cached['score'] < 1:
+        return 2
+    # Signed off, and nothing's changed in the grade report since
+    if cached['score'] >= 1 and cached['grading_status'] == 'Graded':
+        return None
+    return 3
+
+
+def copy_cached_details(competency: dict, cached: dict):
+    # The details a competency page would have given, from the last sync
+    for key in ('submission_status', 'grading_status', 'assessor'):
+        competency[key] = cached.get(key)
+    for key in ('last_modify_date', 'grade_date'):
+        competency[key] = datetime.strptime(cached[key], '%Y-%m-%d %H:%M:%S') if cached.get(key) else None
+
+
+def partial_data(comp_data: dict):
+    """
+    :return: Copy of the data got so far, that the worker thread can keep adding to while it's shown
+    """
+    return {'profile_data': partial_profile(comp_data['profile_data']),
+            'competencies': [partial_competency(competency) for competency in comp_data['competencies']],
+            'points': {key: {module: dict(points) for module, points in value.items()}
+                       for key, value in comp_data['points'].items()}}
+
+
+@instrumented()
+def parse_competency_page(html: str, competency: dict):
+    """
+    Parses the assignment page of a single competency, adding the submission and grading details to competency
+    :param html: HTML of the assignment page
+    :param competency: The competency dictionary from parse_grade_report_page, which is modified in place
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # These competencies  text rather than a table for the description, need to manually change which index we use
+    try:
+        if competency['name'].startswith('6'):
+            table = soup.find_all("table")[0].find_all('tbody')[0]
+        else:
+            table = soup.find_all("table")[1].find_all('tbody')[0]
+
+        lines = table.find_all('tr')
+        if 'Attempt number' in str(lines[0]):
+            line_offset = 1
+        else:
+            line_offset = 0
+        submission_status = lines[0 + line_offset].text.strip().split('\n')[1]
+        grading_status = lines[1 + line_offset].text.strip().split('\n')[1]
+        time_str = lines[2 + line_offset].text.strip().split('\n')[1]
+        if time_str == '-':
+            last_modify_date = None
+        else:
+            last_modify_date = datetime.strptime(time_str, '%A, %d %B %Y, %I:%M %p')
+        competency['submission_status'] = submission_status
+        competency['grading_status'] = grading_status
+        competency['last_modify_date'] = last_modify_date
+    except:
+        competency['submission_status'] = 'Invalid'
+        competency['grading_status'] = 'Invalid'
+        competency['last_modify_date'] = None
+
+    try:
+        if competency['name'].startswith('6'):
+            table = soup.find_all("table")[1].find_all('tbody')[0]
+        else:
+            table = soup.find_all("table")[2].find_all('tbody')[0]
+
+        lines = table.find_all('tr')
+        # grade = float(lines[0].text.strip().split('\n')[1].split('/')[0].strip())
+        time_str = lines[1].text.strip().split('\n')[1]
+        if time_str == '-':
+            grade_date = None
+        else:
+            grade_date = datetime.strptime(time_str, '%A, %d %B %Y, %I:%M %p')
+        assessor = lines[2].text.strip().split('\n')[1]
+        set_grade_date(competency, grade_date)
+        competency['assessor'] = assessor
+    except:
+        competency['grade_date'] = None
+        competency['assessor'] = None
 
 
 class GetDataFromCometThread(QThread):
     """
     This class is a QThread derived thread for getting all the required data off COMET and parsing it.
-    There is a lot of HTML parsing done here to find the required data in the pages
+    There is a lot of HTML parsing done here to find the required data in the pages, see the parse_*_page functions.
+    The results are emitted as they are got (profile_loaded, then competencies_listed after each module's grade report,
+    then competency_loaded for each competency) so they can be shown before the sync is finished.
+
+    The base url, retry timings and the number of concurrent requests for the competency pages can be changed, which
+    is mostly useful for running against the offline mock server in the benchmarks folder.
+
+    If cache_location has the registrar's data from the last sync, the competency pages are got in order of
+    fetch_priority, and signed off competencies that haven't changed are kept from the last sync rather than got again
     """
 
-    def __init__(self, session: requests.Session, delay_between_requests=10):
+    def __init__(self, session: requests.Session, delay_between_requests=10, base_url=comet_url, retry_delay=30,
+                 retry_backoff=15, concurrent_requests=1, fetch_pool=None, cache_location=None):
         super(GetDataFromCometThread, self).__init__()
+        self.cache_location = cache_location
+        # Shared FetchPool, so the pages are fetched alongside (and coalesced with) the background sync
+        self.fetch_pool = fetch_pool
         self.session = session
         self.delay_between_requests = delay_between_requests
+        self.base_url = base_url
+        self.retry_delay = retry_delay
+        self.retry_backoff = retry_backoff
+        self.concurrent_requests = concurrent_requests
 
     def run(self):
         try:
-            # As far as I can tell, the IDs for the 8 modules
-            status_ids = ['325', '326', '327', '332', '333', '328', '330', '329']
-
             comp_data = {'competencies': [], 'profile_data': {},
                          'points': {'modules': defaultdict(dict), 'summary': defaultdict(dict)}}
 
-            self.items_to_process.emit(len(status_ids) + 2)  # The ids + overview + status
-            self.current_item.emit(1)
-            self.new_step.emit('Getting generic data (Step 1 of 2)')
+            with span('sync'):
+                self.get_generic_data(comp_data)
+                self.get_competency_data(comp_data)
 
-            overview_page = 'https://cometlms.medcast.com.au/totara/dashboard/index.php'
-
-            resp = self.try_and_get(overview_page)
-            soup = BeautifulSoup(resp.text, 'html.parser')
-            tag = soup.find(lambda tag: tag.name == "a" and "Profile" in tag.text)
-            profile_url = tag['href']
-            user_id = parse.parse_qs(parse.urlparse(profile_url).query)['id'][0]
+            self.finished.emit(comp_data)
+        except Exception as e:
+            self.finished.emit(None)
 
-            comp_data['profile_data']['user_id'] = user_id
+    @instrumented('sync step 1')
+    def get_generic_data(self, comp_data):
+        # Step 1 gets the profile data and the grade report for each module, which lists all the competencies
+        self.items_to_process.emit(len(status_ids) + 2)  # The ids + overview + status
+        self.current_item.emit(1)
+        self.new_step.emit('Getting generic data (Step 1 of 2)')
 
-            time.sleep(self.delay_between_requests)
-            self.current_item.emit(2)
-            resp = self.try_and_get(profile_url)
+        overview_page = f'{self.base_url}/totara/dashboard/index.php'
 
-            soup = BeautifulSoup(resp.text, 'html.parser')
+        resp = self.try_and_get(overview_page)
+        profile_url, user_id = parse_dashboard_page(resp.text)
 
-            name = soup.find("div", class_="page-header-headings").text
-            start_date = datetime.strptime(soup.find('dt', text='Program Start').parent.find('dd').text, "%d %B %Y")
-            end_date = datetime.strptime(soup.find('dt', text='Expected Program End Date').parent.find('dd').text,
-                                         "%d %B %Y")
-            program_length = round((end_date - start_date).days / 365)
+        comp_data['profile_data']['user_id'] = user_id
 
-            comp_data['profile_data']['name'] = name
-            comp_data['profile_data']['start_date'] = start_date
-            comp_data['profile_data']['program_length'] = program_length
+        time.sleep(self.delay_between_requests)
+        self.current_item.emit(2)
+        resp = self.try_and_get(profile_url)
 
-            time.sleep(self.delay_between_requests)
+        comp_data['profile_data'].update(parse_profile_page(resp.text))
+        self.profile_loaded.emit(partial_profile(comp_data['profile_data']))
 
-            for index, id in enumerate(status_ids):
-                url = f'https://cometlms.medcast.com.au/grade/report/user/index.php?id={id}&userid={user_id}'
-                resp = self.try_and_get(url)
-
-                soup = BeautifulSoup(resp.text, 'html.parser')
-
-                table = soup.find_all("table")[0].find_all('tbody')[0]
-
-                comp_total = 0
-                for line in table.find_all('tr'):
-                    line_txt: str = line.text.replace('<span class="sr-only">Assignment</span>', '').strip()
-                    if line_txt.startswith('Assignment'):
-                        url = line.find_all('a')[0]['href']
-                        line_txt = line_txt.replace('Assignment', 'Assignment ', 1)
-                        data = line_txt.split('Assignment')[1].split('\n')
-                        comp = data[0].strip()
-                        score = 0 if data[1] == '-' else float(data[1])
-                        if len(data) > 2:
-                            feedback = data[2]
-                        else:
-                            feedback = 'N/A'
-
-                        comp_data['competencies'].append(
-                            {'name': comp, 'score': score, 'feedback': feedback, 'url': url})
-                    else:
+        time.sleep(self.delay_between_requests)
 
-                        if line_txt.startswith('Mean of grades'):
-                            line_txt = line_txt.replace('Mean of grades', '')
-                            data = line_txt.split('\n')
-                            module = data[0].split('.')[0]
-                            category = '.'.join(data[0].split('.')[0:2]).replace(' total', '')
-                            score = 0 if data[1] == '-' else float(data[1])
-                            comp_data['points']['modules'][module][category] = score
-                        elif line_txt.startswith('Weighted mean of grades'):
-                            line_txt = line_txt.replace('Weighted mean of grades', '').replace(
-                                '. Include empty grades.', '')
-                            data = line_txt.split('\n')
-                            category = data[0].replace('Competency ', '')
-                            module = category.split('.')[0]
-                            score = 0 if data[1] == '-' else float(data[1])
-                            comp_data['points']['summary'][module][category] = score
-                        elif line_txt.startswith('NaturalCourse'):
-                            data = line_txt.split('\n')
-                            score = 0 if data[1] == '-' else float(data[1])
-                            comp_total += score
-
-                self.current_item.emit(index + 3)
-
-                # We don't want to sleep if we are done
-                if index + 1 != len(status_ids):
-                    time.sleep(self.delay_between_requests)
+        for index, id in enumerate(status_ids):
+            url = f'{self.base_url}/grade/report/user/index.php?id={id}&userid={user_id}'
+            resp = self.try_and_get(url)
 
-            self.items_to_process.emit(len(comp_data['competencies']))
-            self.current_item.emit(0)
-            self.new_step.emit('Getting specific competency data (Step 2 of 2)')
+            parse_grade_report_page(resp.text, comp_data)
+            self.competencies_listed.emit(partial_data(comp_data))
 
-            for index, competency in enumerate(comp_data['competencies']):
-                specific_comp_page = competency['url']
-                response = self.try_and_get(specific_comp_page)
+            self.current_item.emit(index + 3)
 
-                soup = BeautifulSoup(response.text, 'html.parser')
+            # We don't want to sleep if we are done
+            if index + 1 != len(status_ids):
+                time.sleep(self.delay_between_requests)
 
-                # These competencies  text rather than a table for the description, need to manually change which index we use
-                try:
-                    if competency['name'].startswith('6'):
-                        table = soup.find_all("table")[0].find_all('tbody')[0]
-                    else:
-                        table = soup.find_all("table")[1].find_all('tbody')[0]
+    def cached_competencies(self, user_id):
+        """
+        :return: The registrar's competencies from the last sync by page_key, empty if there isn't a readable one
+        """
+        if self.cache_location is None:
+            return {}
+        try:
+            data = registrar_files.load(os.path.join(self.cache_location, f'{user_id}.json'))
+            return {page_key(competency['url']): competency for competency in data['competencies']}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {}
+
+    def fetch_order(self, comp_data):
+        """
+        :return: Indexes of the competencies to get, in the order to get them, and the indexes of those not needing it
+        """
+        cached = self.cached_competencies(comp_data['profile_data']['user_id'])
+        priorities = {}
+        unchanged = []
+        for index, competency in enumerate(comp_data['competencies']):
+            priority = fetch_priority(competency, cached.get(page_key(competency['url'])))
+            if priority is None:
+                copy_cached_details(competency, cached[page_key(competency['url'])])
+                unchanged.append(index)
+            else:
+                priorities[index] = priority
+        # sorted is stable, so each priority stays in the order COMET lists them
+        return sorted(priorities, key=priorities.get), unchanged
+
+    @instrumented('sync step 2')
+    def get_competency_data(self, comp_data):
+        # Step 2 gets the submission and grading details off the page for each competency, the ones most likely to have
+        # changed first
+        order, unchanged = self.fetch_order(comp_data)
+        for index in unchanged:
+            self.competency_loaded.emit(index, partial_competency(comp_data['competencies'][index]))
+
+        self.items_to_process.emit(len(order))
+        self.current_item.emit(0)
+        if len(unchanged) > 0:
+            self.new_step.emit(f'Getting specific competency data (Step 2 of 2), {len(unchanged)} signed off '
+                               f'competencies unchanged since the last sync')
+        else:
+            self.new_step.emit('Getting specific competency data (Step 2 of 2)')
 
-                    lines = table.find_all('tr')
-                    if 'Attempt number' in str(lines[0]):
-                        line_offset = 1
-                    else:
-                        line_offset = 0
-                    submission_status = lines[0 + line_offset].text.strip().split('\n')[1]
-                    grading_status = lines[1 + line_offset].text.strip().split('\n')[1]
-                    time_str = lines[2 + line_offset].text.strip().split('\n')[1]
-                    if time_str == '-':
-                        last_modify_date = None
-                    else:
-                        last_modify_date = datetime.strptime(time_str, '%A, %d %B %Y, %I:%M %p')
-                    competency['submission_status'] = submission_status
-                    competency['grading_status'] = grading_status
-                    competency['last_modify_date'] = last_modify_date
-                except:
-                    competency['submission_status'] = 'Invalid'
-                    competency['grading_status'] = 'Invalid'
-                    competency['last_modify_date'] = None
-
-                try:
-                    if competency['name'].startswith('6'):
-                        table = soup.find_all("table")[1].find_all('tbody')[0]
-                    else:
-                        table = soup.find_all("table")[2].find_all('tbody')[0]
+        if self.concurrent_requests > 1:
+            self.get_competency_pages_concurrently(comp_data['competencies'], order)
+        else:
+            for number, index in enumerate(order):
+                competency = comp_data['competencies'][index]
+                response = self.try_and_get(competency['url'])
+                parse_competency_page(response.text, competency)
+                self.competency_loaded.emit(index, partial_competency(competency))
 
-                    lines = table.find_all('tr')
-                    # grade = float(lines[0].text.strip().split('\n')[1].split('/')[0].strip())
-                    time_str = lines[1].text.strip().split('\n')[1]
-                    if time_str == '-':
-                        grade_date = None
-                    else:
-                        grade_date = datetime.strptime(time_str, '%A, %d %B %Y, %I:%M %p')
-                    assessor = lines[2].text.strip().split('\n')[1]
-                    competency['grade_date'] = grade_date
-
-                    # Catch competencies signed off without evidence
-                    if grade_date is not None and competency['last_modify_date'] is not None and grade_date < \
-                            competency['last_modify_date']:
-                        competency['last_modify_date'] = grade_date
-                    if grade_date is not None and competency['last_modify_date'] is None:
-                        competency['last_modify_date'] = grade_date
-                        competency['submission_status'] = 'Submitted'
-
-                    competency['assessor'] = assessor
-                except:
-                    competency['grade_date'] = None
-                    competency['assessor'] = None
-
-                if index + 1 != len(comp_data['competencies']):
+                if number + 1 != len(order):
                     time.sleep(self.delay_between_requests)
 
-                self.current_item.emit(index + 1)
+                self.current_item.emit(number + 1)
+
+    def get_competency_pages_concurrently(self, competencies, order):
+        # Each worker still waits delay_between_requests between its own requests, so the total request rate is
+        # roughly concurrent_requests times higher than the sequential version
+        lock = threading.Lock()
+        completed = [0]
+
+        def get_competency(index, competency):
+            response = self.try_and_get(competency['url'])
+            parse_competency_page(response.text, competency)
+            self.competency_loaded.emit(index, partial_competency(competency))
+            with lock:
+                completed[0] += 1
+                self.current_item.emit(completed[0])
+            time.sleep(self.delay_between_requests)
 
-            self.finished.emit(comp_data)
-        except Exception as e:
-            self.finished.emit(None)
+        with ThreadPoolExecutor(max_workers=self.concurrent_requests) as executor:
+            # list() makes sure any exception raised in a worker is raised here too
+            list(executor.map(get_competency, order, [competencies[index] for index in order]))
 
-    def try_and_get(self, url, retry_delay=30):
+    def try_and_get(self, url, retry_delay=None, data=None):
+        # Posts data (e.g. web service parameters) if it's given, so it isn't shown in the url
+        if retry_delay is None:
+            retry_delay = self.retry_delay
         current_attempt_number = 0
         self.current_url.emit(url)
         while True:
             try:
-                result = self.session.get(url)
+                with span('try_and_get', url=url, attempt=current_attempt_number):
+                    if data is not None:
+                        result = self.session.post(url, data=data)
+                    elif self.fetch_pool is not None:
+                        result = self.fetch_pool.get(self.session, url).result()
+                    else:
+                        result = self.session.get(url)
                 if result.status_code == 200:
                     self.new_status.emit('')
                     return result
                 else:
                     raise Exception(f'code {result.status_code}, reason {result.reason}')
             except Exception as e:
-                new_delay = min(retry_delay + current_attempt_number * 15, 300)
+                new_delay = min(retry_delay + current_attempt_number * self.retry_backoff, 300)
                 self.new_status.emit(
                     f'There was an issue with the request, waiting {new_delay} seconds and retrying. Error {str(e)}')
                 time.sleep(new_delay)
@@ -213,10 +437,20 @@ class GetDataFromCometThread(QThread):
     current_item = pyqtSignal(int, name='current_item')
     finished = pyqtSignal(object, name='finished')
     current_url = pyqtSignal(str, name='current_url')
+    profile_loaded = pyqtSignal(object, name='profile_loaded')
+    competencies_listed = pyqtSignal(object, name='competencies_listed')
+    competency_loaded = pyqtSignal(int, object, name='competency_loaded')
 
 
 class GetDataFromCometWindow(QtWidgets.QDialog):
-    def __init__(self, session: requests.Session, parent=None):
+    """
+    Shows the progress of a sync. It isn't modal, so the main window can show the data as it comes in, which the worker
+    thread's profile_loaded, competencies_listed and competency_loaded signals are passed on through. accepted is
+    emitted once all the data has been got
+    """
+
+    def __init__(self, session: requests.Session, parent=None, worker_thread: GetDataFromCometThread = None,
+                 fetch_pool=None, cache_location=None):
         super(GetDataFromCometWindow, self).__init__(parent)
         self.progressBar = QProgressBar()
         self.progressBar.setFormat(' %v/%m (%p%)')
@@ -241,16 +475,20 @@ class GetDataFromCometWindow(QtWidgets.QDialog):
 
         self.resize(450, 150)
 
-        self.setModal(True)
         self.show()
 
-        self.workerThread = GetDataFromCometThread(session)
+        # e.g. a CometWebServiceThread, otherwise the pages are scraped
+        self.workerThread = worker_thread if worker_thread is not None else \
+            GetDataFromCometThread(session, fetch_pool=fetch_pool, cache_location=cache_location)
         self.workerThread.items_to_process.connect(lambda num_of_items: self.progressBar.setMaximum(num_of_items))
         self.workerThread.new_step.connect(lambda new_step: self.labelStep.setText(new_step))
         self.workerThread.current_item.connect(lambda item: self.progressBar.setValue(item))
         self.workerThread.new_status.connect(lambda new_status: self.labelStatus.setText(new_status))
         self.workerThread.current_url.connect(
             lambda new_url: self.labelUrl.setText(f'Getting data from <a href="{new_url}">{new_url}</a>'))
+        self.workerThread.profile_loaded.connect(self.profile_loaded)
+        self.workerThread.competencies_listed.connect(self.competencies_listed)
+        self.workerThread.competency_loaded.connect(self.competency_loaded)
         self.workerThread.start()
         self.workerThread.finished.connect(self.handle_finished)
 
@@ -264,3 +502,16 @@ class GetDataFromCometWindow(QtWidgets.QDialog):
             return
         self.competency_data = competency_data
         self.accept()
+
+    def reject(self):
+        # The thread is left to finish on its own, but nothing it gets is wanted now
+        for signal, slot in ((self.workerThread.finished, self.handle_finished),
+                             (self.workerThread.profile_loaded, self.profile_loaded),
+                             (self.workerThread.competencies_listed, self.competencies_listed),
+                             (self.workerThread.competency_loaded, self.competency_loaded)):
+            signal.disconnect(slot)
+        super(GetDataFromCometWindow, self).reject()
+
+    profile_loaded = pyqtSignal(object)
+    competencies_listed = pyqtSignal(object)
+    competency_loaded = pyqtSignal(int, object)
@@ -4,26 +4,43 @@ import enum
 import json
 import os
 import glob
+import multiprocessing
 import re
+import threading
 from pathlib import Path
-from mpldatacursor import datacursor
 
 from PyQt5.QtWidgets import QHeaderView, QAbstractItemView, QMessageBox, QMainWindow, QApplication, QDialog, \
-    QVBoxLayout, QLineEdit, QPushButton, QLabel, QTextEdit, QFileDialog, QComboBox
+    QVBoxLayout, QLineEdit, QPushButton, QLabel, QTextEdit, QFileDialog, QComboBox, QTableWidget, QDateEdit, \
+    QCheckBox, QDoubleSpinBox
 from PyQt5.QtGui import QStandardItemModel, QStandardItem
-from PyQt5.QtCore import QDate, QSortFilterProxyModel, QSettings
+from PyQt5.QtCore import QDate, QSortFilterProxyModel, QSettings, Qt, QTimer, pyqtSignal
 
 import pandas as pd
-import numpy as np
 import pypac
 import requests
-from openpyxl import load_workbook
 from requests.auth import HTTPProxyAuth
-from datetime import datetime, timedelta
+from datetime import datetime
 from pandas.plotting import register_matplotlib_converters
-from matplotlib.patches import Rectangle
-from teap_data import teap_required_points, teap_weights, teap_categories, spreadsheet_cells
+import tracking_data
+import forecasting
+import plots
+from analytics import AnalyticsWorker
+from figure_cache import FigureCache, figure_key
+from hover_annotation import HoverAnnotation
+from program_calendar import ProgramCalendar
+import spreadsheet_export
+import gradebook_import
 from GetDataFromComet import GetDataFromCometWindow
+from session_store import SessionStore
+from fetch_pool import FetchPool
+from sync_scheduler import SyncScheduler
+from sync_history import SyncHistory
+import snapshot_diff
+import registrar_files
+from registrar_watcher import RegistrarWatcher
+from comet_webservice import CometWebServiceThread
+import instrumentation
+from instrumentation import span, instrumented
 from ui.teap_report_main import Ui_MainWindow
 
 plt.rcParams["hatch.linewidth"] = 2
@@ -42,24 +59,17 @@ class competency_columns(enum.Enum):
     grading_status = 4
 
 
-competency_reference_data = {
-    '1': {'complete_colour': '#948a54', 'incomplete_colour': '#eeece1', 'total_points': 15},
-    '2': {'complete_colour': '#f79646', 'incomplete_colour': '#fde9d9', 'total_points': 50},
-    '3': {'complete_colour': '#4bacc6', 'incomplete_colour': '#daeef3', 'total_points': 80},
-    '4': {'complete_colour': '#76923c', 'incomplete_colour': '#eaf1dd', 'total_points': 100},
-    '5': {'complete_colour': '#8064a2', 'incomplete_colour': '#e5dfec', 'total_points': 80},
-    '6': {'complete_colour': '#c0504d', 'incomplete_colour': '#f2dbdb', 'total_points': 35},
-    '7': {'complete_colour': '#4f81bd', 'incomplete_colour': '#dbe5f1', 'total_points': 15},
-    '8': {'complete_colour': '#f6dd4e', 'incomplete_colour': '#ffffcc', 'total_points': 25}
-}
-
 cache_location = 'cached_data'
+session_filepath = 'session.dat'
+history_filepath = 'sync_history.db'
 
 
 class MainWindow(QMainWindow):
     """
     Main window for the application, this houses most of the logic and visible components
     """
+    # User id of a registrar the background sync updated, emitted from the fetch pool's threads
+    registrar_synced = pyqtSignal(str)
 
     def __init__(self):
         super(MainWindow, self).__init__()
@@ -73,6 +83,17 @@ class MainWindow(QMainWindow):
         system_location = os.path.dirname(os.path.abspath(sys.argv[0]))
         QSettings.setPath(QSettings.IniFormat, QSettings.SystemScope, system_location)
         self.settings = QSettings("settings.ini", QSettings.IniFormat)
+        # Logged in COMET sessions, so the login is only done again once COMET expires them
+        self.session_store = SessionStore(session_filepath, session_factory=pypac.PACSession)
+        # All requests to COMET, from syncs and the background sync, go through the same pool
+        self.fetch_pool = FetchPool()
+        self.sync_history = SyncHistory(history_filepath)
+        self.sync_scheduler = SyncScheduler(cache_location, self.fetch_pool, self.session_store, self.saved_logins(),
+                                            on_updated=self.registrar_synced.emit, history=self.sync_history)
+        self.sync_tick_thread = None
+        self.sync_timer = QTimer(self)
+        self.sync_timer.timeout.connect(self.tick_sync_scheduler)
+        self.registrar_synced.connect(self.handle_registrar_synced)
 
         show_plan_in_tracking_plot = self.settings.value('Appearance/show_plan_in_tracking_plot', type=bool)
         if show_plan_in_tracking_plot:
@@ -87,6 +108,26 @@ class MainWindow(QMainWindow):
         if months_to_extrapolate_in_tracking_plot:
             self.ui.spinBoxMonthsToExtrapolate.setValue(months_to_extrapolate_in_tracking_plot)
 
+        extrapolation_model = self.settings.value('Extrapolation/model', type=int)
+        if extrapolation_model:
+            self.ui.comboBoxExtrapolationModel.setCurrentIndex(extrapolation_model)
+
+        # Profiling can also be turned on with the TEAPTRACKER_PROFILE environment variable
+        if self.settings.value('Diagnostics/enable_profiling', type=bool):
+            instrumentation.enable(True)
+        self.ui.checkBoxEnableProfiling.setChecked(instrumentation.is_enabled())
+        self.ui.checkBoxWarmFigureCache.setChecked(self.settings.value('Performance/warm_figure_cache', type=bool))
+        self.ui.checkBoxBackgroundSync.setChecked(self.settings.value('Sync/background_sync', type=bool))
+        self.ui.spinBoxSyncRequestsPerHour.setValue(self.settings.value('Sync/requests_per_hour', 60, type=int))
+
+        self.diagnostics_model = QStandardItemModel()
+        self.diagnostics_model.setHorizontalHeaderLabels(['Span', 'Count', 'Total (ms)', 'Mean (ms)', 'Max (ms)'])
+        self.ui.tableViewDiagnostics.setModel(self.diagnostics_model)
+        self.ui.tableViewDiagnostics.setSortingEnabled(True)
+        self.ui.tableViewDiagnostics.verticalHeader().setVisible(False)
+        for col in range(self.diagnostics_model.columnCount()):
+            self.ui.tableViewDiagnostics.horizontalHeader().setSectionResizeMode(col, QHeaderView.Stretch)
+
         self.assessed_competency_model = QStandardItemModel()
         self.assessed_competency_model.setHorizontalHeaderLabels(column_headers)
         self.assessed_competency_proxy_model = MultiColumnProxyModel()
@@ -105,7 +146,8 @@ class MainWindow(QMainWindow):
         for col in range(self.assessed_competency_model.columnCount()):
             self.ui.tableViewModules.horizontalHeader().setSectionResizeMode(col, QHeaderView.Stretch)
 
-        self.ui.comboBoxTEAPLength.addItems(['3', '4', '5'])
+        # Any length works with the expected points curve, e.g. part time programs, see expected_curve.py
+        self.ui.comboBoxTEAPLength.addItems(['3', '3.5', '4', '4.5', '5', '5.5', '6', '7', '8'])
 
         # Setup the competency info model. This contains the data from the CTG
         comp_info = pd.read_csv('TEAPCTGData.csv')
@@ -130,22 +172,38 @@ class MainWindow(QMainWindow):
         for col in range(self.competency_info_data_model.columnCount()):
             self.ui.tableViewCategoryOverview.horizontalHeader().setSectionResizeMode(col, QHeaderView.Stretch)
 
-        for cat in teap_weights:
-            if len(cat) != 1:
-                teap_weights[cat] = teap_weights[cat] * competency_reference_data[cat[0]]['total_points'] / \
-                                    teap_weights[cat[0]]
-
         self.data = None
+        # The views draw from the newest snapshot the analytics worker has finished, see analytics.py
+        self.snapshot = None
         self.tracking_df = None
+        self.competency_store = None
+        self.progress_series = None
+        self.program_calendar = ProgramCalendar()
+        self.analytics_worker = AnalyticsWorker(self)
+        self.figure_cache = FigureCache()
+        self.analytics_worker.snapshot_ready.connect(self.apply_snapshot)
+        self.analytics_worker.failed.connect(self.analytics_failed)
         self.getCometDataWindow = None
-        self.datacursor = None
+        # While a sync is running its data is shown as it comes in, see start_comet_sync
+        self.sync_data = None
+        self.data_before_sync = None
+        # What changed in the shown registrar, shown in the status bar once the views have updated
+        self.changes_message = None
+        # Refreshing the snapshot is a full recompute, so it's only done once the competency updates slow down
+        self.sync_refresh_timer = QTimer(self)
+        self.sync_refresh_timer.setSingleShot(True)
+        self.sync_refresh_timer.setInterval(3000)
+        self.sync_refresh_timer.timeout.connect(self.refresh_sync_snapshot)
         self.loaded_data = {}
-        self.category_overview_rectangles = []
+        self.category_overview_grid = plots.CompetencyGrid()
+        self.category_overview_hover = HoverAnnotation(self.ui.MplWidgetCategoryOverview.canvas,
+                                                       self.format_category_overview_note)
         self.training_plan = {'competencies': [], 'notes': {}}
 
         self.ui.splitterCategoryOverview.setSizes((1, 1))
 
         self.ui.pushButtonLoadPreviousData.clicked.connect(self.get_new_data_from_comet)
+        self.ui.pushButtonGetDataWithToken.clicked.connect(self.get_new_data_from_comet_webservice)
         self.ui.checkBoxOverviewPlotRelative.clicked.connect(self.update_overview_plot)
         self.ui.tableViewModules.selectionModel().selectionChanged.connect(self.competency_table_view_selection_changed)
         self.ui.comboBoxTEAPLength.currentTextChanged.connect(self.update_tracking_plot)
@@ -158,21 +216,29 @@ class MainWindow(QMainWindow):
         self.ui.checkBoxShowPlan.clicked.connect(lambda: self.update_tracking_plot())
         self.ui.checkBoxShowExtrapolation.clicked.connect(lambda: self.update_tracking_plot())
         self.ui.spinBoxMonthsToExtrapolate.valueChanged.connect(lambda: self.update_tracking_plot())
+        self.ui.comboBoxExtrapolationModel.currentIndexChanged.connect(lambda: self.update_tracking_plot())
         self.ui.checkBoxShowPlan.clicked.connect(lambda: self.settings.setValue('Appearance/show_plan_in_tracking_plot',
                                                                                 self.ui.checkBoxShowPlan.isChecked()))
         self.ui.checkBoxShowExtrapolation.clicked.connect(lambda: self.save_extrapolation_settings())
         self.ui.spinBoxMonthsToExtrapolate.valueChanged.connect(lambda: self.save_extrapolation_settings())
+        self.ui.comboBoxExtrapolationModel.currentIndexChanged.connect(lambda: self.save_extrapolation_settings())
 
         self.show()
 
+        # Started first, so nothing changed while the files are read is missed
+        self.registrar_watcher = RegistrarWatcher(cache_location, self)
+        self.registrar_watcher.added.connect(self.handle_registrar_file_changed)
+        self.registrar_watcher.changed.connect(self.handle_registrar_file_changed)
+        self.registrar_watcher.removed.connect(self.handle_registrar_file_removed)
         self.search_for_cached_data()
         # If there isn't any cached data, pop up a dialog to help the user download their data
         if self.ui.comboBoxCachedData.count() == 0:
-            download_dialog = InitialDownloadDialog()
+            download_dialog = InitialDownloadDialog(session_store=self.session_store)
             if download_dialog.exec() == QDialog.Accepted:
-                self.getCometDataWindow = GetDataFromCometWindow(session=download_dialog.session)
-                if self.getCometDataWindow.exec():
-                    self.handle_new_data_from_gui()
+                self.start_comet_sync(GetDataFromCometWindow(session=download_dialog.session,
+                                                             fetch_pool=self.fetch_pool,
+                                                             cache_location=cache_location),
+                                      download_dialog.lineEditUsername.text())
             else:
                 pass
         # If there is only one cached file, load it
@@ -182,16 +248,9 @@ class MainWindow(QMainWindow):
             self.load_data_from_filepath(self.ui.comboBoxCachedData.currentData())
         # If there is more than 1, show a dialog to allow the user to choose
         elif self.ui.comboBoxCachedData.count() > 1:
-            json_files = glob.glob(f'{cache_location}/*.json')
-            registrar_list = {}
-            for file in json_files:
-                try:
-                    with open(file, 'r') as f:
-                        data = json.load(f)
-                        user_name = data['profile_data']['name']
-                        registrar_list[user_name] = file
-                except:
-                    pass
+            # The cached files have just been read by search_for_cached_data
+            registrar_list = {self.ui.comboBoxCachedData.itemText(index): self.ui.comboBoxCachedData.itemData(index)
+                              for index in range(self.ui.comboBoxCachedData.count())}
             load_registrar_dialog = LoadDataDialog(registrar_list=registrar_list)
             if load_registrar_dialog.exec() == QDialog.Accepted:
                 self.load_data_from_filepath(load_registrar_dialog.load_filepath)
@@ -203,6 +262,7 @@ class MainWindow(QMainWindow):
         self.ui.comboBoxSubmissionFilter.currentTextChanged.connect(self.update_score_filters)
 
         self.ui.comboBoxTEAPLength.currentTextChanged.connect(self.save_teap_settings)
+        self.ui.pushButtonProgramCalendar.clicked.connect(self.edit_program_calendar)
         self.ui.dateEditProgramStart.dateChanged.connect(self.save_teap_settings)
 
         self.ui.MplWidgetCategoryOverview.canvas.mpl_connect('motion_notify_event', self.update_category_sidepane)
@@ -211,22 +271,69 @@ class MainWindow(QMainWindow):
         self.ui.dateEditPlanEnd.dateChanged.connect(lambda: self.updated_plan_dates())
 
         self.ui.actionExport_official_spreadsheet.triggered.connect(self.export_official_spreadsheet)
-
+        self.ui.actionExport_all_official_spreadsheets.triggered.connect(self.export_all_official_spreadsheets)
+        self.ui.actionImport_gradebook_exports.triggered.connect(self.import_gradebook_exports)
+        self.ui.actionForget_saved_login.triggered.connect(self.forget_saved_login)
+
+        self.ui.checkBoxEnableProfiling.clicked.connect(self.set_profiling_enabled)
+        self.ui.checkBoxWarmFigureCache.clicked.connect(self.set_warm_figure_cache)
+        self.ui.checkBoxBackgroundSync.clicked.connect(self.set_background_sync)
+        self.ui.spinBoxSyncRequestsPerHour.valueChanged.connect(self.set_background_sync)
+        self.ui.pushButtonRefreshDiagnostics.clicked.connect(self.update_diagnostics)
+        self.ui.pushButtonClearDiagnostics.clicked.connect(self.clear_diagnostics)
+        self.ui.pushButtonExportDiagnostics.clicked.connect(self.export_diagnostics)
+        self.ui.tabWidgetMain.currentChanged.connect(lambda: self.update_diagnostics())
+
+        self.warm_figure_cache()
+        self.apply_background_sync()
+
+
+    def set_profiling_enabled(self, enabled):
+        instrumentation.enable(enabled)
+        self.settings.setValue('Diagnostics/enable_profiling', enabled)
+
+    def update_diagnostics(self):
+        # Shows a summary of the recorded timings in the diagnostics panel on the Misc tab
+        self.diagnostics_model.setRowCount(0)
+        for summary in instrumentation.summarise():
+            new_row = [QStandardItem(summary['name'])]
+            for key in ('count', 'total', 'mean', 'max'):
+                item = QStandardItem()
+                # Store the numbers as data rather than text so they sort numerically
+                item.setData(summary[key] if key == 'count' else round(summary[key] * 1000, 2), Qt.DisplayRole)
+                new_row.append(item)
+            self.diagnostics_model.appendRow(new_row)
+
+    def clear_diagnostics(self):
+        instrumentation.clear()
+        self.update_diagnostics()
+
+    def export_diagnostics(self):
+        filepath, file_filter = QFileDialog.getSaveFileName(self, 'Export timings', 'teaptracker_trace.json',
+                                                            'Chrome trace (*.json);;JSON summary (*.json)')
+        if filepath != '':
+            if not filepath.endswith('.json'):
+                filepath += '.json'
+            if file_filter.startswith('Chrome trace'):
+                instrumentation.export_chrome_trace(filepath)
+            else:
+                instrumentation.export_json(filepath)
 
     def load_data_from_filepath(self,filepath : str):
         if filepath is not None:
-            with open(filepath, 'r') as f:
-                self.data = json.load(f)
-                if 'training_plan' in self.data:
-                    self.training_plan = self.data['training_plan']
-                    if not 'notes' in self.training_plan:
-                        self.training_plan['notes'] = {}
-                self.new_data_loaded()
+            with span('json.load', filepath=filepath):
+                self.data = registrar_files.load(filepath)
+            if 'training_plan' in self.data:
+                self.training_plan = self.data['training_plan']
+                if not 'notes' in self.training_plan:
+                    self.training_plan['notes'] = {}
+            self.new_data_loaded()
 
     def save_extrapolation_settings(self):
         self.settings.setValue('Appearance/show_extrapolation_in_tracking_plot',
                                self.ui.checkBoxShowExtrapolation.isChecked())
         self.settings.setValue('Extrapolation/months_to_extrapolate', self.ui.spinBoxMonthsToExtrapolate.value())
+        self.settings.setValue('Extrapolation/model', self.ui.comboBoxExtrapolationModel.currentIndex())
 
     def updated_plan_dates(self):
         qdate_start = self.ui.dateEditPlanStart.date()
@@ -245,13 +352,16 @@ class MainWindow(QMainWindow):
         return final_text[1:]  # Return whole string but the first newline
 
     def update_category_sidepane(self, event):
-        for rec in self.category_overview_rectangles:
-            if rec.contains(event)[0]:
+        if event.inaxes is self.ui.MplWidgetCategoryOverview.canvas.ax:
+            rec = self.category_overview_grid.hit(event.xdata, event.ydata)
+            # Only refilter when the mouse moves onto a different competency
+            if rec is not None and rec.get_label() != self.competency_info_proxy_model.filterRegExp().pattern():
                 self.competency_info_proxy_model.setFilterRegExp(rec.get_label())
 
     def update_category_plan(self, event):
-        for rec in self.category_overview_rectangles:
-            if rec.contains(event)[0]:
+        if event.inaxes is self.ui.MplWidgetCategoryOverview.canvas.ax:
+            rec = self.category_overview_grid.hit(event.xdata, event.ydata)
+            if rec is not None:
                 if event.button == 1:  # Left click
                     self._set_rect_selected(rec)
                 if event.button == 2:
@@ -275,13 +385,7 @@ class MainWindow(QMainWindow):
         self.save_data()
 
     def _set_rect_selected(self, rec):
-        # A bit hacky, but works. This stores the old edge color back as a property on the rectangle, so if we unselect
-        # it we know what to change it back to this. This method is not ideal, as the old_edgecolor property is made up
-        # by me, and not a standard property of te rectangle
-        rec.old_edgecolor = rec.get_edgecolor()
-        rec.set_edgecolor('Blue')
-        rec.set_linewidth(3.5)
-        rec.set_zorder(1000)
+        plots.select_rectangle(rec)
 
         competency = rec.get_label()
         if competency not in self.training_plan['competencies']:
@@ -298,26 +402,71 @@ class MainWindow(QMainWindow):
             if competency in self.training_plan['competencies']:
                 self.training_plan['competencies'].remove(competency)
 
+    @instrumented()
     def search_for_cached_data(self):
         json_files = glob.glob(f'{cache_location}/*.json')
         for file in json_files:
-            try:
-                with open(file, 'r') as f:
-                    data = json.load(f)
-                    user_name = data['profile_data']['name']
-                    user_id = Path(file).stem
-                    self.loaded_data[user_id] = self.generate_tracking_data(data)
-                self.ui.comboBoxCachedData.addItem(user_name, file)
-
-            except Exception:
-                pass
+            self.add_cached_record(file)
+
+    def add_cached_record(self, filepath: str):
+        """
+        Reads a registrar file into loaded_data and the cached data combo box, replacing what was there for it
+        :return: The data, or None if the file couldn't be read
+        """
+        try:
+            data = registrar_files.load(filepath)
+            user_name = data['profile_data']['name']
+            self.loaded_data[Path(filepath).stem] = self.generate_tracking_data(data)
+        except Exception:
+            return None
+        index = self.cached_data_index(filepath)
+        if index == -1:
+            self.ui.comboBoxCachedData.addItem(user_name, filepath)
+        else:
+            self.ui.comboBoxCachedData.setItemText(index, user_name)
+        return data
+
+    def cached_data_index(self, filepath: str):
+        for index in range(self.ui.comboBoxCachedData.count()):
+            if os.path.normpath(self.ui.comboBoxCachedData.itemData(index)) == os.path.normpath(filepath):
+                return index
+        return -1
+
+    def shown_filepath(self):
+        # The file of the registrar being shown, or None if it's not saved yet (e.g. during their first sync)
+        if self.data is None or self.data is self.sync_data:
+            return None
+        return f"{cache_location}/{self.data['profile_data']['user_id']}.json"
+
+    def handle_registrar_file_changed(self, filepath: str):
+        # Added or changed by something else, e.g. another copy of the program, the background sync or a script
+        data = self.add_cached_record(filepath)
+        shown_filepath = self.shown_filepath()
+        if data is None or shown_filepath is None or os.path.normpath(shown_filepath) != os.path.normpath(filepath):
+            return
+        # Saving the data shown also changes the file, which doesn't need loading again
+        if json.dumps(data, sort_keys=True, default=str) != json.dumps(self.data, sort_keys=True, default=str):
+            changes = snapshot_diff.diff_data(self.data, data)
+            self.load_data_from_filepath(filepath)
+            if len(changes) > 0:
+                self.changes_message = f'Updated: {snapshot_diff.summarise(changes)}'
+
+    def handle_registrar_file_removed(self, filepath: str):
+        index = self.cached_data_index(filepath)
+        if index != -1:
+            self.ui.comboBoxCachedData.removeItem(index)
+        self.loaded_data.pop(Path(filepath).stem, None)
+        shown_filepath = self.shown_filepath()
+        if shown_filepath is not None and os.path.normpath(shown_filepath) == os.path.normpath(filepath):
+            # It's still shown, and is saved again if it's changed
+            self.ui.statusbar.showMessage("This registrar's saved data has been removed by another program")
 
     def load_cached_data(self):
         filepath = self.ui.comboBoxCachedData.currentData()
         if filepath is not None:
-            with open(filepath, 'r') as f:
-                self.data = json.load(f)
-                self.new_data_loaded()
+            self.changes_message = None
+            self.data = registrar_files.load(filepath)
+            self.new_data_loaded()
 
     def update_score_filters(self):
         self.assessed_competency_proxy_model.set_grading_status_filter(self.ui.comboBoxGradingFilter.currentText())
@@ -333,38 +482,84 @@ class MainWindow(QMainWindow):
         else:
             self.ui.textEditCompetencyFeedback.setText('')
 
+    @instrumented()
     def update_models_from_data(self):
         # Goes through self.data and populates the assessed_competency_model with rows
         # Each row is a competency
         # If there were row present before, they are cleared
+        store = self.competency_store
+        if self.assessed_competency_model.rowCount() == len(store):
+            # Same competencies as before (e.g. a sync or a reload of the same registrar), so only the changed cells
+            # are updated, which keeps the selection and scroll position
+            self.update_model_rows(range(len(store)))
+            return
         if self.data is not None:
             self.assessed_competency_model.setRowCount(0)
 
-        for competency in self.data['competencies']:
-            new_row = [QStandardItem(str(competency['name'])),
-                       QStandardItem(str(competency['score'])),
-                       QStandardItem(str(competency['feedback'])),
-                       QStandardItem(str(competency['submission_status'])),
-                       QStandardItem(str(competency['last_modify_date'])),
-                       QStandardItem(str(competency['grading_status'])),
-                       QStandardItem(str(competency['grade_date']))]
+        scores = store.scores.astype(str)
+        submission_statuses = store.submission_status_strings()
+        grading_statuses = store.grading_status_strings()
+        last_modify_dates = store.date_strings(store.last_modify_date)
+        grade_dates = store.date_strings(store.grade_date)
+        for i in range(len(store)):
+            new_row = [QStandardItem(store.names[i]),
+                       QStandardItem(scores[i]),
+                       QStandardItem(str(store.feedback[i])),
+                       QStandardItem(submission_statuses[i]),
+                       QStandardItem(last_modify_dates[i]),
+                       QStandardItem(grading_statuses[i]),
+                       QStandardItem(grade_dates[i])]
             self.assessed_competency_model.appendRow(new_row)
 
+    def update_model_rows(self, rows):
+        """
+        Updates rows of the assessed competency model in place, from the current CompetencyStore
+        :param rows: Row numbers, the same as the positions in data['competencies']
+        """
+        store = self.competency_store
+        last_modify_dates = store.date_strings(store.last_modify_date)
+        grade_dates = store.date_strings(store.grade_date)
+        submission_statuses = store.submission_status_strings()
+        grading_statuses = store.grading_status_strings()
+        for row in rows:
+            self.set_model_row(row, [store.names[row], str(store.scores[row]), str(store.feedback[row]),
+                                     submission_statuses[row], last_modify_dates[row], grading_statuses[row],
+                                     grade_dates[row]])
+
+    def set_model_row(self, row: int, texts: list):
+        for column, text in enumerate(texts):
+            item = self.assessed_competency_model.item(row, column)
+            if item.text() != text:
+                item.setText(text)
+
     def save_data(self):
-        if self.data is not None:
+        # The data of a sync that's still running is incomplete, so isn't saved until it's finished
+        if self.data is not None and self.data is not self.sync_data:
             user_id = self.data['profile_data']['user_id']
 
             if not os.path.exists(cache_location):
                 os.mkdir(cache_location)
 
-            with open(f'{cache_location}/{user_id}.json', 'w') as f:
-                self.data['training_plan'] = self.training_plan
-                json.dump(self.data, f, default=str, indent=4)
+            self.data['training_plan'] = self.training_plan
+            registrar_files.save(f'{cache_location}/{user_id}.json', self.data)
 
             # Loading the data back ensures consistency of what we've saved, both data and types
             self.load_data_from_filepath(f'{cache_location}/{user_id}.json')
 
+    def show_running_sync(self):
+        """
+        Only one sync is run at a time
+        :return: True if there's already one running, which is brought to the front
+        """
+        if self.getCometDataWindow is None:
+            return False
+        self.getCometDataWindow.raise_()
+        self.getCometDataWindow.activateWindow()
+        return True
+
     def get_new_data_from_comet(self):
+        if self.show_running_sync():
+            return None
         if self.ui.lineEditCometUsername.text() == '' or self.ui.lineEditCometPassword.text() == '':
             msg_box = QMessageBox()
             msg_box.setWindowTitle('Error')
@@ -372,26 +567,165 @@ class MainWindow(QMainWindow):
             msg_box.setIcon(QMessageBox.Critical)
             msg_box.exec()
             return None
-        session = make_session(username=self.ui.lineEditCometUsername.text(),
-                                    password=self.ui.lineEditCometPassword.text())
+        username = self.ui.lineEditCometUsername.text()
+        session = self.session_store.session_for(
+            username, lambda: make_session(username=username, password=self.ui.lineEditCometPassword.text()))
         if session is None:
             return
-        self.getCometDataWindow = GetDataFromCometWindow(session)
+        self.start_comet_sync(GetDataFromCometWindow(session, fetch_pool=self.fetch_pool, cache_location=cache_location),
+                              username)
 
-        if self.getCometDataWindow.exec():
-            self.handle_new_data_from_gui()
+    def get_new_data_from_comet_webservice(self):
+        if self.show_running_sync():
+            return None
+        token = self.ui.lineEditCometToken.text().strip()
+        if token == '':
+            msg_box = QMessageBox()
+            msg_box.setWindowTitle('Error')
+            msg_box.setText("The web service token can't be blank")
+            msg_box.setIcon(QMessageBox.Critical)
+            msg_box.exec()
+            return None
+        # The token is all the web service needs, so there's no login, but the proxy settings are still detected
+        session = pypac.PACSession()
+        self.start_comet_sync(GetDataFromCometWindow(
+            session, worker_thread=CometWebServiceThread(session, token, cache_location=cache_location)))
+
+    def start_comet_sync(self, window: GetDataFromCometWindow, username: str = None):
+        """
+        Shows the data from the sync as it comes in. The window isn't modal, so the tabs can be looked at meanwhile
+        :param username: See handle_new_data_from_gui
+        """
+        self.getCometDataWindow = window
+        self.data_before_sync = self.data
+        self.sync_data = None
+        window.profile_loaded.connect(self.handle_sync_profile)
+        window.competencies_listed.connect(self.handle_sync_competencies)
+        window.competency_loaded.connect(self.handle_sync_competency)
+        window.accepted.connect(lambda: self.handle_new_data_from_gui(username))
+        window.rejected.connect(self.handle_sync_cancelled)
+
+    def saved_registrar_data(self, user_id: str):
+        """
+        :return: The registrar's data in cached_data, or None if there isn't any that can be read
+        """
+        try:
+            return registrar_files.load(f'{cache_location}/{user_id}.json')
+        except (OSError, ValueError):
+            return None
 
-    def handle_new_data_from_gui(self):
-        if self.getCometDataWindow.competency_data is not None:
-            new_data = self.getCometDataWindow.competency_data
-            # We'll still keep the old start date and length, as the website is probably wrong and the user manually
-            # fixed it
+    def keep_user_settings(self, new_data: dict, old_data: dict, saved_data: dict = None):
+        # We'll still keep the old start date and length, as the website is probably wrong and the user manually
+        # fixed it. They're only kept from the same registrar, which may not be the one that was being shown
+        user_id = str(new_data['profile_data']['user_id'])
+        if old_data is None or str(old_data['profile_data'].get('user_id')) != user_id:
+            old_data = saved_data if saved_data is not None else self.saved_registrar_data(user_id)
+        if old_data is not None:
+            new_data['profile_data']['start_date'] = old_data['profile_data']['start_date']
+            new_data['profile_data']['program_length'] = old_data['profile_data']['program_length']
+            if 'program_calendar' in old_data:
+                new_data['program_calendar'] = old_data['program_calendar']
+
+    def handle_sync_profile(self, profile_data: dict):
+        # Only shown if the user hasn't loaded another registrar since starting the sync
+        if self.sender() is not self.getCometDataWindow or self.data is not self.data_before_sync:
+            return
+        self.sync_data = {'profile_data': profile_data, 'competencies': [],
+                          'points': {'modules': {}, 'summary': {}}}
+        self.keep_user_settings(self.sync_data, self.data_before_sync)
+        self.data = self.sync_data
+        program_start_date = datetime.strptime(self.data['profile_data']['start_date'], '%Y-%m-%d %H:%M:%S')
+        self.ui.dateEditProgramStart.setDate(
+            QDate(program_start_date.year, program_start_date.month, program_start_date.day))
+        self.ui.comboBoxTEAPLength.setCurrentText(str(self.data['profile_data']['program_length']))
+        self.ui.statusbar.showMessage(f"Getting {profile_data['name']}'s data from COMET...")
+
+    def handle_sync_competencies(self, comp_data: dict):
+        # Each module's competencies and points, after each grade report. There are only a few of these, so each one
+        # gets a full update
+        if self.sender() is not self.getCometDataWindow or self.sync_data is None or self.data is not self.sync_data:
+            return
+        self.data['competencies'] = comp_data['competencies']
+        self.data['points'] = comp_data['points']
+        self.sync_refresh_timer.stop()
+        self.analytics_worker.submit(self.data)
+
+    def handle_sync_competency(self, index: int, competency: dict):
+        # The details of one competency. There are a lot of these, so only its row in the table and its rectangle in
+        # the category overview are updated, and the rest once they slow down
+        if self.sender() is not self.getCometDataWindow or self.sync_data is None or self.data is not self.sync_data or \
+                index >= len(self.data['competencies']):
+            return
+        # Analytics jobs share the competencies list, so it's replaced rather than edited
+        competencies = list(self.data['competencies'])
+        competencies[index] = competency
+        self.data['competencies'] = competencies
+
+        # The snapshot shares the profile data dictionary with the data it was worked out from, so this checks the
+        # table and plot are already showing this registrars competencies
+        if self.snapshot is not None and self.snapshot.data['profile_data'] is self.data['profile_data']:
+            self.show_sync_competency(index, competency)
+            self.ui.MplWidgetCategoryOverview.canvas.draw_idle()
+        self.sync_refresh_timer.start()
+
+    def show_sync_competency(self, index: int, competency: dict):
+        # Updates the competency's row in the table and its rectangle in the category overview, without the snapshot
+        if index < self.assessed_competency_model.rowCount():
+            self.set_model_row(index, [competency['name'], str(float(competency['score'])),
+                                       str(competency['feedback']), competency['submission_status'],
+                                       str(competency['last_modify_date']), competency['grading_status'],
+                                       str(competency['grade_date'])])
+        rec = self.category_overview_grid.competency_rectangles.get(index)
+        if rec is not None:
+            plots.update_competency(self.ui.MplWidgetCategoryOverview.canvas.ax, rec, competency['score'],
+                                    competency['submission_status'])
+
+    def refresh_sync_snapshot(self):
+        if self.sync_data is not None and self.data is self.sync_data:
+            self.analytics_worker.submit(self.data)
+
+    def handle_sync_cancelled(self):
+        # Goes back to what was shown before the sync
+        self.getCometDataWindow = None
+        self.sync_refresh_timer.stop()
+        if self.sync_data is not None and self.data is self.sync_data:
+            self.data = self.data_before_sync
             if self.data is not None:
-                new_data['profile_data']['start_date'] = self.data['profile_data']['start_date']
-                new_data['profile_data']['program_length'] = self.data['profile_data']['program_length']
+                self.new_data_loaded()
+            else:
+                self.snapshot = None
+                self.assessed_competency_model.setRowCount(0)
+                for widget in (self.ui.MplWidgetCategoryOverview, self.ui.MplWidgetOverview,
+                               self.ui.MplWidgetTracking):
+                    widget.canvas.ax.cla()
+                    widget.canvas.draw_idle()
+                self.ui.statusbar.clearMessage()
+        self.sync_data = None
+        self.data_before_sync = None
+
+    def handle_new_data_from_gui(self, username: str = None):
+        """
+        :param username: COMET login the data was downloaded with, which the background sync uses to keep it up to date
+        """
+        window = self.getCometDataWindow
+        self.getCometDataWindow = None
+        self.sync_refresh_timer.stop()
+        data_before_sync = self.data_before_sync
+        self.sync_data = None
+        self.data_before_sync = None
+        if window is not None and window.competency_data is not None:
+            new_data = window.competency_data
+            # What this registrar's data was last time, which may not be the registrar that was being shown
+            old_data = self.saved_registrar_data(new_data['profile_data']['user_id'])
+            self.keep_user_settings(new_data, data_before_sync, old_data)
+            changes = snapshot_diff.diff_data(old_data, new_data) if old_data is not None else None
             self.data = new_data
             self.save_data()
-            self.getCometDataWindow = None
+            self.sync_history.record_sync(self.data, source='comet')
+            if username is not None:
+                user_id = str(self.data['profile_data']['user_id'])
+                self.settings.setValue(f'SyncLogins/{user_id}', username)
+                self.sync_scheduler.logins[user_id] = username
             self.new_data_loaded()
         else:
             return
@@ -399,6 +733,10 @@ class MainWindow(QMainWindow):
         msg_box = QMessageBox()
         msg_box.setWindowTitle('Success')
         msg_box.setText("Data downloaded successfully")
+        if changes is not None:
+            msg_box.setInformativeText(f'Since the last download: {snapshot_diff.summarise(changes)}')
+            if len(changes) > 0:
+                msg_box.setDetailedText('\n'.join(change.describe() for change in changes))
         msg_box.setIcon(QMessageBox.Information)
         msg_box.exec()
 
@@ -413,6 +751,14 @@ class MainWindow(QMainWindow):
 
             self.save_data()
 
+    def edit_program_calendar(self):
+        if self.data is not None:
+            program_calendar_dialog = ProgramCalendarDialog(periods=self.program_calendar.to_data())
+            if program_calendar_dialog.exec() == QDialog.Accepted:
+                self.data['program_calendar'] = program_calendar_dialog.periods
+                self.save_data()
+
+    @instrumented()
     def new_data_loaded(self):
         # Called whenever new data is loaded to update the state of the application, e.g. models, plots etc.
         program_start_date = datetime.strptime(self.data['profile_data']['start_date'], '%Y-%m-%d %H:%M:%S')
@@ -430,13 +776,23 @@ class MainWindow(QMainWindow):
             self.ui.dateEditPlanEnd.setDate(
                 QDate(training_program_end_date.year, training_program_end_date.month, training_program_end_date.day))
 
-        self.tracking_df = self.generate_tracking_data(self.data)
+        # The rest is worked out in the background, the views keep showing the last snapshot until it's ready. If
+        # the user switches registrar again before then, this job is abandoned
+        self.ui.statusbar.showMessage('Updating...')
+        self.analytics_worker.submit(self.data)
+
+    @instrumented()
+    def apply_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        self.competency_store = snapshot.competency_store
+        self.tracking_df = snapshot.tracking_df
+        self.progress_series = snapshot.progress_series
+        self.program_calendar = snapshot.program_calendar
 
-        if self.tracking_df is not None:
-            self.ui.comboBoxGradingFilter.clear()
-            self.ui.comboBoxSubmissionFilter.clear()
-            self.ui.comboBoxGradingFilter.addItems(['All'] + list(self.tracking_df['grading_status'].unique()))
-            self.ui.comboBoxSubmissionFilter.addItems(['All'] + list(self.tracking_df['submission_status'].unique()))
+        self.ui.comboBoxGradingFilter.clear()
+        self.ui.comboBoxSubmissionFilter.clear()
+        self.ui.comboBoxGradingFilter.addItems(['All'] + snapshot.grading_statuses)
+        self.ui.comboBoxSubmissionFilter.addItems(['All'] + snapshot.submission_statuses)
 
         self.update_models_from_data()
         self.update_category_overview_plot()
@@ -444,24 +800,40 @@ class MainWindow(QMainWindow):
         self.update_tracking_plot()
         self.update_misc_stats()
         self.update_score_filters()
+        if self.changes_message is not None:
+            self.ui.statusbar.showMessage(self.changes_message)
+            self.changes_message = None
+        else:
+            self.ui.statusbar.clearMessage()
+
+        if self.sync_data is not None and self.data is self.sync_data and \
+                snapshot.data['profile_data'] is self.data['profile_data'] and \
+                len(snapshot.data['competencies']) == len(self.data['competencies']) and \
+                snapshot.data['competencies'] is not self.data['competencies']:
+            # Competencies have come in since this snapshot was started, so they are shown on top of it
+            for index, (old, new) in enumerate(zip(snapshot.data['competencies'], self.data['competencies'])):
+                if old is not new:
+                    self.show_sync_competency(index, new)
+            self.ui.MplWidgetCategoryOverview.canvas.draw_idle()
+            self.sync_refresh_timer.start()
+
+    def analytics_failed(self, message: str):
+        self.ui.statusbar.clearMessage()
+        msg_box = QMessageBox()
+        msg_box.setWindowTitle('Error')
+        msg_box.setText("There was an error working out the stats for this data")
+        msg_box.setDetailedText(message)
+        msg_box.setIcon(QMessageBox.Critical)
+        msg_box.exec()
 
+    @instrumented()
     def update_misc_stats(self):
-        if self.data is not None and self.tracking_df is not None:
-            number_of_signed_off_comps = 0
-            number_of_partially_signed_off_comps = 0
-            number_waiting_on_grading = 0
-
-            competencies = self.data['competencies']
-            for competency in competencies:
-                if competency['score'] == 1.0:
-                    number_of_signed_off_comps += 1
-                elif 0 < competency['score'] < 1.0:
-                    number_of_partially_signed_off_comps += 1
-
-                if competency['submission_status'] == 'Submitted' and competency['grading_status'] == 'Not graded':
-                    number_waiting_on_grading += 1
-
-            number_of_comps = len(competencies) - 6  # - 6 due to the electives in module 8
+        if self.data is not None and self.snapshot is not None:
+            stats = self.snapshot.misc_stats
+            number_of_signed_off_comps = stats['signed_off']
+            number_of_partially_signed_off_comps = stats['partially_signed_off']
+            number_waiting_on_grading = stats['waiting_on_grading']
+            number_of_comps = stats['competencies']
 
             self.ui.labelSignedOffCompetencies.setText(
                 f'{number_of_signed_off_comps} [{number_of_signed_off_comps * 100 / number_of_comps:.2f}%]')
@@ -472,251 +844,118 @@ class MainWindow(QMainWindow):
                 f'{number_of_partially_signed_off_comps} [{number_of_partially_signed_off_comps * 100 / number_of_comps:.2f}%]')
             self.ui.labelWaitingOnGradingCompetencies.setText(
                 f'{number_waiting_on_grading} [{number_waiting_on_grading * 100 / number_of_comps:.2f}%]')
-            difference = (self.tracking_df['grade_date'] - self.tracking_df['last_modify_date']).mean().days
-            self.ui.labelAverageWaitingTimeForSignOff.setText(f'{difference} days')
-
-    def generate_tracking_data(self, data):
-        # This takes the normal data object (i.e. the dictionary returned from the GetDataFromComet dialog or parsed
-        # from the saved JSON) and generates a dataframe showing how the points have been updating over time
-
-        if data is None:
-            return None
-
-        competencies = data['competencies']
-        tracking_df = pd.DataFrame()
-        for competency in competencies:
-            submission_status = competency['submission_status']
-            grading_status = competency['grading_status']
-            score = competency['score']
-            name = competency['name']
-
-            if competency['last_modify_date'] is not None:
-                last_modify_date = datetime.strptime(competency['last_modify_date'], '%Y-%m-%d %H:%M:%S')
+            if stats['average_waiting_days'] is not None:
+                self.ui.labelAverageWaitingTimeForSignOff.setText(f"{stats['average_waiting_days']} days")
             else:
-                last_modify_date = pd.NaT
+                self.ui.labelAverageWaitingTimeForSignOff.setText('N/A')
 
-            if competency['grade_date'] is not None:
-                grade_date = datetime.strptime(competency['grade_date'], '%Y-%m-%d %H:%M:%S')
-            else:
-                grade_date = pd.NaT
-
-            tracking_df = tracking_df.append({'submission_status': submission_status, 'grading_status': grading_status,
-                                              'score': score, 'last_modify_date': last_modify_date,
-                                              'grade_date': grade_date, 'name': name}, ignore_index=True)
-
-        tracking_df['count'] = 1
-        tracking_df['cat'] = tracking_df['name'].str[0:5]
-        tracking_df['weight'] = tracking_df['name'].str[0:3].map(teap_weights)
-
-        mask = (tracking_df['name'].str[4] == '1') & (~tracking_df['name'].str[0].isin(('1', '7', '8')))
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.2
-        mask = (tracking_df['name'].str[4] == '2') & (~tracking_df['name'].str[0].isin(('1', '7', '8')))
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.5
-        mask = (tracking_df['name'].str[4] == '3') & (~tracking_df['name'].str[0].isin(('1', '7', '8')))
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.3
-
-        mask = tracking_df['name'].str[0:5] == '1.1.1'
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.8
-        mask = tracking_df['name'].str[0:5] == '1.1.2'
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.2
-        mask = tracking_df['name'].str[0:5] == '1.2.1'
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.4
-        mask = tracking_df['name'].str[0:5] == '1.2.2'
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.6
-
-        mask = tracking_df['name'].str[0:5] == '7.2.1'
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.6
-        mask = tracking_df['name'].str[0:5] == '7.2.2'
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.4
-        mask = tracking_df['name'].str[0:5] == '7.4.1'
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.3
-        mask = tracking_df['name'].str[0:5] == '7.4.2'
-        tracking_df.loc[mask, 'weight'] = tracking_df[mask]['weight'] * 0.7
-
-        tracking_df['weighted_score'] = tracking_df['score'] * tracking_df['weight'] / tracking_df['count'].groupby(
-            tracking_df['cat']).transform('sum')
-        tracking_df['max_uploaded_score'] = 1 * tracking_df['weight'] / tracking_df['count'].groupby(
-            tracking_df['cat']).transform('sum')
-
-        return tracking_df
+    def generate_tracking_data(self, data):
+        # Kept as a method for convenience, see tracking_data.py
+        return tracking_data.generate_tracking_data(data)
 
+    @instrumented()
     def update_tracking_plot(self):
-        if self.data is not None and self.tracking_df is not None:
-            program_start_qdate = self.ui.dateEditProgramStart.date()
-            start_date = datetime(program_start_qdate.year(), program_start_qdate.month(), program_start_qdate.day())
-            length_of_program = self.ui.comboBoxTEAPLength.currentText()
-
-            self.ui.MplWidgetTracking.reset_axis(start_date, datetime.now(), 0, 400)
-
-            # Modified plot
-            plot_df = self.tracking_df[self.tracking_df['submission_status'] != 'No attempt'].sort_values(
-                'last_modify_date')
-            modify_dates = plot_df['last_modify_date'].values
-            modify_dates = np.append(modify_dates, np.datetime64(datetime.now()))
-            total_modified_points = np.array(plot_df['max_uploaded_score'].cumsum())
-            total_modified_points = np.append(total_modified_points, total_modified_points[-1])
-            self.ui.MplWidgetTracking.canvas.ax.plot(modify_dates, total_modified_points, label='Uploaded',
-                                                     drawstyle='steps-post')
-
-            # Graded plot
-            plot_df = self.tracking_df[self.tracking_df['grading_status'] == 'Graded'].sort_values('grade_date')
-            graded_dates = plot_df['grade_date'].values
-            graded_dates = np.append(graded_dates, np.datetime64(datetime.now()))
-            total_accepted_points = np.array(plot_df['weighted_score'].cumsum())
-            total_accepted_points = np.append(total_accepted_points, total_accepted_points[-1])
-            self.ui.MplWidgetTracking.canvas.ax.plot(graded_dates, total_accepted_points, label='Graded',
-                                                     drawstyle='steps-post')
-
-            # Expected
-            self.ui.MplWidgetTracking.canvas.ax.plot(
-                list(datetime(start_date.year + n, start_date.month, start_date.day) for n in
-                     range(len(teap_required_points[length_of_program])))
-                , teap_required_points[length_of_program], label='Expected')
-
-            def get_unixtime(dt64):
-                return dt64.astype('datetime64[s]').astype('int')
-
-            # Plan
-            if len(self.training_plan['competencies']) > 0 and self.ui.checkBoxShowPlan.isChecked():
-                plan_start_qdate = self.ui.dateEditPlanStart.date()
-                plan_start_date = datetime(plan_start_qdate.year(), plan_start_qdate.month(), plan_start_qdate.day())
-
-                plan_end_qdate = self.ui.dateEditPlanEnd.date()
-                plan_end_date = datetime(plan_end_qdate.year(), plan_end_qdate.month(), plan_end_qdate.day())
-
-                planned_score = \
-                self.tracking_df[self.tracking_df['name'].str.contains('|'.join(self.training_plan['competencies']))][
-                    'max_uploaded_score'].sum()
-
-                points_start = np.interp(plan_start_date.timestamp(), [get_unixtime(d) for d in modify_dates],
-                                         total_modified_points)
-                self.ui.MplWidgetTracking.canvas.ax.plot((plan_start_date, plan_end_date),
-                                                         (points_start, points_start + planned_score), label='Plan',
-                                                         linestyle='--', color='red')
-
-            # Extrapolation
-            if self.ui.checkBoxShowExtrapolation.isChecked():
-                today = datetime.now()
-                number_of_weeks = self.ui.spinBoxMonthsToExtrapolate.value() * 4
-                delta = timedelta(weeks=number_of_weeks)
-                before = today - delta
-                current_uploaded_points = total_modified_points[-1]
-
-                before_indicies = np.where(modify_dates <= np.datetime64(before))
-                if len(before_indicies) == 0:
-                    before_uploaded_points = 0
-                else:
-                    try:
-                        before_uploaded_points = total_modified_points[before_indicies[0][-1]]
-                    except:
-                        before_uploaded_points = 0
-                points_per_week = (current_uploaded_points - before_uploaded_points) / number_of_weeks
-
-                # 638 is just a random magic number to ensure it's off the plot so the number is big enough
-                final_point = today + timedelta(weeks=638)
-                final_points = current_uploaded_points + 638 * points_per_week
-
-                self.ui.MplWidgetTracking.canvas.ax.autoscale(tight=True)
-                ylim = self.ui.MplWidgetTracking.canvas.ax.get_ylim()
-                xlim = self.ui.MplWidgetTracking.canvas.ax.get_xlim()
-
-                self.ui.MplWidgetTracking.canvas.ax.plot((before, final_point), (before_uploaded_points, final_points),
-                                                         color='purple', label='Extrapolation')
-
-                self.ui.MplWidgetTracking.canvas.ax.set_ylim(ylim)
-                self.ui.MplWidgetTracking.canvas.ax.set_xlim(xlim)
-
-            self.ui.MplWidgetTracking.canvas.ax.legend()
-
-            # Don't autoscale if it's extrapolating, as the point is off the plot
-            if not self.ui.checkBoxShowExtrapolation.isChecked():
-                self.ui.MplWidgetTracking.canvas.ax.autoscale(tight=True)
-            self.ui.MplWidgetTracking.canvas.flush_events()
-            self.ui.MplWidgetTracking.canvas.draw()
-
+        if self.data is not None and self.snapshot is not None:
+            settings = self.tracking_settings()
+            plots.tracking(self.ui.MplWidgetTracking.canvas.ax, self.snapshot, settings)
+            self.draw_plot(self.ui.MplWidgetTracking, 'tracking', settings)
+
+    def tracking_settings(self):
+        program_start_qdate = self.ui.dateEditProgramStart.date()
+        start_date = datetime(program_start_qdate.year(), program_start_qdate.month(), program_start_qdate.day())
+
+        plan = None
+        if len(self.training_plan['competencies']) > 0 and self.ui.checkBoxShowPlan.isChecked():
+            plan_start_qdate = self.ui.dateEditPlanStart.date()
+            plan_end_qdate = self.ui.dateEditPlanEnd.date()
+            plan = (datetime(plan_start_qdate.year(), plan_start_qdate.month(), plan_start_qdate.day()),
+                    datetime(plan_end_qdate.year(), plan_end_qdate.month(), plan_end_qdate.day()),
+                    list(self.training_plan['competencies']))
+
+        return plots.TrackingSettings(start_date, self.ui.comboBoxTEAPLength.currentText(), plan,
+                                      self.extrapolation_settings())
+
+    def extrapolation_settings(self):
+        if not self.ui.checkBoxShowExtrapolation.isChecked():
+            return None
+        # The combo box is in the same order as forecasting.models
+        return forecasting.models[self.ui.comboBoxExtrapolationModel.currentIndex()], \
+            self.ui.spinBoxMonthsToExtrapolate.value()
+
+    def draw_plot(self, widget, view: str, settings):
+        # Reuses the last render if this plot has already been drawn with the same data and settings
+        key = figure_key(view, self.snapshot.data_hash, plots.settings_key(view, settings), widget.canvas.fig)
+        widget.canvas.flush_events()
+        widget.canvas.draw_cached(self.figure_cache, key)
+
+    def warm_figure_cache(self):
+        if self.ui.checkBoxWarmFigureCache.isChecked():
+            figure_sizes = {}
+            for view, widget in (('category_overview', self.ui.MplWidgetCategoryOverview),
+                                 ('module_overview', self.ui.MplWidgetOverview),
+                                 ('tracking', self.ui.MplWidgetTracking)):
+                width, height = widget.canvas.fig.get_size_inches()
+                figure_sizes[view] = (width, height, widget.canvas.fig.dpi)
+            self.analytics_worker.warm(glob.glob(f'{cache_location}/*.json'), self.figure_cache, figure_sizes,
+                                       {'show_plan': self.ui.checkBoxShowPlan.isChecked(),
+                                        'extrapolation': self.extrapolation_settings(),
+                                        'relative': self.ui.checkBoxOverviewPlotRelative.isChecked()})
+
+    def saved_logins(self):
+        # Registrar user id to the COMET username they were downloaded with
+        self.settings.beginGroup('SyncLogins')
+        logins = {user_id: self.settings.value(user_id) for user_id in self.settings.childKeys()}
+        self.settings.endGroup()
+        return logins
+
+    def set_background_sync(self):
+        self.settings.setValue('Sync/background_sync', self.ui.checkBoxBackgroundSync.isChecked())
+        self.settings.setValue('Sync/requests_per_hour', self.ui.spinBoxSyncRequestsPerHour.value())
+        self.apply_background_sync()
+
+    def apply_background_sync(self):
+        # Starts or stops the background sync to match the settings on the Get data tab
+        enabled = self.ui.checkBoxBackgroundSync.isChecked()
+        self.sync_scheduler.requests_per_hour = self.ui.spinBoxSyncRequestsPerHour.value()
+        if enabled and not self.sync_timer.isActive():
+            self.sync_timer.start(30 * 1000)
+            self.tick_sync_scheduler()
+        elif not enabled:
+            self.sync_timer.stop()
+
+    def tick_sync_scheduler(self):
+        # The scheduler reads the saved registrars and checks sessions are still logged in, so it's kept off the GUI
+        # thread. If the last tick is still going, this one is skipped
+        if self.sync_tick_thread is None or not self.sync_tick_thread.is_alive():
+            self.sync_tick_thread = threading.Thread(target=self.sync_scheduler.tick, daemon=True)
+            self.sync_tick_thread.start()
+
+    def handle_registrar_synced(self, user_id: str):
+        # The watcher would notice too, but this is straight away
+        self.handle_registrar_file_changed(f'{cache_location}/{user_id}.json')
+
+    def set_warm_figure_cache(self, enabled):
+        self.settings.setValue('Performance/warm_figure_cache', enabled)
+        self.warm_figure_cache()
+
+    @instrumented()
     def update_category_overview_plot(self):
-        if self.tracking_df is not None:
-            self.ui.MplWidgetCategoryOverview.reset_axis()
-            self.category_overview_rectangles = []
+        if self.snapshot is not None:
+            planned_competencies = list(self.training_plan['competencies'])
             ax = self.ui.MplWidgetCategoryOverview.canvas.ax
+            self.category_overview_grid = plots.category_overview(ax, self.snapshot, planned_competencies)
+            self.category_overview_hover.attach(ax)
+
+            self.draw_plot(self.ui.MplWidgetCategoryOverview, 'category_overview', planned_competencies)
 
-            row_number = 0
-            labels = []
-
-            for module in reversed(teap_categories.keys()):
-                for category in reversed(teap_categories[module].keys()):
-                    tmp_df = self.tracking_df[self.tracking_df['name'].str.startswith(f'{module}.{category}')]
-                    number_of_comps = {1: len(tmp_df[tmp_df['name'].str[4] == '1']),
-                                       2: len(tmp_df[tmp_df['name'].str[4] == '2']),
-                                       3: len(tmp_df[tmp_df['name'].str[4] == '3'])}
-                    for level in ('1', '2', '3'):
-                        for comp_number, (index, row) in enumerate(tmp_df[tmp_df['name'].str[4] == level].iterrows()):
-                            level_as_int = int(level)
-                            offset = (level_as_int - 1) + comp_number / number_of_comps[level_as_int]
-
-                            extra_options = {}
-                            if row['score'] == 1:
-                                face_color = competency_reference_data[module]['complete_colour']
-                                extra_options['edgecolor'] = 'Black'
-                            elif row['submission_status'] != 'No attempt':
-                                face_color = competency_reference_data[module]['incomplete_colour']
-
-                                extra_options['hatch'] = '///'
-                                extra_options['linewidth'] = 0
-                                extra_options['edgecolor'] = competency_reference_data[module]['complete_colour']
-
-                                rect2 = Rectangle((offset, row_number), 1 / number_of_comps[level_as_int], 1,
-                                                  edgecolor='Black',
-                                                  zorder=100, facecolor='none')
-                                ax.add_patch(rect2)
-                            else:
-                                face_color = competency_reference_data[module]['incomplete_colour']
-                                extra_options['edgecolor'] = 'Black'
-
-                            rect = Rectangle((offset, row_number), 1 / number_of_comps[level_as_int], 1,
-                                             label=f'{module}.{category}.{level}.{comp_number + 1}',
-                                             facecolor=face_color, **extra_options)
-                            ax.add_patch(rect)
-                            self.category_overview_rectangles.append(rect)
-
-                    labels.append(teap_categories[module][category])
-                    row_number += 1
-
-            self.update_trainingplan_selected_view()
-
-            ax.set_xlim((0, 3))
-            ax.set_ylim((0, row_number))
-            ax.set_yticks(list(n + 0.5 for n in range(row_number)))
-            ax.set_yticklabels(labels)
-            ax.set_xticks((0.5, 1.5, 2.5))
-            ax.set_xticklabels(('1', '2', '3'))
-            ax.set_xlabel('Level')
-            ax.autoscale(tight=True)
-
-
-            if self.datacursor is None:
-                self.datacursor = datacursor(artists=self.category_overview_rectangles,
-                                             formatter=self.format_category_overview_note,
-                                             axes=ax, hover=True, bbox=dict(alpha=1), hide_button=None, tolerance=1,
-                                             keep_inside=True,
-                                             arrowprops=dict(alpha=0))
-
-            self.ui.MplWidgetCategoryOverview.canvas.flush_events()
-            self.ui.MplWidgetCategoryOverview.canvas.draw()
-
-    def update_trainingplan_selected_view(self):
-        # Called to set the correct borders on the competencies part of a training plan
-        for rec in self.category_overview_rectangles:
-            if rec.get_label() in self.training_plan['competencies']:
-                self._set_rect_selected(rec)
-
-    def format_category_overview_note(self, **kwargs):
-        comp = kwargs['label']
-        if comp in self.training_plan['notes']:
-            return self.training_plan['notes'][comp]
+    def format_category_overview_note(self, event):
+        rec = self.category_overview_grid.hit(event.xdata, event.ydata)
+        if rec is not None and rec.get_label() in self.training_plan['notes']:
+            return self.training_plan['notes'][rec.get_label()]
         else:
             return None
 
+    @instrumented()
     def export_official_spreadsheet(self):
         if self.data is not None:
             filepath = QFileDialog.getSaveFileName(self, 'Save spreadsheet', 'CTG v3.6 Progression Monitor Tool.xlsx', '(*.xlsx)')[0]
@@ -724,66 +963,74 @@ class MainWindow(QMainWindow):
                 if not filepath.endswith('.xlsx'):
                     filepath += '.xlsx'
 
-                workbook = load_workbook('resources/CTG v3.6 Progression Monitor Tool.xlsx')
-                worksheet = workbook.active
-                worksheet[spreadsheet_cells['name']] = self.data['profile_data']['name']
-                worksheet[spreadsheet_cells['program_length']] = int(self.data['profile_data']['program_length'])
-                worksheet[spreadsheet_cells['start_date']] = datetime.strptime(self.data['profile_data']['start_date'], '%Y-%m-%d %H:%M:%S')
-                worksheet[spreadsheet_cells['todays_date']] = datetime.now()
-                worksheet[spreadsheet_cells['intended_brachy_level']] = 'Level 2'
+                spreadsheet_export.export_spreadsheet(self.data, self.tracking_df, filepath)
 
-                for competency_start,cell in spreadsheet_cells['competencies'].items():
-                    points = self.tracking_df[(self.tracking_df['cat'] == competency_start)]['score'].mean()
-                    worksheet[cell] = points
+    def export_all_official_spreadsheets(self):
+        # Exports a spreadsheet for every registrar in the cache, e.g. for a supervisor doing a cohorts APR's
+        data_filepaths = glob.glob(f'{cache_location}/*.json')
+        if len(data_filepaths) == 0:
+            return
+        output_directory = QFileDialog.getExistingDirectory(self, 'Choose a folder to save the spreadsheets to')
+        if output_directory != '':
+            results = spreadsheet_export.export_cohort(data_filepaths, output_directory)
+            failed = [data_filepath for data_filepath, _, error in results if error is not None]
 
-                workbook.save(filepath)
+            msg_box = QMessageBox()
+            if len(failed) == 0:
+                msg_box.setWindowTitle('Success')
+                msg_box.setText(f"Exported {len(results)} spreadsheets to {output_directory}")
+                msg_box.setIcon(QMessageBox.Information)
+            else:
+                msg_box.setWindowTitle('Error')
+                msg_box.setText(f"Exported {len(results) - len(failed)} spreadsheets to {output_directory}, but "
+                                f"there was an error exporting the data in: {', '.join(failed)}")
+                msg_box.setIcon(QMessageBox.Warning)
+            msg_box.exec()
 
-    def update_overview_plot(self):
+    def forget_saved_login(self):
+        # e.g. on a shared computer, so the next sync has to log in again
+        self.session_store.forget()
+        msg_box = QMessageBox()
+        msg_box.setWindowTitle('Success')
+        msg_box.setText('The saved COMET login has been removed')
+        msg_box.setIcon(QMessageBox.Information)
+        msg_box.exec()
+
+    def import_gradebook_exports(self):
+        # Updates every saved registrar from the course gradebook, rather than downloading each registrar from COMET
+        filepaths = QFileDialog.getOpenFileNames(self, 'Choose gradebook exports, grade histories or grader reports',
+                                                 '', 'Gradebook files (*.csv *.xlsx *.ods *.html *.htm)')[0]
+        if len(filepaths) == 0:
+            return
+
+        msg_box = QMessageBox()
+        try:
+            updated, unmatched = gradebook_import.import_files(filepaths, cache_location, self.sync_history)
+        except Exception as e:
+            msg_box.setWindowTitle('Error')
+            msg_box.setText(f'There was an error importing the gradebook: {e}')
+            msg_box.setIcon(QMessageBox.Warning)
+            msg_box.exec()
+            return
+
+        text = f"Updated {sum(count for _, count in updated)} competencies for {len(updated)} registrars"
+        if len(unmatched) > 0:
+            text += f". These registrars haven't been downloaded yet, so were skipped: {', '.join(unmatched)}"
+        msg_box.setWindowTitle('Success')
+        msg_box.setText(text)
+        msg_box.setIcon(QMessageBox.Information)
+        msg_box.exec()
+
+        # The registrar being shown may have been updated
         if self.data is not None:
-            self.ui.MplWidgetOverview.reset_axis()
+            self.load_data_from_filepath(f"{cache_location}/{self.data['profile_data']['user_id']}.json")
 
+    @instrumented()
+    def update_overview_plot(self):
+        if self.data is not None and self.snapshot is not None:
             relative_plot = self.ui.checkBoxOverviewPlotRelative.isChecked()
-
-            complete = []
-            uploaded = []
-            unattempted = []
-            modules = ('1', '2', '3', '4', '5', '6', '7', '8')
-            for module in modules:
-                total_available_points = competency_reference_data[module]['total_points']
-                uploaded_points = self.tracking_df[(self.tracking_df['name'].str.startswith(module))
-                        & (self.tracking_df['submission_status'] != 'No attempt')]['max_uploaded_score'].sum()
-                graded_points = self.tracking_df[(self.tracking_df['name'].str.startswith(module)) & (
-                            self.tracking_df['grading_status'] == 'Graded')]['weighted_score'].sum()
-                if relative_plot:
-                    uploaded_points = uploaded_points / total_available_points * 100
-                    graded_points = graded_points / total_available_points * 100
-                    total_available_points = 100
-                complete.append(graded_points)
-                uploaded.append(uploaded_points - graded_points)
-                unattempted.append(total_available_points - uploaded_points)
-            self.ui.MplWidgetOverview.canvas.ax.bar(modules, complete,
-                                                    color=list(
-                                                        competency_reference_data[mod]['complete_colour'] for mod in
-                                                        modules))
-            self.ui.MplWidgetOverview.canvas.ax.bar(modules, uploaded, bottom=complete,
-                                                    color=list(
-                                                        competency_reference_data[mod]['incomplete_colour'] for mod in
-                                                        modules), hatch='//',
-                                                    edgecolor=list(
-                                                        competency_reference_data[mod]['complete_colour'] for mod in
-                                                        modules))
-            self.ui.MplWidgetOverview.canvas.ax.bar(modules, unattempted,
-                                                    bottom=[sum(x) for x in zip(complete, uploaded)],
-                                                    color=list(
-                                                        competency_reference_data[mod]['incomplete_colour'] for mod in
-                                                        modules))
-
-            self.ui.MplWidgetOverview.canvas.ax.set_xlabel('Module')
-            self.ui.MplWidgetOverview.canvas.ax.set_ylabel(
-                'Percentage complete' if relative_plot else 'Points signed off')
-
-            self.ui.MplWidgetOverview.canvas.flush_events()
-            self.ui.MplWidgetOverview.canvas.draw()
+            plots.module_overview(self.ui.MplWidgetOverview.canvas.ax, self.snapshot, relative_plot)
+            self.draw_plot(self.ui.MplWidgetOverview, 'module_overview', relative_plot)
 
 
 class ProxyLoginDialog(QDialog):
@@ -839,6 +1086,95 @@ class UpdateNoteDialog(QDialog):
 
         self.accept()
 
+class ProgramCalendarDialog(QDialog):
+    """
+    Edits the pauses and part time periods of a program, see program_calendar.py
+    """
+    columns = ('Start', 'End', 'Ongoing', 'FTE (0 for a pause)')
+
+    def __init__(self, parent=None, periods=None):
+        super(ProgramCalendarDialog, self).__init__(parent)
+        self.setWindowTitle('Pauses and part time')
+        self.labelExplanation = QLabel('Add a row for each pause (FTE of 0) or period of part time work. The expected '
+                                       'points and extrapolation are stretched out to match')
+        self.labelExplanation.setWordWrap(True)
+        self.tableWidgetPeriods = QTableWidget(0, len(self.columns), self)
+        self.tableWidgetPeriods.setHorizontalHeaderLabels(self.columns)
+        self.tableWidgetPeriods.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        for period in periods or []:
+            self.add_period(period)
+
+        self.pushButtonAdd = QPushButton('Add period', self)
+        self.pushButtonAdd.clicked.connect(lambda: self.add_period())
+        self.pushButtonRemove = QPushButton('Remove selected period', self)
+        self.pushButtonRemove.clicked.connect(self.remove_period)
+        self.pushButtonAccept = QPushButton('OK', self)
+        self.pushButtonAccept.clicked.connect(self.accepting)
+        self.pushButtonCancel = QPushButton('Cancel', self)
+        self.pushButtonCancel.clicked.connect(self.reject)
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.labelExplanation)
+        layout.addWidget(self.tableWidgetPeriods)
+        layout.addWidget(self.pushButtonAdd)
+        layout.addWidget(self.pushButtonRemove)
+        layout.addWidget(self.pushButtonAccept)
+        layout.addWidget(self.pushButtonCancel)
+
+        self.periods = None
+
+    def add_period(self, period: dict = None):
+        row = self.tableWidgetPeriods.rowCount()
+        self.tableWidgetPeriods.insertRow(row)
+        today = QDate.currentDate()
+
+        start = QDateEdit(self)
+        start.setCalendarPopup(True)
+        end = QDateEdit(self)
+        end.setCalendarPopup(True)
+        ongoing = QCheckBox(self)
+        ongoing.toggled.connect(lambda checked: end.setEnabled(not checked))
+        fte = QDoubleSpinBox(self)
+        fte.setRange(0, 1)
+        fte.setSingleStep(0.1)
+
+        if period is not None:
+            start.setDate(QDate.fromString(str(period['start_date'])[0:10], 'yyyy-MM-dd'))
+            if period['end_date'] is None:
+                end.setDate(today)
+                ongoing.setChecked(True)
+            else:
+                end.setDate(QDate.fromString(str(period['end_date'])[0:10], 'yyyy-MM-dd'))
+            fte.setValue(float(period['fte']))
+        else:
+            start.setDate(today)
+            end.setDate(today.addMonths(6))
+
+        for column, widget in enumerate((start, end, ongoing, fte)):
+            self.tableWidgetPeriods.setCellWidget(row, column, widget)
+
+    def remove_period(self):
+        row = self.tableWidgetPeriods.currentRow()
+        if row >= 0:
+            self.tableWidgetPeriods.removeRow(row)
+
+    def accepting(self):
+        periods = []
+        for row in range(self.tableWidgetPeriods.rowCount()):
+            start, end, ongoing, fte = (self.tableWidgetPeriods.cellWidget(row, column) for column in range(4))
+            if not ongoing.isChecked() and end.date() <= start.date():
+                msg_box = QMessageBox()
+                msg_box.setWindowTitle('Error')
+                msg_box.setText(f"Period {row + 1} finishes before it starts")
+                msg_box.setIcon(QMessageBox.Critical)
+                msg_box.exec()
+                return None
+            periods.append({'start_date': start.date().toString('yyyy-MM-dd') + ' 00:00:00',
+                            'end_date': None if ongoing.isChecked() else end.date().toString('yyyy-MM-dd') + ' 00:00:00',
+                            'fte': fte.value()})
+        self.periods = periods
+        self.accept()
+
+
 class LoadDataDialog(QDialog):
     def __init__(self, parent=None, registrar_list: dict = None):
         super(LoadDataDialog, self).__init__(parent)
@@ -865,8 +1201,9 @@ class LoadDataDialog(QDialog):
         self.accept()
 
 class InitialDownloadDialog(QDialog):
-    def __init__(self, parent=None, registrar_list: dict = None):
+    def __init__(self, parent=None, registrar_list: dict = None, session_store: SessionStore = None):
         super(InitialDownloadDialog, self).__init__(parent)
+        self.session_store = session_store
         self.setWindowTitle('Download data')
         self.labelExplanation = QLabel('Please login with your COMET details')
         self.lineEditUsername = QLineEdit()
@@ -896,8 +1233,9 @@ class InitialDownloadDialog(QDialog):
             msg_box.exec()
             return None
 
-        self.session = make_session(username=self.lineEditUsername.text(),
-                                    password=self.lineEditPassword.text())
+        username = self.lineEditUsername.text()
+        self.session = self.session_store.session_for(
+            username, lambda: make_session(username=username, password=self.lineEditPassword.text()))
         if self.session is None:
             return
         else:
@@ -1008,6 +1346,8 @@ def make_session(username:str = None,password:str=None):
 
 # Main application loop
 if __name__ == '__main__':
+    # Needed for the worker processes used by the batch spreadsheet export in the frozen Windows build
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     GUI = MainWindow()
     sys.exit(app.exec())
@@ -0,0 +1,246 @@
+# Works out everything the views need for a registrar (the competency store, tracking dataframe, progress series and
+# the stats) on a background thread, so the GUI doesn't freeze while switching registrar or reloading data.
+#
+# The results are bundled into an AnalyticsSnapshot, which isn't changed after it's made, so the views can read it on
+# the GUI thread without any locking. Only the newest job's snapshot is handed to the views, anything older is stale
+# and is either never started or stops at its next checkpoint.
+#
+# The same pool can also warm figure_cache.py with renders of the plots for registrars that aren't being shown.
+# Python standard library is PSF licenced
+import hashlib
+import json
+import traceback
+
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+import comet_summary
+import plots
+import registrar_files
+import tracking_data
+from figure_cache import figure_key, render_offscreen
+from competency_store import CompetencyStore, missing_date, pending_status
+from instrumentation import span
+from program_calendar import ProgramCalendar
+from progress_series import ProgressSeries
+
+
+class StaleJob(Exception):
+    """
+    Raised inside a job when a newer one has been submitted, to stop it early
+    """
+
+
+def data_hash(data: dict):
+    """
+    :return: Hash of the parts of the registrar data the snapshot is worked out from
+    """
+    parts = {key: data.get(key) for key in ('competencies', 'program_calendar')}
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class AnalyticsSnapshot:
+    """
+    Everything worked out from one lot of registrar data
+    """
+
+    def __init__(self, generation, data, data_hash, competency_store, tracking_df, progress_series, program_calendar,
+                 grading_statuses, submission_statuses, misc_stats, level_rows, uploaded_by_module, graded_by_module):
+        self.generation = generation
+        self.data = data
+        self.data_hash = data_hash
+        self.competency_store = competency_store
+        self.tracking_df = tracking_df
+        self.progress_series = progress_series
+        self.program_calendar = program_calendar
+        # Options for the filter combo boxes
+        self.grading_statuses = grading_statuses
+        self.submission_statuses = submission_statuses
+        self.misc_stats = misc_stats
+        # Row positions of the competencies in each (module, category, level), for the category overview
+        self.level_rows = level_rows
+        self.uploaded_by_module = uploaded_by_module
+        self.graded_by_module = graded_by_module
+
+
+def misc_stats(store: CompetencyStore):
+    """
+    :return: Dictionary of the counts shown on the Misc tab. average_waiting_days is None if nothing has been graded
+    """
+    has_both_dates = (store.grade_date != missing_date) & (store.last_modify_date != missing_date)
+    average_waiting_days = None
+    if np.any(has_both_dates):
+        difference = (store.grade_date[has_both_dates] - store.last_modify_date[has_both_dates]).mean()
+        average_waiting_days = int(difference // (24 * 60 * 60))
+
+    return {'signed_off': int(np.count_nonzero(store.scores == 1.0)),
+            'partially_signed_off': int(np.count_nonzero((store.scores > 0) & (store.scores < 1.0))),
+            'waiting_on_grading': int(np.count_nonzero((store.submission_status == store.submission_code('Submitted'))
+                                                       & (store.grading_status == store.grading_code('Not graded')))),
+            'competencies': len(store) - 6,  # - 6 due to the electives in module 8
+            'average_waiting_days': average_waiting_days}
+
+
+def compute_snapshot(data: dict, generation: int = 0, is_stale=lambda: False):
+    """
+    Works out a snapshot from registrar data. Doesn't touch any Qt widgets, so it's safe to call from any thread
+    :param data: Registrar data, in the same format as the JSON files in cached_data
+    :param generation: Number of the job, used to tell which snapshot is newest
+    :param is_stale: Called between each step, the job is abandoned (by raising StaleJob) if it returns True
+    """
+    def checkpoint():
+        if is_stale():
+            raise StaleJob()
+
+    with span('compute_snapshot'):
+        store = CompetencyStore.from_data(data)
+        checkpoint()
+        tracking_df = tracking_data.generate_tracking_data(data, store)
+        checkpoint()
+        progress_series = ProgressSeries.from_tracking_df(tracking_df)
+        program_calendar = ProgramCalendar.from_data(data)
+        checkpoint()
+
+        level_rows = tracking_df.groupby(['module', 'category', 'level']).indices
+        uploaded = ~tracking_df['submission_status'].isin(('No attempt', pending_status))
+        uploaded_by_module = tracking_df[uploaded].groupby('module')['max_uploaded_score'].sum()
+        graded_by_module = tracking_df[tracking_df['grading_status'] == 'Graded'].groupby(
+            'module')['weighted_score'].sum()
+        if (tracking_df['submission_status'] == pending_status).any():
+            # While a sync is still getting the competency pages it isn't known which are graded yet, but the grade
+            # reports already have COMET's totals
+            graded_by_module = pd.Series(comet_summary.module_points(data), dtype=float).combine_first(
+                graded_by_module)
+
+        return AnalyticsSnapshot(generation=generation, data=data, data_hash=data_hash(data), competency_store=store,
+                                 tracking_df=tracking_df, progress_series=progress_series,
+                                 program_calendar=program_calendar,
+                                 grading_statuses=list(tracking_df['grading_status'].unique()),
+                                 submission_statuses=list(tracking_df['submission_status'].unique()),
+                                 misc_stats=misc_stats(store), level_rows=level_rows,
+                                 uploaded_by_module=uploaded_by_module, graded_by_module=graded_by_module)
+
+
+class _JobSignals(QObject):
+    # QRunnable isn't a QObject, so it can't have signals of its own. Emitted once per job with the generation, and
+    # either the snapshot or the error (both None if the job went stale)
+    done = pyqtSignal(int, object, object)
+
+
+class _AnalyticsJob(QRunnable):
+    def __init__(self, worker, data, generation):
+        super(_AnalyticsJob, self).__init__()
+        self.worker = worker
+        self.data = data
+        self.generation = generation
+        self.signals = _JobSignals()
+        # AnalyticsWorker.jobs holds on to the job until it's done, so it can't be deleted by the pool before then
+        self.setAutoDelete(False)
+
+    def run(self):
+        snapshot = None
+        error = None
+        try:
+            snapshot = compute_snapshot(self.data, self.generation,
+                                        lambda: self.generation != self.worker.generation)
+        except StaleJob:
+            pass
+        except Exception:
+            error = traceback.format_exc()
+        self.signals.done.emit(self.generation, snapshot, error)
+
+
+class _WarmingJob(QRunnable):
+    def __init__(self, filepath, cache, figure_sizes, view_options):
+        super(_WarmingJob, self).__init__()
+        self.filepath = filepath
+        self.cache = cache
+        self.figure_sizes = figure_sizes
+        self.view_options = view_options
+
+    def run(self):
+        # Warming is only to save time later, so any problems are left for when the registrar is actually loaded
+        try:
+            data = registrar_files.load(self.filepath)
+            snapshot = compute_snapshot(data)
+            view_settings = plots.settings_from_data(data, **self.view_options)
+            for view, (width_inches, height_inches, dpi) in self.figure_sizes.items():
+                figure, rendered = render_offscreen(
+                    lambda ax: plots.draw(view, ax, snapshot, view_settings[view]), width_inches, height_inches, dpi)
+                self.cache.put(figure_key(view, snapshot.data_hash, plots.settings_key(view, view_settings[view]),
+                                          figure), rendered)
+        except Exception:
+            pass
+
+
+class AnalyticsWorker(QObject):
+    """
+    Runs compute_snapshot on a thread pool. snapshot_ready is only emitted for the newest job
+    """
+    snapshot_ready = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None, max_threads: int = 2):
+        super(AnalyticsWorker, self).__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.generation = 0
+        self.latest_snapshot = None
+        # Python references to the jobs, so they aren't garbage collected while the pool is running them
+        self.jobs = {}
+        # Warming gets its own thread, so it never holds up the registrar being looked at
+        self.warming_pool = QThreadPool(self)
+        self.warming_pool.setMaxThreadCount(1)
+
+    def submit(self, data: dict):
+        """
+        Starts working out a snapshot for the data. Any jobs that haven't finished yet are now stale
+        :return: The generation number of the new job
+        """
+        self.generation += 1
+        # Jobs that haven't started yet can just be dropped, running ones stop at their next checkpoint
+        for generation in list(self.jobs):
+            if self.pool.tryTake(self.jobs[generation]):
+                del self.jobs[generation]
+        # The GUI keeps editing its copy of the data (e.g. the training plan), so the job gets its own top level dict
+        # and calendar. The competencies are replaced rather than edited, so they can be shared
+        data = dict(data)
+        if data.get('program_calendar') is not None:
+            data['program_calendar'] = [dict(period) for period in data['program_calendar']]
+        job = _AnalyticsJob(self, data, self.generation)
+        job.signals.done.connect(self._job_done)
+        self.jobs[self.generation] = job
+        self.pool.start(job)
+        return self.generation
+
+    def warm(self, filepaths, cache, figure_sizes: dict, view_options: dict):
+        """
+        Renders the plots for each registrar into the cache in the background
+        :param filepaths: Registrar JSON files
+        :param cache: FigureCache to put the renders in
+        :param figure_sizes: Dictionary of view name to the width and height in inches, and dpi of its canvas
+        :param view_options: Keyword arguments for plots.settings_from_data
+        """
+        self.warming_pool.clear()
+        for filepath in filepaths:
+            self.warming_pool.start(_WarmingJob(filepath, cache, figure_sizes, view_options))
+
+    def is_busy(self):
+        return self.pool.activeThreadCount() > 0
+
+    def wait(self, timeout_ms: int = -1):
+        """
+        Blocks until every job has finished. The snapshot is still delivered through the event loop
+        """
+        return self.pool.waitForDone(timeout_ms) and self.warming_pool.waitForDone(timeout_ms)
+
+    def _job_done(self, generation: int, snapshot, error):
+        self.jobs.pop(generation, None)
+        if generation != self.generation:
+            return
+        if error is not None:
+            self.failed.emit(error)
+        elif snapshot is not None:
+            self.latest_snapshot = snapshot
+            self.snapshot_ready.emit(snapshot)
@@ -0,0 +1,139 @@
+# Benchmarks the analytics and plotting hot paths of the main window on synthetic cohorts, using the offscreen Qt
+# platform so it can run without a display
+#
+# Example:
+#   python benchmarks/bench_analytics.py --sizes 10 100 1000 --output analytics.json
+#   python benchmarks/bench_analytics.py --compare analytics.json
+# Python standard library is PSF licenced
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+import common
+from common import compare_results, print_results, repo_root, summarise_timings, time_function, write_results
+from synthetic_data import write_cohort
+
+from PyQt5.QtWidgets import QApplication
+
+
+def benchmark_cold_start(repeats: int):
+    # Importing the program pulls in pandas, matplotlib and Qt, so measure it in a fresh interpreter each time. The
+    # QApplication is made first so matplotlib accepts the Qt backend without a display
+    code = 'from PyQt5.QtWidgets import QApplication; app = QApplication([]); import TEAPTracker'
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=repo_root, check=True,
+                       env=dict(os.environ, QT_QPA_PLATFORM='offscreen'))
+        timings.append(time.perf_counter() - start)
+    return summarise_timings(timings)
+
+
+class SaveFileDialog:
+    """
+    Stands in for QFileDialog in TEAPTracker so exporting the spreadsheet doesn't wait on a dialog
+    """
+    filepath = ''
+
+    @staticmethod
+    def getSaveFileName(*args, **kwargs):
+        return SaveFileDialog.filepath, '(*.xlsx)'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the analytics and plotting of the main window')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100],
+                        help='Numbers of registrars to generate (up to 10000)')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare against a previous JSON results file')
+    args = parser.parse_args()
+
+    common.chdir_to_repo_root()
+    results = {'cold_start/import': benchmark_cold_start(args.repeats)}
+
+    app = QApplication(sys.argv)
+    import TEAPTracker
+    import analytics
+    import spreadsheet_export
+
+    TEAPTracker.QFileDialog = SaveFileDialog
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # Start the window with a single cached registrar, so it loads it without asking which one to use
+        TEAPTracker.cache_location = os.path.join(temp_dir, 'startup')
+        TEAPTracker.session_filepath = os.path.join(temp_dir, 'session.dat')
+        TEAPTracker.history_filepath = os.path.join(temp_dir, 'sync_history.db')
+        write_cohort(TEAPTracker.cache_location, 1, seed=args.seed)
+
+        def wait_for_snapshot():
+            # The analytics are worked out in the background, the views are only updated once the event loop runs
+            window.analytics_worker.wait()
+            app.processEvents()
+
+        start = time.perf_counter()
+        window = TEAPTracker.MainWindow()
+        wait_for_snapshot()
+        results['cold_start/main_window'] = summarise_timings([time.perf_counter() - start])
+
+        # Make sure the optional parts of the tracking plot are drawn as well
+        window.training_plan['competencies'] = ['1.1.1.1', '2.2.1.1', '4.1.2.1', '5.3.1.1']
+        window.ui.checkBoxShowPlan.setChecked(True)
+        window.ui.checkBoxShowExtrapolation.setChecked(True)
+
+        for name in ('update_category_overview_plot', 'update_overview_plot', 'update_tracking_plot',
+                     'update_models_from_data', 'update_misc_stats'):
+            results[f'redraw/{name}'] = time_function(getattr(window, name), args.repeats)
+
+        def load():
+            window.new_data_loaded()
+            wait_for_snapshot()
+
+        results['redraw/new_data_loaded'] = time_function(load, args.repeats)
+        results['redraw/compute_snapshot'] = time_function(lambda: analytics.compute_snapshot(window.data),
+                                                           args.repeats)
+
+        SaveFileDialog.filepath = os.path.join(temp_dir, 'export.xlsx')
+        results['export/export_official_spreadsheet'] = time_function(window.export_official_spreadsheet,
+                                                                      args.repeats)
+
+        for size in args.sizes:
+            # Whole cohort benchmarks get slow quickly, so only repeat the small ones
+            repeats = args.repeats if size <= 100 else 1
+            cohort_location = os.path.join(temp_dir, f'cohort_{size}')
+            filepaths = write_cohort(cohort_location, size, seed=args.seed)
+            cohort = []
+            for filepath in filepaths:
+                with open(filepath, 'r') as f:
+                    cohort.append(json.load(f))
+
+            results[f'generate_tracking_data/registrars={size}'] = time_function(
+                lambda: [window.generate_tracking_data(data) for data in cohort], repeats, warmup=0)
+
+            def search():
+                window.loaded_data = {}
+                window.ui.comboBoxCachedData.clear()
+                window.search_for_cached_data()
+
+            TEAPTracker.cache_location = cohort_location
+            results[f'search_for_cached_data/registrars={size}'] = time_function(search, repeats, warmup=0)
+
+            results[f'export/export_cohort/registrars={size}'] = time_function(
+                lambda: spreadsheet_export.export_cohort(filepaths, os.path.join(temp_dir, f'export_{size}')),
+                repeats, warmup=0)
+
+        window.close()
+
+    print_results(results)
+    if args.output:
+        write_results(results, args.output, 'analytics')
+    if args.compare:
+        regressions = compare_results(args.compare, results)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,142 @@
+# Benchmarks the COMET scraper end to end against the local mock server, and the parsing of each type of page. With
+# synthetic pages, the web service client (comet_webservice.py) is benchmarked against the mock web service too
+#
+# Example:
+#   python benchmarks/bench_comet_sync.py --concurrency 1 2 4 8 --latency 0.05 --output sync.json
+# Python standard library is PSF licenced
+import argparse
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import common
+from common import compare_results, print_results, summarise_timings, time_function, write_results
+from mock_comet_server import MockCometServer, MockWebService, load_recorded_pages, synthetic_pages
+from synthetic_data import make_registrar
+
+import requests
+from PyQt5.QtCore import QCoreApplication
+from GetDataFromComet import GetDataFromCometThread, parse_dashboard_page, parse_profile_page, \
+    parse_grade_report_page, parse_competency_page
+from comet_webservice import CometWebServiceThread
+
+
+def benchmark_parsing(pages: dict, repeats: int):
+    results = {}
+    results['parse/dashboard'] = time_function(lambda: parse_dashboard_page(pages['dashboard']), repeats)
+    results['parse/profile'] = time_function(lambda: parse_profile_page(pages['profile']), repeats)
+
+    def parse_grade_reports():
+        comp_data = {'competencies': [], 'points': {'modules': defaultdict(dict), 'summary': defaultdict(dict)}}
+        for key in grade_report_keys:
+            parse_grade_report_page(pages[key], comp_data)
+        return comp_data
+
+    grade_report_keys = [key for key in pages if key.startswith('grade_report_')]
+    timings = time_function(parse_grade_reports, repeats)
+    results['parse/grade_report (per page)'] = {k: v / len(grade_report_keys) if isinstance(v, float) else v
+                                                for k, v in timings.items()}
+
+    competencies = parse_grade_reports()['competencies']
+    assign_pages = []
+    for competency in competencies:
+        key = 'assign_' + competency['url'].split('id=')[-1]
+        if key in pages:
+            assign_pages.append((pages[key], dict(competency)))
+
+    timings = time_function(lambda: [parse_competency_page(html, competency) for html, competency in assign_pages],
+                            repeats)
+    results['parse/assignment (per page)'] = {k: v / len(assign_pages) if isinstance(v, float) else v
+                                              for k, v in timings.items()}
+    return results
+
+
+def run_sync(server: MockCometServer, concurrency: int, token: str = None):
+    """
+    Runs one full sync against the mock server on the current thread
+    :param token: Sync through the web service with this token, rather than scraping the pages
+    :return: The competency data (or None if the sync failed) and a dictionary of measurements
+    """
+    if token is not None:
+        thread = CometWebServiceThread(requests.Session(), token, delay_between_requests=0, base_url=server.url,
+                                       retry_delay=0, retry_backoff=0.01)
+    else:
+        thread = GetDataFromCometThread(requests.Session(), delay_between_requests=0, base_url=server.url,
+                                        retry_delay=0, retry_backoff=0.01, concurrent_requests=concurrency)
+    result = []
+    thread.finished.connect(result.append)
+
+    server.reset_counts()
+    tracemalloc.start()
+    start = time.perf_counter()
+    # Calling run directly (rather than start) keeps the whole sync on this thread so it is easy to time
+    thread.run()
+    elapsed = time.perf_counter() - start
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result[0], {'seconds': elapsed, 'requests': server.request_count, 'errors': server.error_count,
+                       'requests_per_second': server.request_count / elapsed,
+                       'peak_memory_mb': peak_memory / 1024 ** 2}
+
+
+def check_sync_result(comp_data, registrar):
+    # Make sure the scraper actually understood the pages, otherwise the timings mean nothing
+    if comp_data is None:
+        raise RuntimeError('Sync failed against the mock server')
+    expected = {c['name']: c for c in registrar['competencies']}
+    for competency in comp_data['competencies']:
+        reference = expected[competency['name']]
+        if competency['submission_status'] != reference['submission_status'] or \
+                competency['grading_status'] != reference['grading_status']:
+            raise RuntimeError(f"Status mismatch for {competency['name']}")
+    if len(comp_data['competencies']) != len(expected):
+        raise RuntimeError('Scraped a different number of competencies than the mock server holds')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the COMET scraper against a local mock server')
+    parser.add_argument('--pages', help='Directory of recorded COMET pages, otherwise synthetic pages are used')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='Numbers of concurrent competency page requests to benchmark')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of delay the server adds per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra server delay per request')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests the server fails')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Compare against a previous JSON results file')
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv)
+
+    registrar = make_registrar(0, seed=args.seed)
+    pages = load_recorded_pages(args.pages) if args.pages else synthetic_pages(registrar)
+
+    results = benchmark_parsing(pages, args.repeats)
+
+    webservice = None if args.pages else MockWebService(registrar)
+    with MockCometServer(pages, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                         seed=args.seed, webservice=webservice) as server:
+        syncs = [(f'sync/concurrency={concurrency}', concurrency, None) for concurrency in args.concurrency]
+        if webservice is not None:
+            syncs.append(('sync/webservice', 1, webservice.token))
+        for name, concurrency, token in syncs:
+            runs = []
+            for _ in range(args.repeats):
+                comp_data, measurements = run_sync(server, concurrency, token)
+                if not args.pages:
+                    check_sync_result(comp_data, registrar)
+                runs.append(measurements)
+            result = summarise_timings([run['seconds'] for run in runs])
+            for key in ('requests', 'errors', 'requests_per_second', 'peak_memory_mb'):
+                result[key] = max(run[key] for run in runs)
+            results[name] = result
+
+    print_results(results)
+    if args.output:
+        write_results(results, args.output, 'comet_sync')
+    if args.compare:
+        regressions = compare_results(args.compare, results)
+        sys.exit(1 if regressions else 0)
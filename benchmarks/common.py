@@ -0,0 +1,102 @@
+# Shared helpers for the benchmark scripts in this folder
+# Python standard library is PSF licenced
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# The benchmarks are run as scripts (e.g. python benchmarks/bench_analytics.py), so make sure the main program modules
+# can be imported, and that relative paths like TEAPCTGData.csv resolve the same way they do for the program itself
+repo_root = Path(__file__).resolve().parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+
+
+def chdir_to_repo_root():
+    os.chdir(repo_root)
+
+
+def time_function(function, repeats=5, warmup=1):
+    """
+    Times a function call a number of times
+    :param function: Function to call with no arguments
+    :param repeats: Number of timed calls
+    :param warmup: Number of untimed calls made first
+    :return: Dictionary of timing statistics in seconds
+    """
+    for _ in range(warmup):
+        function()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return summarise_timings(timings)
+
+
+def summarise_timings(timings):
+    return {'min': min(timings), 'median': statistics.median(timings), 'mean': statistics.mean(timings),
+            'max': max(timings), 'repeats': len(timings)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=repo_root, capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def write_results(results: dict, filepath: str, suite: str):
+    """
+    Writes benchmark results as JSON, along with enough metadata to compare runs across commits
+    :param results: Dictionary of benchmark name to a dictionary of measurements
+    :param filepath: JSON file to write
+    :param suite: Name of the benchmark suite
+    """
+    output = {'suite': suite,
+              'commit': git_commit(),
+              'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'results': results}
+    with open(filepath, 'w') as f:
+        json.dump(output, f, indent=4)
+
+
+def compare_results(old_filepath: str, new_results: dict, key='median', threshold=1.2):
+    """
+    Compares new results against a previous run, printing every benchmark and flagging those that got slower
+    :param old_filepath: JSON file written by write_results for the baseline run
+    :param new_results: Results dictionary of the current run
+    :param key: Which timing statistic to compare
+    :param threshold: Ratio of new to old time above which a benchmark counts as a regression
+    :return: List of names of benchmarks that regressed
+    """
+    with open(old_filepath, 'r') as f:
+        old_results = json.load(f)['results']
+
+    regressions = []
+    for name, new in new_results.items():
+        old = old_results.get(name)
+        if old is None or key not in old or key not in new or old[key] == 0:
+            continue
+        ratio = new[key] / old[key]
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  <-- regression'
+        print(f'{name:60s} {old[key]:10.4f} -> {new[key]:10.4f} ({ratio:5.2f}x){flag}')
+    return regressions
+
+
+def print_results(results: dict, key='median'):
+    for name, result in results.items():
+        values = ', '.join(f'{k}={v:.4f}' if isinstance(v, float) else f'{k}={v}' for k, v in result.items()
+                           if k != key)
+        print(f'{name:60s} {result.get(key, float("nan")):10.4f}  {values}')
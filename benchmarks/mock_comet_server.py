@@ -0,0 +1,374 @@
+# A local stand-in for COMET, serving recorded (or synthetic) dashboard, profile, grade report and assignment pages so
+# the scraper in GetDataFromComet.py can be run and benchmarked offline. It can also answer the web service functions
+# comet_webservice.py uses
+# Python standard library is PSF licenced
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import parse
+
+import common  # Sets up the import path for the main program modules
+from GetDataFromComet import comet_url, status_ids
+from comet_summary import category_summaries
+from comet_webservice import webservice_path
+
+page_date_format = '%A, %d %B %Y, %I:%M %p'
+
+
+def page_key_for_path(path: str):
+    """
+    Maps a request path (including the query) to the name of the page to serve, or None if it isn't a COMET page
+    """
+    url = parse.urlparse(path)
+    query = parse.parse_qs(url.query)
+    if url.path == '/totara/dashboard/index.php':
+        return 'dashboard'
+    elif url.path == '/user/profile.php':
+        return 'profile'
+    elif url.path == '/grade/report/user/index.php' and 'id' in query:
+        return f"grade_report_{query['id'][0]}"
+    elif url.path == '/mod/assign/view.php' and 'id' in query:
+        return f"assign_{query['id'][0]}"
+    return None
+
+
+def load_recorded_pages(directory: str):
+    """
+    Loads pages saved from COMET. Each file should be named after its page key (see page_key_for_path), e.g.
+    dashboard.html, profile.html, grade_report_325.html, assign_12345.html
+    """
+    pages = {}
+    for filename in os.listdir(directory):
+        if filename.endswith('.html'):
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                pages[filename[:-5]] = f.read()
+    return pages
+
+
+def save_recorded_pages(pages: dict, directory: str):
+    os.makedirs(directory, exist_ok=True)
+    for key, html in pages.items():
+        with open(os.path.join(directory, f'{key}.html'), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+
+def _page_date(date_str):
+    if date_str is None:
+        return '-'
+    return datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').strftime(page_date_format)
+
+
+def synthetic_pages(registrar: dict):
+    """
+    Builds a full set of COMET pages for a registrar record (e.g. from synthetic_data.make_registrar), laid out the
+    same way as the real pages as far as the parsing in GetDataFromComet.py is concerned
+    """
+    profile = registrar['profile_data']
+    user_id = profile['user_id']
+    pages = {'dashboard': f'<html><body><nav><a href="{comet_url}/my/">Home</a>'
+                          f'<a href="{comet_url}/user/profile.php?id={user_id}">Profile</a></nav></body></html>'}
+
+    start_date = datetime.strptime(profile['start_date'], '%Y-%m-%d %H:%M:%S')
+    end_date = start_date.replace(year=start_date.year + int(profile['program_length']), day=min(start_date.day, 28))
+    pages['profile'] = (f'<html><body><div class="page-header-headings"><h1>{profile["name"]}</h1></div>'
+                        f'<dl><dt>Program Start</dt><dd>{start_date.strftime("%d %B %Y")}</dd></dl>'
+                        f'<dl><dt>Expected Program End Date</dt><dd>{end_date.strftime("%d %B %Y")}</dd></dl>'
+                        f'</body></html>')
+
+    for module_index, status_id in enumerate(status_ids):
+        module = str(module_index + 1)
+        rows = []
+        competencies = [competency for competency in registrar['competencies']
+                        if competency['name'].split('.')[0] == module]
+        points = category_summaries(competencies)
+        for competency in competencies:
+            score = '-' if competency['grading_status'] != 'Graded' else f"{competency['score']:.2f}"
+            feedback = '' if competency['feedback'] == 'N/A' else competency['feedback']
+            rows.append(f'<tr><th class="column-itemname"><a href="{competency["url"]}">'
+                        f'<span class="sr-only">Assignment</span>{competency["name"]}</a></th>\n'
+                        f'<td>{score}</td>\n<td>{feedback}</td></tr>')
+        for category, mean in points['modules'][module].items():
+            rows.append(f'<tr><th>Mean of grades{category} total</th>\n<td>{mean:.2f}</td></tr>')
+            rows.append(f'<tr><th>Weighted mean of grades. Include empty grades.Competency {category}</th>\n'
+                        f"<td>{points['summary'][module][category]:.2f}</td></tr>")
+        rows.append(f'<tr><th>NaturalCourse total</th>\n<td>{len(rows)}</td></tr>')
+        pages[f'grade_report_{status_id}'] = ('<html><body><table class="user-grade"><thead><tr><th>Grade item</th>'
+                                              '<th>Grade</th><th>Feedback</th></tr></thead><tbody>'
+                                              + '\n'.join(rows) + '</tbody></table></body></html>')
+
+    for competency in registrar['competencies']:
+        cmid = parse.parse_qs(parse.urlparse(competency['url']).query)['id'][0]
+        tables = []
+        # Module 6 pages have text rather than a table for the description
+        if not competency['name'].startswith('6'):
+            tables.append(f'<table><tbody><tr><td>{competency["name"]} description</td></tr></tbody></table>')
+        tables.append(f'<table><tbody>'
+                      f'<tr><th>Submission status</th>\n<td>{competency["submission_status"]}</td></tr>'
+                      f'<tr><th>Grading status</th>\n<td>{competency["grading_status"]}</td></tr>'
+                      f'<tr><th>Last modified</th>\n<td>{_page_date(competency["last_modify_date"])}</td></tr>'
+                      f'</tbody></table>')
+        if competency['grading_status'] == 'Graded':
+            tables.append(f'<table><tbody>'
+                          f'<tr><th>Grade</th>\n<td>{competency["score"]:.2f} / 1.00</td></tr>'
+                          f'<tr><th>Graded on</th>\n<td>{_page_date(competency["grade_date"])}</td></tr>'
+                          f'<tr><th>Graded by</th>\n<td>{competency["assessor"]}</td></tr>'
+                          f'</tbody></table>')
+        pages[f'assign_{cmid}'] = '<html><body>' + ''.join(tables) + '</body></html>'
+
+    return pages
+
+
+def _timestamp(date_str):
+    return int(datetime.strptime(date_str, '%Y-%m-%d %H:%M:%S').timestamp()) if date_str is not None else 0
+
+
+class MockWebService:
+    """
+    Answers the web service functions comet_webservice.py uses, from a registrar record (e.g. from
+    synthetic_data.make_registrar)
+    :param token: The only token accepted
+    :param can_list_submissions: False acts like a token that can't use mod_assign_get_submissions for the registrar,
+    so each assignment has to be asked about with mod_assign_get_submission_status
+    """
+
+    def __init__(self, registrar: dict, token='mock-token', can_list_submissions=True):
+        self.token = token
+        self.can_list_submissions = can_list_submissions
+        self.calls = {}
+        profile = registrar['profile_data']
+        self.user_id = int(profile['user_id'])
+
+        start_date = datetime.strptime(profile['start_date'], '%Y-%m-%d %H:%M:%S')
+        end_date = start_date.replace(year=start_date.year + int(profile['program_length']),
+                                      day=min(start_date.day, 28))
+        self.users = {self.user_id: {'id': self.user_id, 'fullname': profile['name'], 'customfields': [
+            {'name': 'Program Start', 'shortname': 'programstart', 'type': 'datetime',
+             'value': str(int(start_date.timestamp()))},
+            {'name': 'Expected Program End Date', 'shortname': 'programend', 'type': 'datetime',
+             'value': str(int(end_date.timestamp()))}]}}
+
+        # Assignment instance id to its grade item, submission and grade
+        self.assignments = {}
+        self.grade_items = {status_id: [] for status_id in status_ids}
+        for competency in registrar['competencies']:
+            cmid = int(parse.parse_qs(parse.urlparse(competency['url']).query)['id'][0])
+            assignment_id = cmid + 100000
+            graded = competency['grading_status'] == 'Graded'
+            grader = None
+            if graded and competency['assessor'] not in (None, '-'):
+                grader = 5000 + int(competency['assessor'].split(' ')[-1])
+                self.users[grader] = {'id': grader, 'fullname': competency['assessor'], 'customfields': []}
+            status = {'Submitted': 'submitted', 'Draft (not submitted)': 'draft'}.get(
+                competency['submission_status'], 'new')
+            self.assignments[assignment_id] = {
+                'submission': {'id': assignment_id, 'userid': self.user_id, 'status': status,
+                               'timemodified': _timestamp(competency['last_modify_date']),
+                               'gradingstatus': 'graded' if graded else 'notgraded'},
+                'grade': {'userid': self.user_id, 'grade': f"{competency['score']:.5f}" if graded else '-1.00000',
+                          'timemodified': _timestamp(competency['grade_date']), 'grader': grader or -1}}
+            feedback = '' if competency['feedback'] == 'N/A' else f"<p>{competency['feedback']}</p>"
+            self.grade_items[status_ids[int(competency['name'].split('.')[0]) - 1]].append(
+                {'itemname': competency['name'], 'itemtype': 'mod', 'itemmodule': 'assign',
+                 'iteminstance': assignment_id, 'cmid': cmid, 'grademax': 1,
+                 'graderaw': competency['score'] if graded else None, 'feedback': feedback,
+                 'gradedategraded': _timestamp(competency['grade_date']) or None})
+
+    @staticmethod
+    def _list(parameters: dict, name: str):
+        values = [(int(key[len(name) + 1:-1]), value) for key, value in parameters.items()
+                  if key.startswith(f'{name}[')]
+        return [value for _, value in sorted(values)]
+
+    def call(self, parameters: dict):
+        """
+        :param parameters: Decoded form or query parameters of the request
+        :return: The result to send back as JSON
+        """
+        function = parameters.get('wsfunction')
+        self.calls[function] = self.calls.get(function, 0) + 1
+        if parameters.get('wstoken') != self.token:
+            return {'exception': 'moodle_exception', 'errorcode': 'invalidtoken',
+                    'message': 'Invalid token - token not found'}
+
+        if function == 'core_webservice_get_site_info':
+            return {'userid': self.user_id, 'fullname': self.users[self.user_id]['fullname'], 'sitename': 'COMET'}
+        if function == 'core_user_get_users_by_field':
+            return [self.users[int(value)] for value in self._list(parameters, 'values') if int(value) in self.users]
+        if function == 'gradereport_user_get_grade_items':
+            return {'usergrades': [{'courseid': int(parameters['courseid']), 'userid': self.user_id,
+                                    'gradeitems': self.grade_items.get(parameters['courseid'], [])}], 'warnings': []}
+        if function in ('mod_assign_get_submissions', 'mod_assign_get_grades'):
+            assignment_ids = [int(value) for value in self._list(parameters, 'assignmentids')]
+            if function == 'mod_assign_get_grades':
+                return {'assignments': [{'assignmentid': assignment_id,
+                                         'grades': [self.assignments[assignment_id]['grade']]}
+                                        for assignment_id in assignment_ids if assignment_id in self.assignments],
+                        'warnings': []}
+            return {'assignments': [{'assignmentid': assignment_id,
+                                     'submissions': [self.assignments[assignment_id]['submission']]
+                                     if self.can_list_submissions else []}
+                                    for assignment_id in assignment_ids if assignment_id in self.assignments],
+                    'warnings': []}
+        if function == 'mod_assign_get_submission_status':
+            assignment = self.assignments[int(parameters['assignid'])]
+            status = {'lastattempt': {'submission': assignment['submission'],
+                                      'gradingstatus': assignment['submission']['gradingstatus']}, 'warnings': []}
+            if assignment['submission']['gradingstatus'] == 'graded':
+                status['feedback'] = {'grade': assignment['grade']}
+            return status
+        return {'exception': 'webservice_access_exception', 'errorcode': 'accessexception',
+                'message': f'Access control exception ({function})'}
+
+
+class MockCometRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.respond()
+
+    def do_HEAD(self):
+        # Used by session_store.is_logged_in, the mock is always logged in
+        key = page_key_for_path(self.path)
+        self.send_response(200 if key in self.server.mock.pages else 404)
+        self.end_headers()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self.respond(self.rfile.read(length).decode('utf-8'))
+
+    def respond(self, body: str = ''):
+        mock = self.server.mock
+        with mock.lock:
+            mock.request_count += 1
+            inject_error = mock.error_rate > 0 and mock.random.random() < mock.error_rate
+            delay = mock.latency + (mock.random.uniform(0, mock.jitter) if mock.jitter > 0 else 0)
+
+        if delay > 0:
+            time.sleep(delay)
+
+        if inject_error:
+            with mock.lock:
+                mock.error_count += 1
+            self.send_error(503, 'Injected error')
+            return
+
+        url = parse.urlparse(self.path)
+        if url.path == webservice_path and mock.webservice is not None:
+            parameters = dict(parse.parse_qsl(url.query))
+            parameters.update(parse.parse_qsl(body))
+            with mock.lock:
+                result = mock.webservice.call(parameters)
+            self.send_content(json.dumps(result).encode('utf-8'), 'application/json')
+            return
+
+        key = page_key_for_path(self.path)
+        if key is None or key not in mock.pages:
+            self.send_error(404, 'Not found')
+            return
+
+        # Links in the pages point at the real COMET, so point them back at this server
+        self.send_content(mock.pages[key].replace(comet_url, mock.url).encode('utf-8'), 'text/html')
+
+    def send_content(self, encoded: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+
+class MockCometServer:
+    """
+    Serves COMET pages on localhost from a background thread. Can be used as a context manager:
+
+        with MockCometServer(pages, latency=0.05) as server:
+            thread = GetDataFromCometThread(session, delay_between_requests=0, base_url=server.url)
+
+    :param pages: Dictionary of page key (see page_key_for_path) to HTML
+    :param latency: Seconds to wait before answering every request, to simulate a slow site
+    :param jitter: Extra random delay of up to this many seconds per request
+    :param error_rate: Fraction of requests that are answered with a 503 error instead of the page
+    :param webservice: MockWebService to answer web service requests with, otherwise they aren't found
+    """
+
+    def __init__(self, pages: dict, latency=0.0, jitter=0.0, error_rate=0.0, seed=0, host='127.0.0.1', port=0,
+                 webservice: MockWebService = None):
+        self.pages = pages
+        self.webservice = webservice
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.error_count = 0
+        self.httpd = ThreadingHTTPServer((host, port), MockCometRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[0:2]
+        return f'http://{host}:{port}'
+
+    def reset_counts(self):
+        with self.lock:
+            self.request_count = 0
+            self.error_count = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+if __name__ == '__main__':
+    import argparse
+    from synthetic_data import make_registrar
+
+    parser = argparse.ArgumentParser(description='Run a local stand-in COMET server')
+    parser.add_argument('--pages', help='Directory of recorded pages to serve, otherwise synthetic pages are used')
+    parser.add_argument('--record', help='Write the synthetic pages to this directory and exit')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds of delay added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra delay of up to this many seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 503')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--token', default='mock-token', help='Web service token to accept for the synthetic registrar')
+    args = parser.parse_args()
+
+    webservice = None
+    if args.pages:
+        pages = load_recorded_pages(args.pages)
+    else:
+        registrar = make_registrar(0, seed=args.seed)
+        pages = synthetic_pages(registrar)
+        webservice = MockWebService(registrar, args.token)
+
+    if args.record:
+        save_recorded_pages(pages, args.record)
+    else:
+        server = MockCometServer(pages, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                 seed=args.seed, port=args.port, webservice=webservice)
+        print(f'Serving {len(pages)} pages on {server.url}')
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            server.httpd.server_close()
@@ -0,0 +1,95 @@
+# Generates synthetic registrar records in the same shape as the JSON files saved in cached_data, so the benchmarks
+# (and the mock COMET server) don't need anyone's real data
+# Python standard library is PSF licenced
+import json
+import os
+import random
+from datetime import datetime, timedelta
+
+import common  # Sets up the import path for the main program modules
+from comet_summary import category_summaries
+from GetDataFromComet import comet_url
+from teap_data import spreadsheet_cells, teap_categories
+
+date_format = '%Y-%m-%d %H:%M:%S'
+
+
+def make_registrar(index: int, seed: int = 0, now: datetime = None):
+    """
+    Makes one synthetic registrar record
+    :param index: Index of the registrar, used for the user id and name
+    :param seed: Random seed, the same index and seed always give the same registrar
+    :param now: Date to treat as today, defaults to the current time
+    :return: Dictionary in the cached_data JSON shape
+    """
+    rng = random.Random(seed * 100003 + index)
+    if now is None:
+        now = datetime.now().replace(microsecond=0)
+
+    program_length = rng.choice((3, 4, 5))
+    start_date = (now - timedelta(days=rng.randint(60, 365 * program_length))).replace(hour=0, minute=0, second=0)
+    elapsed_days = (now - start_date).days
+    progress = min(elapsed_days / (365 * program_length), 1)
+
+    competencies = []
+    cmid = 10000
+    for category_level in spreadsheet_cells['competencies']:
+        module, category, level = category_level.split('.')
+        for item in range(1, rng.choice((1, 1, 2, 3)) + 1):
+            cmid += 1
+            name = f'{category_level}.{item} {teap_categories[module][category]} level {level} item {item}'
+            competency = {'name': name, 'score': 0, 'feedback': 'N/A',
+                          'url': f'{comet_url}/mod/assign/view.php?id={cmid}',
+                          'submission_status': 'No attempt', 'grading_status': 'Not graded',
+                          'last_modify_date': None, 'grade_date': None, 'assessor': '-'}
+
+            roll = rng.random()
+            if roll < progress * 0.95:
+                modify_date = start_date + timedelta(days=rng.randint(0, elapsed_days), hours=rng.randint(8, 17))
+                modify_date = min(modify_date, now)
+                competency['submission_status'] = 'Submitted'
+                competency['last_modify_date'] = modify_date.strftime(date_format)
+                if roll < progress * 0.8:
+                    grade_date = min(modify_date + timedelta(days=rng.randint(1, 60)), now)
+                    competency['grading_status'] = 'Graded'
+                    competency['score'] = 1.0 if rng.random() < 0.9 else 0.5
+                    competency['grade_date'] = grade_date.strftime(date_format)
+                    competency['assessor'] = f'Supervisor {rng.randint(1, 20)}'
+                    competency['feedback'] = f'Good work on {category_level}.{item}, ' * rng.randint(1, 8)
+            competencies.append(competency)
+
+    points = category_summaries(competencies)
+
+    return {'competencies': competencies,
+            'profile_data': {'user_id': str(1000 + index), 'name': f'Registrar {index}',
+                             'start_date': start_date.strftime(date_format), 'program_length': program_length},
+            'points': {key: dict(value) for key, value in points.items()},
+            'training_plan': {'competencies': [], 'notes': {}}}
+
+
+def write_cohort(directory: str, number_of_registrars: int, seed: int = 0):
+    """
+    Writes a cohort of synthetic registrars to a directory, in the same way the program saves to cached_data
+    :return: List of written file paths
+    """
+    os.makedirs(directory, exist_ok=True)
+    filepaths = []
+    now = datetime.now().replace(microsecond=0)
+    for index in range(number_of_registrars):
+        registrar = make_registrar(index, seed=seed, now=now)
+        filepath = os.path.join(directory, f"{registrar['profile_data']['user_id']}.json")
+        with open(filepath, 'w') as f:
+            json.dump(registrar, f, default=str, indent=4)
+        filepaths.append(filepath)
+    return filepaths
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write synthetic registrar data in the cached_data format')
+    parser.add_argument('directory')
+    parser.add_argument('-n', '--number', type=int, default=10, help='Number of registrars')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_cohort(args.directory, args.number, args.seed)
@@ -0,0 +1,199 @@
+# COMET's own totals for each category, from the "Weighted mean of grades" rows of the grade reports, which
+# GetDataFromComet.py keeps in data['points']['summary'] as a percentage of the category, keyed by module then
+# category (e.g. summary['1']['1.2']). They're worth the category's points (see tracking_data.category_weights), so:
+#   - Each registrar's current total can be listed without building their tracking data, which is most of the time
+#     taken for a cohort
+#   - They can be checked against our own weighting of the competency scores, to find registrars where the two don't
+#     agree, e.g. the weights have changed in COMET, or a competency has been moved between levels
+#
+# Command line usage, listing the totals for a cohort and checking them:
+#   python comet_summary.py cached_data --check
+# Python standard library is PSF licenced
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+
+from tracking_data import category_weights, generate_tracking_data, level_weights, \
+    modules_without_standard_level_weights, standard_level_weights
+
+# Every category, in the order of the columns in the arrays below
+categories = sorted(category_weights)
+category_points = np.array([category_weights[category] for category in categories])
+_category_index = {category: index for index, category in enumerate(categories)}
+_modules = np.array([module for module, _ in categories])
+
+# Percentage points COMET's totals can be off by before they're flagged, as they're rounded to two decimal places
+default_tolerance = 0.5
+
+
+def _category(key: str):
+    try:
+        module, category = key.split('.')
+        return int(module), int(category)
+    except ValueError:
+        return None
+
+
+def competency_category(name: str):
+    """
+    :return: (module, category) of a competency from its name, e.g. (1, 2) for '1.2.3.1 ...', or None if it isn't in one
+    """
+    return _category('.'.join(name.split(' ')[0].split('.')[0:2]))
+
+
+def level_weight(module: int, category: int, level: int):
+    """
+    :return: Share of its category's points a level is worth, the same as tracking_data uses
+    """
+    if (module, category, level) in level_weights:
+        return level_weights[(module, category, level)]
+    if module in modules_without_standard_level_weights:
+        return 1
+    return standard_level_weights.get(level, 1)
+
+
+def category_summaries(competencies):
+    """
+    Works out the category rows of the grade reports from the competency scores, for when they aren't available (e.g.
+    the web service doesn't have them)
+    :param competencies: List in the same format as data['competencies']
+    :return: Dictionary of 'modules' (the "Mean of grades" rows, the mean score of each category's competencies) and
+    'summary' (the "Weighted mean of grades" rows, with each level's mean score weighted), as percentages keyed by
+    module then category
+    """
+    scores = defaultdict(lambda: defaultdict(list))
+    for competency in competencies:
+        parts = competency['name'].split(' ')[0].split('.')
+        scores[(parts[0], '.'.join(parts[0:2]))][parts[2] if len(parts) > 2 else ''].append(competency['score'])
+
+    points = {'modules': defaultdict(dict), 'summary': defaultdict(dict)}
+    for (module, category), levels in scores.items():
+        category_scores = [score for level_scores in levels.values() for score in level_scores]
+        points['modules'][module][category] = sum(category_scores) * 100 / len(category_scores)
+        key = _category(category)
+        points['summary'][module][category] = sum(
+            (level_weight(*key, int(level)) if key is not None and level.isdigit() else 1) *
+            sum(level_scores) * 100 / len(level_scores) for level, level_scores in levels.items())
+    return points
+
+
+def category_percentages(data: dict):
+    """
+    :param data: Registrar data, in the same format as the JSON files in cached_data
+    :return: Array of COMET's percentage for each category, in the order of categories, NaN where there isn't one
+    """
+    percentages = np.full(len(categories), np.nan)
+    summary = data.get('points', {}).get('summary', {})
+    for module_summary in summary.values():
+        for key, percentage in module_summary.items():
+            index = _category_index.get(_category(key))
+            if index is not None and percentage is not None:
+                percentages[index] = percentage
+    return percentages
+
+
+def module_points(data: dict):
+    """
+    :return: Dictionary of module number to COMET's total points for it, only for the modules COMET has the total of
+    every category for
+    """
+    points = category_percentages(data) / 100 * category_points
+    return {int(module): float(points[_modules == module].sum()) for module in np.unique(_modules)
+            if not np.any(np.isnan(points[_modules == module]))}
+
+
+def total_points(data: dict):
+    """
+    :return: COMET's total points, or None if it doesn't have every category
+    """
+    points = category_percentages(data) / 100 * category_points
+    return None if np.any(np.isnan(points)) else float(points.sum())
+
+
+def recomputed_percentages(tracking_dfs):
+    """
+    Our own percentage for each category, from the weighted competency scores, for any number of registrars at once
+    :param tracking_dfs: List of dataframes from tracking_data.generate_tracking_data
+    :return: Array of shape (registrars, categories)
+    """
+    percentages = np.zeros((len(tracking_dfs), len(categories)))
+    if len(tracking_dfs) == 0:
+        return percentages
+    combined = pd.concat(tracking_dfs, keys=range(len(tracking_dfs)), names=['registrar', None])
+    points = combined.groupby(['registrar', 'module', 'category'])['weighted_score'].sum()
+    index = np.array([_category_index.get((module, category), -1)
+                      for module, category in zip(points.index.get_level_values('module'),
+                                                  points.index.get_level_values('category'))], dtype=int)
+    known = index >= 0
+    registrars = points.index.get_level_values('registrar').to_numpy()
+    percentages[registrars[known], index[known]] = points.to_numpy()[known]
+    return percentages / category_points * 100
+
+
+def find_mismatches(comet_percentages, our_percentages, tolerance: float = default_tolerance):
+    """
+    :param comet_percentages: Array of shape (registrars, categories), see category_percentages
+    :param our_percentages: Array of the same shape, see recomputed_percentages
+    :return: List of (registrar index, (module, category), COMET's percentage, ours) for the categories that differ by
+    more than the tolerance. Categories COMET doesn't have a total for are skipped
+    """
+    difference = np.abs(np.asarray(comet_percentages) - np.asarray(our_percentages))
+    registrars, indices = np.nonzero(np.nan_to_num(difference, nan=0) > tolerance)
+    return [(int(registrar), categories[index], float(comet_percentages[registrar, index]),
+             float(our_percentages[registrar, index])) for registrar, index in zip(registrars, indices)]
+
+
+def check_cohort(cohort, tolerance: float = default_tolerance):
+    """
+    :param cohort: List of registrar data
+    :return: See find_mismatches
+    """
+    comet = np.array([category_percentages(data) for data in cohort]).reshape(len(cohort), len(categories))
+    ours = recomputed_percentages([generate_tracking_data(data) for data in cohort])
+    return find_mismatches(comet, ours, tolerance)
+
+
+def clear_categories(data: dict, changed_categories):
+    """
+    Removes COMET's totals for categories whose scores have been changed some other way (e.g. by a gradebook import),
+    as they're out of date until the grade reports are downloaded again
+    :param changed_categories: (module, category) of each
+    """
+    summary = data.get('points', {}).get('summary', {})
+    for module_summary in summary.values():
+        for key in [key for key in module_summary if _category(key) in changed_categories]:
+            del module_summary[key]
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+    import os
+
+    import registrar_files
+
+    parser = argparse.ArgumentParser(description="List each registrar's total points from COMET's grade reports")
+    parser.add_argument('data_directory', help='Directory of registrar JSON files, e.g. cached_data')
+    parser.add_argument('--check', action='store_true',
+                        help="Flag categories where COMET's totals don't match the weighted competency scores")
+    parser.add_argument('--tolerance', type=float, default=default_tolerance, help='In percentage points')
+    args = parser.parse_args()
+
+    cohort = [registrar_files.load(filepath)
+              for filepath in sorted(glob.glob(os.path.join(args.data_directory, '*.json')))]
+    print(f"{'Registrar':30} {'Total':>9}")
+    for data in cohort:
+        total = total_points(data)
+        if total is None:
+            # Not downloaded from the grade reports, so it's worked out the slow way
+            total = float(generate_tracking_data(data)['weighted_score'].sum())
+        print(f"{data['profile_data']['name'][0:30]:30} {total:9.1f}")
+
+    if args.check:
+        mismatches = check_cohort(cohort, args.tolerance)
+        for registrar, (module, category), comet, ours in mismatches:
+            print(f"{cohort[registrar]['profile_data']['name']}: {module}.{category} is {comet:.2f}% in COMET, "
+                  f"{ours:.2f}% from the competency scores")
+        print(f'{len(mismatches)} categories differ, for '
+              f'{len(set(registrar for registrar, _, _, _ in mismatches))} of {len(cohort)} registrars')
@@ -0,0 +1,250 @@
+# Gets a registrars data through the COMET (Totara/Moodle) web service REST API rather than scraping the HTML pages,
+# for when a web service token is available (COMET > Preferences > Security keys). The results are the same shape as
+# GetDataFromCometThread's, but:
+#   - The web service answers with compact JSON, so nothing depends on the layout of the pages (e.g. module 6
+#     assignment pages having one less table)
+#   - The submission and grading details of many assignments are fetched in each call, rather than a page per
+#     competency, so a full sync is a few dozen requests rather than a few hundred
+#
+# Web service functions used, which the token's service needs to allow:
+#   core_webservice_get_site_info, core_user_get_users_by_field, gradereport_user_get_grade_items,
+#   mod_assign_get_submissions, mod_assign_get_grades and mod_assign_get_submission_status
+# Python standard library is PSF licenced
+import time
+from datetime import datetime
+
+import requests
+from bs4 import BeautifulSoup
+
+from comet_summary import category_summaries
+from GetDataFromComet import GetDataFromCometThread, comet_url, fetch_priority, page_key, partial_competency, \
+    partial_data, partial_profile, set_grade_date, status_ids
+from instrumentation import instrumented
+
+webservice_path = '/webservice/rest/server.php'
+
+# Web service statuses to the text the assignment pages show
+submission_status_text = {'submitted': 'Submitted', 'draft': 'Draft (not submitted)', 'new': 'No attempt',
+                          'reopened': 'No attempt'}
+grading_status_text = {'graded': 'Graded', 'notgraded': 'Not graded'}
+
+
+class WebServiceError(Exception):
+    """
+    An error returned by the web service itself, e.g. an invalid token or a function the token can't use
+    """
+
+
+def encode_parameters(parameters: dict, prefix: str = None):
+    """
+    Flattens lists and dictionaries into the key[0]=value form the Moodle REST protocol uses
+    :return: List of (key, value) tuples
+    """
+    encoded = []
+    for key, value in parameters.items():
+        name = key if prefix is None else f'{prefix}[{key}]'
+        if isinstance(value, (list, tuple)):
+            encoded.extend(encode_parameters(dict(enumerate(value)), name))
+        elif isinstance(value, dict):
+            encoded.extend(encode_parameters(value, name))
+        else:
+            encoded.append((name, value))
+    return encoded
+
+
+def batches(items: list, batch_size: int):
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def _date(timestamp):
+    return datetime.fromtimestamp(timestamp) if timestamp else None
+
+
+def _text(html):
+    # Feedback comes back as HTML
+    return BeautifulSoup(html, 'html.parser').get_text().strip() if html else ''
+
+
+@instrumented()
+def parse_profile(user: dict):
+    """
+    :param user: User from core_user_get_users_by_field, including their custom profile fields
+    :return: Dictionary of profile data, the same as parse_profile_page
+    """
+    fields = {field.get('name'): field.get('value') for field in user.get('customfields', [])}
+
+    def field_date(name):
+        value = fields[name]
+        # Date custom fields are unix timestamps, text fields are as shown on the profile page
+        return datetime.fromtimestamp(int(value)) if str(value).isdigit() else datetime.strptime(value, '%d %B %Y')
+
+    start_date = field_date('Program Start')
+    end_date = field_date('Expected Program End Date')
+    program_length = round((end_date - start_date).days / 365)
+    return {'name': user['fullname'], 'start_date': start_date, 'program_length': program_length}
+
+
+@instrumented()
+def parse_grade_items(result: dict, comp_data: dict):
+    """
+    Adds each assignment in a gradereport_user_get_grade_items result to comp_data, the same as parse_grade_report_page
+    :return: List of the assignment instance ids, in the same order as the competencies added
+    """
+    assignment_ids = []
+    for user_grades in result.get('usergrades', []):
+        for item in user_grades.get('gradeitems', []):
+            if item.get('itemtype') != 'mod' or item.get('itemmodule') != 'assign':
+                continue
+            feedback = _text(item.get('feedback'))
+            comp_data['competencies'].append(
+                {'name': item['itemname'].strip(),
+                 'score': item['graderaw'] if item.get('graderaw') is not None else 0,
+                 'feedback': feedback if feedback != '' else 'N/A',
+                 'url': f"{comet_url}/mod/assign/view.php?id={item['cmid']}"})
+            assignment_ids.append(item['iteminstance'])
+    return assignment_ids
+
+
+def add_points(comp_data: dict):
+    # The grade items don't have the category totals the grade report page shows, so they're worked out from the
+    # competency scores the same way COMET does
+    for key, value in category_summaries(comp_data['competencies']).items():
+        for module, categories in value.items():
+            comp_data['points'][key][module].update(categories)
+
+
+def set_submission(competency: dict, submission: dict, grading_status: str):
+    """
+    :param submission: Submission from mod_assign_get_submissions or mod_assign_get_submission_status, or None if
+    there isn't one
+    :param grading_status: Web service grading status, e.g. 'graded'
+    """
+    status = submission.get('status', 'new') if submission is not None else 'new'
+    competency['submission_status'] = submission_status_text.get(status, 'Invalid')
+    competency['grading_status'] = grading_status_text.get(grading_status, 'Invalid')
+    competency['last_modify_date'] = _date(submission.get('timemodified')) if status != 'new' else None
+
+
+class CometWebServiceThread(GetDataFromCometThread):
+    """
+    Drop in replacement for GetDataFromCometThread using the web service, so it has the same signals and results
+    :param token: Web service token
+    :param batch_size: Number of assignments asked about in each call
+    """
+
+    def __init__(self, session: requests.Session, token: str, batch_size=50, **kwargs):
+        super(CometWebServiceThread, self).__init__(session, **kwargs)
+        self.token = token
+        self.batch_size = batch_size
+        self.assignment_ids = []
+
+    def call(self, function: str, **parameters):
+        """
+        Calls a web service function, retrying on connection and HTTP errors the same way as the page requests
+        :return: The decoded JSON result
+        """
+        data = [('wstoken', self.token), ('wsfunction', function), ('moodlewsrestformat', 'json')] + \
+            encode_parameters(parameters)
+        result = self.try_and_get(f'{self.base_url}{webservice_path}?wsfunction={function}', data=data).json()
+        if isinstance(result, dict) and 'exception' in result:
+            raise WebServiceError(f"{function}: {result.get('message', result['exception'])}")
+        return result
+
+    def get_users(self, user_ids):
+        users = {}
+        for batch in batches(sorted(set(user_ids)), self.batch_size):
+            for user in self.call('core_user_get_users_by_field', field='id', values=batch):
+                users[user['id']] = user
+        return users
+
+    @instrumented('sync step 1')
+    def get_generic_data(self, comp_data):
+        # Step 1 gets the profile data and the grade items for each module, which lists all the competencies
+        self.items_to_process.emit(len(status_ids) + 2)
+        self.current_item.emit(1)
+        self.new_step.emit('Getting generic data (Step 1 of 2)')
+
+        user_id = self.call('core_webservice_get_site_info')['userid']
+        comp_data['profile_data']['user_id'] = str(user_id)
+
+        self.current_item.emit(2)
+        comp_data['profile_data'].update(parse_profile(self.get_users([user_id])[user_id]))
+        self.profile_loaded.emit(partial_profile(comp_data['profile_data']))
+
+        self.assignment_ids = []
+        for index, course_id in enumerate(status_ids):
+            result = self.call('gradereport_user_get_grade_items', courseid=course_id, userid=user_id)
+            self.assignment_ids.extend(parse_grade_items(result, comp_data))
+            add_points(comp_data)
+            self.competencies_listed.emit(partial_data(comp_data))
+            self.current_item.emit(index + 3)
+            if index + 1 != len(status_ids):
+                time.sleep(self.delay_between_requests)
+
+    @instrumented('sync step 2')
+    def get_competency_data(self, comp_data):
+        # Step 2 gets the submission and grading details, for a batch of assignments at a time
+        competencies = dict(zip(self.assignment_ids, comp_data['competencies']))
+        indexes = {assignment_id: index for index, assignment_id in enumerate(self.assignment_ids)}
+        user_id = int(comp_data['profile_data']['user_id'])
+        self.items_to_process.emit(len(competencies))
+        self.current_item.emit(0)
+        self.new_step.emit('Getting specific competency data (Step 2 of 2)')
+
+        # Each batch costs the same however many assignments are in it, so unchanged competencies are still asked about,
+        # but the ones most likely to have changed are in the first batches
+        cached = self.cached_competencies(comp_data['profile_data']['user_id'])
+
+        def priority(assignment_id):
+            competency = competencies[assignment_id]
+            priority = fetch_priority(competency, cached.get(page_key(competency['url'])))
+            return priority if priority is not None else 4
+
+        grades = {}
+        missing = []
+        completed = 0
+        for batch in batches(sorted(competencies, key=priority), self.batch_size):
+            submissions = {}
+            for assignment in self.call('mod_assign_get_submissions', assignmentids=batch)['assignments']:
+                for submission in assignment['submissions']:
+                    if submission['userid'] == user_id:
+                        submissions[assignment['assignmentid']] = submission
+            for assignment in self.call('mod_assign_get_grades', assignmentids=batch)['assignments']:
+                for grade in assignment['grades']:
+                    if grade['userid'] == user_id and float(grade['grade']) >= 0:
+                        grades[assignment['assignmentid']] = grade
+
+            for assignment_id in batch:
+                if assignment_id in submissions:
+                    set_submission(competencies[assignment_id], submissions[assignment_id],
+                                   submissions[assignment_id].get('gradingstatus'))
+                    self.competency_loaded.emit(indexes[assignment_id], partial_competency(competencies[assignment_id]))
+                    completed += 1
+                else:
+                    # Tokens without the capability to list submissions only get their own, one at a time
+                    missing.append(assignment_id)
+            self.current_item.emit(completed)
+            time.sleep(self.delay_between_requests)
+
+        for assignment_id in missing:
+            status = self.call('mod_assign_get_submission_status', assignid=assignment_id, userid=user_id)
+            last_attempt = status.get('lastattempt', {})
+            set_submission(competencies[assignment_id], last_attempt.get('submission'),
+                           last_attempt.get('gradingstatus'))
+            feedback_grade = status.get('feedback', {}).get('grade')
+            if assignment_id not in grades and feedback_grade is not None:
+                grades[assignment_id] = feedback_grade
+            self.competency_loaded.emit(indexes[assignment_id], partial_competency(competencies[assignment_id]))
+            completed += 1
+            self.current_item.emit(completed)
+            time.sleep(self.delay_between_requests)
+
+        graders = self.get_users(grade['grader'] for grade in grades.values() if grade.get('grader', -1) > 0)
+        for assignment_id, competency in competencies.items():
+            grade = grades.get(assignment_id)
+            grade_date = _date(grade.get('timemodified')) if grade is not None and \
+                competency['grading_status'] == 'Graded' else None
+            set_grade_date(competency, grade_date)
+            grader = graders.get(grade.get('grader')) if grade is not None else None
+            competency['assessor'] = grader['fullname'] if grader is not None else None
+            self.competency_loaded.emit(indexes[assignment_id], partial_competency(competency))
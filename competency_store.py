@@ -0,0 +1,132 @@
+# A compact, column based copy of a registrars competencies. It is built once when data is loaded and then shared by
+# the tracking dataframe, the stats and the tables, so the date strings and status strings in the JSON only have to be
+# parsed once.
+# Python standard library is PSF licenced
+import re
+import sys
+
+import numpy as np
+
+# Fixed codes for the statuses COMET uses. Anything else seen in the data (COMET changes its wording occasionally) is
+# given the next free code when the store is built
+submission_statuses = ('No attempt', 'Submitted', 'Draft (not submitted)', 'Invalid')
+grading_statuses = ('Not graded', 'Graded', 'Invalid')
+# Status of competencies shown while a sync is still running, whose assignment page hasn't been got yet
+pending_status = 'Not checked yet'
+
+# Missing dates are stored with the same value numpy uses for NaT, so converting to datetime64 keeps them missing
+missing_date = np.iinfo(np.int64).min
+
+
+# Competency names start with their ID, e.g. '4.1.2.3 Linac output'. The item number is left off some names
+_competency_id_pattern = re.compile(r'^\s*(\d+)\.(\d+)\.(\d+)(?:\.(\d+))?')
+
+
+def parse_competency_id(text: str):
+    """
+    Splits a competency ID (or a name starting with one) into its parts
+    :param text: e.g. '4.1.2.3 Linac output', '4.1.2.3' or '4.1.2'
+    :return: Tuple of integer (module, category, level, item), with 0 for a missing item, or None if there is no ID
+    """
+    match = _competency_id_pattern.match(text)
+    if match is None:
+        return None
+    return tuple(int(part) if part is not None else 0 for part in match.groups())
+
+
+def _status_codes(statuses, known_statuses):
+    categories = list(known_statuses)
+    lookup = {status: code for code, status in enumerate(categories)}
+    codes = np.empty(len(statuses), dtype=np.int8)
+    for i, status in enumerate(statuses):
+        code = lookup.get(status)
+        if code is None:
+            code = lookup[status] = len(categories)
+            categories.append(status)
+        codes[i] = code
+    return codes, tuple(categories)
+
+
+def _epoch_seconds(dates):
+    # numpy parses the 'YYYY-MM-DD HH:MM:SS' format directly, which is much faster than strptime for each date
+    return np.array([date if date is not None else 'NaT' for date in dates],
+                    dtype='datetime64[s]').astype(np.int64)
+
+
+class CompetencyStore:
+    """
+    Column arrays for every competency of a registrar, in the same order as data['competencies']
+    """
+
+    def __init__(self, names, scores, submission_status, submission_categories, grading_status, grading_categories,
+                 last_modify_date, grade_date, feedback):
+        self.names = names
+        # The competency hierarchy is parsed from the names once, so everything else can filter on integers. Names
+        # without an ID get 0 for every part
+        hierarchy = np.array([parse_competency_id(name) or (0, 0, 0, 0) for name in names], dtype=np.int16)
+        self.module, self.category, self.level, self.item = hierarchy.reshape((len(names), 4)).T.copy()
+        self.scores = scores
+        self.submission_status = submission_status
+        self.submission_categories = submission_categories
+        self.grading_status = grading_status
+        self.grading_categories = grading_categories
+        self.last_modify_date = last_modify_date
+        self.grade_date = grade_date
+        self.feedback = feedback
+
+    @classmethod
+    def from_data(cls, data: dict):
+        """
+        :param data: Registrar data, in the same format as the JSON files in cached_data
+        """
+        competencies = data['competencies']
+        submission_status, submission_categories = _status_codes(
+            [competency['submission_status'] for competency in competencies], submission_statuses)
+        grading_status, grading_categories = _status_codes(
+            [competency['grading_status'] for competency in competencies], grading_statuses)
+
+        return cls(names=[sys.intern(str(competency['name'])) for competency in competencies],
+                   scores=np.array([competency['score'] for competency in competencies], dtype=np.float32),
+                   submission_status=submission_status, submission_categories=submission_categories,
+                   grading_status=grading_status, grading_categories=grading_categories,
+                   last_modify_date=_epoch_seconds([competency['last_modify_date'] for competency in competencies]),
+                   grade_date=_epoch_seconds([competency['grade_date'] for competency in competencies]),
+                   feedback=[competency['feedback'] for competency in competencies])
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def nbytes(self):
+        # Size of the arrays, the strings are shared with the rest of the program
+        return sum(array.nbytes for array in (self.scores, self.submission_status, self.grading_status,
+                                              self.last_modify_date, self.grade_date, self.module, self.category,
+                                              self.level, self.item))
+
+    def submission_code(self, status: str):
+        """
+        :return: The code for the submission status, or -1 if no competency has it
+        """
+        return self.submission_categories.index(status) if status in self.submission_categories else -1
+
+    def grading_code(self, status: str):
+        return self.grading_categories.index(status) if status in self.grading_categories else -1
+
+    def submission_status_strings(self):
+        return np.array(self.submission_categories, dtype=object)[self.submission_status]
+
+    def grading_status_strings(self):
+        return np.array(self.grading_categories, dtype=object)[self.grading_status]
+
+    @staticmethod
+    def as_datetime64(dates):
+        return dates.astype('datetime64[s]')
+
+    @staticmethod
+    def date_strings(dates):
+        """
+        Formats dates the same way they are saved in the JSON, with 'None' for missing dates
+        """
+        strings = np.char.replace(np.datetime_as_string(dates.astype('datetime64[s]')), 'T', ' ').astype(object)
+        strings[dates == missing_date] = 'None'
+        return strings
@@ -0,0 +1,123 @@
+# Expected points curves for any program length. The teap_required_points table is used for 3, 4 and 5 year programs.
+# Other lengths follow the same shape as the table: a third of the 400 points steadily over all but the last two years
+# of the program, and the rest steadily over the last two years.
+#
+# Years are counted in calendar anniversaries of the start date, so the curve lines up with the dates registrars see.
+# Python standard library is PSF licenced
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+from teap_data import teap_required_points
+
+total_points = 400
+
+
+def add_years(start: date, years: int):
+    # 29 February start dates have their anniversary on 28 February in non leap years
+    try:
+        return start.replace(year=start.year + years)
+    except ValueError:
+        return start.replace(year=start.year + years, day=28)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, np.datetime64):
+        return value.astype('datetime64[D]').astype(date)
+    return value
+
+
+def curve_knots(program_length: float):
+    """
+    :param program_length: Length of the program in years, doesn't need to be a whole number
+    :return: Years and expected points at the corners of the curve
+    """
+    program_length = float(program_length)
+    if program_length <= 2:
+        # Too short for the usual shape, so just expect steady progress
+        return np.array([0.0, program_length]), np.array([0.0, total_points])
+
+    table = teap_required_points.get(str(int(program_length))) if program_length.is_integer() else None
+    if table is not None:
+        return np.arange(len(table), dtype=np.float64), np.array(table, dtype=np.float64)
+    return np.array([0.0, program_length - 2, program_length - 1, program_length]), \
+        np.array([0.0, total_points / 3, total_points * 2 / 3, total_points])
+
+
+def _year_to_day(start: date, year: float):
+    # Whole years are anniversaries, part years are that fraction of the following year
+    whole_years = int(np.floor(year))
+    anniversary = add_years(start, whole_years)
+    fraction = year - whole_years
+    if fraction == 0:
+        return anniversary
+    year_length = (add_years(start, whole_years + 1) - anniversary).days
+    return anniversary + timedelta(days=round(fraction * year_length))
+
+
+@lru_cache(maxsize=65536)
+def knot_dates(program_length: float, start_date: date):
+    """
+    :return: Dates (datetime64[D]) and expected points at the corners of the curve. Cached, so don't modify them
+    """
+    years, points = curve_knots(program_length)
+    dates = np.array([_year_to_day(start_date, year) for year in years], dtype='datetime64[D]')
+    dates.flags.writeable = False
+    points.flags.writeable = False
+    return dates, points
+
+
+@lru_cache(maxsize=256)
+def daily_curve(program_length: float, start_date: date):
+    """
+    The expected points on every day of the program
+    :param program_length: Length of the program in years
+    :param start_date: Program start date
+    :return: Dates (datetime64[D]) and expected points arrays. Cached, so don't modify them
+    """
+    start_date = _as_date(start_date)
+    knot_days, knot_points = knot_dates(float(program_length), start_date)
+    days = np.arange(knot_days[0], knot_days[-1] + 1)
+    points = np.interp(days.astype(np.int64), knot_days.astype(np.int64), knot_points)
+    days.flags.writeable = False
+    points.flags.writeable = False
+    return days, points
+
+
+def expected_at(program_lengths, start_dates, dates):
+    """
+    Expected points for many registrars at once
+    :param program_lengths: Program length in years for each registrar
+    :param start_dates: Program start date for each registrar
+    :param dates: Date to evaluate at for each registrar
+    :return: Array of expected points, 0 before the start and 400 after the end
+    """
+    knots = {}
+    for key in zip(program_lengths, start_dates):
+        if key not in knots:
+            knots[key] = knot_dates(float(key[0]), _as_date(key[1]))
+    if len(knots) == 0:
+        return np.zeros(0)
+
+    # Curves have different numbers of corners, so the shorter ones are padded out by repeating their end
+    size = max(len(knot_days) for knot_days, _ in knots.values())
+    knot_days = np.empty((len(program_lengths), size), dtype=np.int64)
+    knot_points = np.empty((len(program_lengths), size))
+    for i, key in enumerate(zip(program_lengths, start_dates)):
+        days, points = knots[key]
+        knot_days[i, :len(days)] = days.astype(np.int64)
+        knot_days[i, len(days):] = knot_days[i, len(days) - 1]
+        knot_points[i, :len(points)] = points
+        knot_points[i, len(points):] = points[-1]
+
+    days = np.array([_as_date(d) for d in dates], dtype='datetime64[D]').astype(np.int64)
+    rows = np.arange(len(days))
+    segment = np.clip((days[:, None] >= knot_days).sum(axis=1) - 1, 0, size - 2)
+    start_days, end_days = knot_days[rows, segment], knot_days[rows, segment + 1]
+    fraction = np.clip(np.divide(days - start_days, end_days - start_days, out=np.ones(len(days)),
+                                 where=end_days > start_days), 0, 1)
+    # Before the start the first segment's fraction is clipped to 0, which is 0 points
+    return knot_points[rows, segment] + fraction * (knot_points[rows, segment + 1] - knot_points[rows, segment])
@@ -0,0 +1,95 @@
+# A shared pool of threads making the GET requests to COMET, for the manual syncs and the background sync scheduler. It
+# keeps the total number of requests at once (and the gap between them) polite however many things want data, and
+# coalesces requests: asking for a page that is already queued or being fetched with the same session gets the same
+# response, rather than fetching it twice.
+# Python standard library is PSF licenced
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from instrumentation import span
+
+
+class FetchPool:
+    """
+    :param workers: Number of requests made at once
+    :param delay_between_requests: Seconds each worker waits after each of its requests
+    :param timeout: Seconds to wait for COMET to answer a request
+    """
+
+    def __init__(self, workers: int = 2, delay_between_requests: float = 1.0, timeout: float = 60):
+        self.workers = workers
+        self.delay_between_requests = delay_between_requests
+        self.timeout = timeout
+        self.request_count = 0
+        self.coalesced_count = 0
+        self._queue = deque()
+        # Requests queued or in flight, by (session, url), so the same request can be handed out again
+        self._pending = {}
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopped = False
+
+    def get(self, session, url: str):
+        """
+        :param session: requests session to make the request with, e.g. a logged in COMET session
+        :return: Future of the requests response
+        """
+        key = (id(session), url)
+        with self._condition:
+            future = self._pending.get(key)
+            if future is not None:
+                self.coalesced_count += 1
+                return future
+            future = Future()
+            self._pending[key] = future
+            self._queue.append((key, session, url, future))
+            # Threads are only started once there is something to do
+            if len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'FetchPool-{len(self._threads)}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._condition.notify()
+        return future
+
+    @property
+    def queued(self):
+        with self._condition:
+            return len(self._queue)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while len(self._queue) == 0 and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                key, session, url, future = self._queue.popleft()
+
+            if not future.set_running_or_notify_cancel():
+                with self._condition:
+                    self._pending.pop(key, None)
+                continue
+            try:
+                with span('fetch_pool.get', url=url):
+                    response = session.get(url, timeout=self.timeout)
+                future.set_result(response)
+            except Exception as e:
+                future.set_exception(e)
+            with self._condition:
+                self._pending.pop(key, None)
+                self.request_count += 1
+            time.sleep(self.delay_between_requests)
+
+    def shutdown(self):
+        """
+        Cancels everything still queued and stops the threads once their current request is done
+        """
+        with self._condition:
+            self._stopped = True
+            for _, _, _, future in self._queue:
+                future.cancel()
+            self._queue.clear()
+            self._pending.clear()
+            self._condition.notify_all()
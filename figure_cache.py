@@ -0,0 +1,108 @@
+# Cache of rendered plots, so switching back to a registrar (or redrawing a plot with the same settings) doesn't need
+# matplotlib to rasterise the figure again. The artists are still rebuilt, as the hover, click and zoom tools need
+# them, but drawing the canvas just copies the cached pixels in.
+#
+# Renders are keyed by the view, a hash of the registrars data, the view settings and the canvas size, so a cached
+# render is never shown for data or settings it wasn't drawn from. The least recently used renders are dropped once
+# the cache is bigger than max_bytes.
+# Python standard library is PSF licenced
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from instrumentation import span
+
+
+class RenderedFigure:
+    """
+    The pixels of a drawn figure, along with where the layout put the axes so they can be put back in the same place
+    """
+
+    def __init__(self, image: np.ndarray, subplot_params: dict):
+        self.image = image
+        self.subplot_params = subplot_params
+
+    @classmethod
+    def from_canvas(cls, canvas):
+        """
+        :param canvas: An Agg based canvas that has just been drawn
+        """
+        params = canvas.figure.subplotpars
+        return cls(np.asarray(canvas.buffer_rgba()).copy(),
+                   {'left': params.left, 'right': params.right, 'bottom': params.bottom, 'top': params.top,
+                    'wspace': params.wspace, 'hspace': params.hspace})
+
+    @property
+    def nbytes(self):
+        return self.image.nbytes
+
+
+class FigureCache:
+    """
+    Least recently used cache of RenderedFigures. Safe to use from the background warming jobs
+    :param max_bytes: Renders are dropped, oldest first, once they take up more than this
+    """
+
+    def __init__(self, max_bytes: int = 128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._renders = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._renders)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._renders
+
+    def get(self, key):
+        with self._lock:
+            rendered = self._renders.get(key)
+            if rendered is not None:
+                self._renders.move_to_end(key)
+            return rendered
+
+    def put(self, key, rendered: RenderedFigure):
+        with self._lock:
+            if key in self._renders:
+                self.nbytes -= self._renders.pop(key).nbytes
+            self._renders[key] = rendered
+            self.nbytes += rendered.nbytes
+            while self.nbytes > self.max_bytes and len(self._renders) > 1:
+                _, evicted = self._renders.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._renders.clear()
+            self.nbytes = 0
+
+
+def figure_key(view: str, registrar_hash: str, settings, figure: Figure):
+    """
+    :param view: Name of the plot, e.g. 'tracking'
+    :param registrar_hash: See analytics.data_hash
+    :param settings: Anything hashable that changes what the plot looks like
+    :param figure: The figure it will be drawn on, as a render is only any use at the same size
+    """
+    width, height = figure.get_size_inches()
+    return view, registrar_hash, settings, round(width * figure.dpi), round(height * figure.dpi), figure.dpi
+
+
+def render_offscreen(draw, width_inches: float, height_inches: float, dpi: float):
+    """
+    Draws a plot without a window, e.g. to warm the cache for registrars that aren't being shown
+    :param draw: Function taking the axes to draw on
+    :return: The figure and its RenderedFigure
+    """
+    with span('render_offscreen'):
+        figure = Figure(figsize=(width_inches, height_inches), dpi=dpi)
+        figure.set_tight_layout(True)
+        canvas = FigureCanvasAgg(figure)
+        draw(figure.add_subplot(111))
+        canvas.draw()
+        return figure, RenderedFigure.from_canvas(canvas)
@@ -0,0 +1,338 @@
+# Forecasts when registrars will finish, by fitting trend models to their cumulative points. Every model is fitted to
+# a whole batch of registrars at once with numpy, so a cohort of a thousand can be ranked in around a second.
+#
+# The cumulative points are resampled weekly up to today and fitted with one of:
+#   linear     - weighted least squares line, recent weeks weighted more heavily
+#   piecewise  - two joined lines with the best fitting change point, forecast with the recent slope
+#   saturating - points levelling off towards a fitted ceiling, i.e. progress that is slowing down
+#
+# Headless usage, ranking every cached registrar by how late they are forecast to finish:
+#   python forecasting.py cached_data --model piecewise
+# Python standard library is PSF licenced
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from progress_series import to_epoch_seconds
+from expected_curve import expected_at
+from program_calendar import ProgramCalendar
+
+models = ('linear', 'piecewise', 'saturating')
+
+seconds_per_day = 24 * 60 * 60
+# Points needed to finish the program
+target_points = 400
+# Two sided normal quantiles for the confidence bands
+_z_scores = {0.5: 0.674, 0.8: 1.282, 0.9: 1.645, 0.95: 1.96, 0.99: 2.576}
+
+
+def sample_weekly(series_list, now=None, history_weeks: int = 312, start_dates=None, calendars=None):
+    """
+    Samples each cumulative points series once a week up to now
+    :param series_list: List of CumulativePoints
+    :param now: End of the samples, defaults to now
+    :param history_weeks: How many weeks back to sample
+    :param start_dates: Optional list of program start dates, samples before them are ignored. Otherwise the samples
+    start at each series first points
+    :param calendars: Optional ProgramCalendar for each registrar. The weeks are then weeks of effective time, so
+    paused time isn't sampled and part time weeks are stretched out
+    :return: x (days relative to now, shape (weeks,)), y and mask (both shape (registrars, weeks))
+    """
+    now = to_epoch_seconds(now if now is not None else datetime.now())
+    x = -7.0 * np.arange(history_weeks, -1, -1)
+    full_time_times = now + (x * seconds_per_day).astype(np.int64)
+
+    y = np.zeros((len(series_list), len(x)))
+    mask = np.zeros((len(series_list), len(x)), dtype=bool)
+    for i, series in enumerate(series_list):
+        calendar = calendars[i] if calendars is not None else None
+        if calendar is None or calendar.is_full_time:
+            times = full_time_times
+        else:
+            effective_now = calendar.effective_days(now.astype('datetime64[s]'))
+            times = np.round(calendar.calendar_days(effective_now + x) * seconds_per_day).astype(np.int64)
+        if len(series) > 0:
+            index = np.searchsorted(series.times, times, side='right')
+            y[i] = np.where(index > 0, series.points[np.maximum(index - 1, 0)], 0.0)
+        if start_dates is not None and start_dates[i] is not None:
+            start = to_epoch_seconds(start_dates[i])
+        elif len(series) > 0:
+            start = series.times[0]
+        else:
+            start = now
+        mask[i] = times >= start
+        # Always keep today, so a registrar without any points still gets a (flat) fit
+        mask[i, -1] = True
+    return x, y, mask
+
+
+def _weighted_line(x, y, w):
+    # Weighted least squares y = a + b * x for every row of y at once
+    total_weight = w.sum(axis=1)
+    x_mean = (w * x).sum(axis=1) / total_weight
+    y_mean = (w * y).sum(axis=1) / total_weight
+    dx = x - x_mean[:, None]
+    sxx = (w * dx ** 2).sum(axis=1)
+    sxy = (w * dx * (y - y_mean[:, None])).sum(axis=1)
+    slope = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 0)
+    return y_mean - slope * x_mean, slope
+
+
+class Forecast:
+    """
+    Fitted forecasts for a batch of registrars. Days are relative to now, so day 0 is today
+    """
+
+    def __init__(self, model: str, now, predict_function, sigma, x_mean, sxx, effective_samples, current_points,
+                 calendars=None):
+        self.model = model
+        self.now = now
+        self.calendars = calendars
+        self._predict_function = predict_function
+        self.sigma = sigma
+        self._x_mean = x_mean
+        self._sxx = sxx
+        self._effective_samples = effective_samples
+        self.current_points = current_points
+
+    def __len__(self):
+        return len(self.sigma)
+
+    def predict(self, days, confidence: float = 0.9):
+        """
+        :param days: Array of days from now to predict at
+        :param confidence: Width of the band, e.g. 0.9 for a 90% band
+        :return: mean, lower and upper, each shape (registrars, days). Points can't go backwards, so nothing is
+        predicted below the current points
+        """
+        days = np.asarray(days, dtype=np.float64)
+        mean = self._predict_function(days)
+        # The usual band for a least squares line, which is used as an approximation for every model
+        spread = self.sigma[:, None] * np.sqrt(1 + 1 / self._effective_samples[:, None] +
+                                               (days - self._x_mean[:, None]) ** 2 /
+                                               np.maximum(self._sxx[:, None], 1e-9))
+        half_width = _z_scores.get(confidence, 1.645) * spread
+        floor = self.current_points[:, None]
+        return np.maximum(mean, floor), np.maximum(mean - half_width, floor), np.maximum(mean + half_width, floor)
+
+    def completion_dates(self, target: float = target_points, confidence: float = 0.9, horizon_weeks: int = 1040):
+        """
+        :return: Projected date each registrar reaches the target, and the earliest and latest dates from the
+        confidence band, as datetime64[s] arrays. NaT means not within the horizon (20 years by default)
+        """
+        days = 7.0 * np.arange(horizon_weeks + 1)
+        results = []
+        for curve in self.predict(days, confidence):
+            reached = curve >= target
+            first = np.argmax(reached, axis=1)
+            dates = self.dates(days[first])
+            dates[~reached.any(axis=1)] = np.datetime64('NaT')
+            results.append(dates)
+        mean, lower, upper = results
+        # The upper curve reaches the target first
+        return mean, upper, lower
+
+
+    def dates(self, days):
+        """
+        :param days: Days from now for each registrar, in effective time if the forecast has calendars
+        :return: The calendar dates (datetime64[s])
+        """
+        days = np.asarray(days, dtype=np.float64)
+        seconds = self.now + np.round(days * seconds_per_day).astype(np.int64)
+        if self.calendars is not None:
+            for i, calendar in enumerate(self.calendars):
+                if calendar is not None and not calendar.is_full_time:
+                    effective_now = calendar.effective_days(np.int64(self.now).astype('datetime64[s]'))
+                    seconds[i] = np.round(calendar.calendar_days(effective_now + days[i]) * seconds_per_day)
+        return seconds.astype('datetime64[s]')
+
+
+def _fit_linear(x, y, w):
+    intercept, slope = _weighted_line(x, y, w)
+    residuals = y - (intercept[:, None] + slope[:, None] * x)
+    return (lambda days: intercept[:, None] + slope[:, None] * days), residuals, w
+
+
+def _fit_piecewise(x, y, w, mask, min_weeks: int = 8):
+    # y = a + b * x + c * max(0, x - k) for every candidate change point k at once, keeping the best fitting k. The
+    # weighted normal equations are built from matrix products so nothing of size registrars * k * weeks is made
+    candidates = x[min_weeks:-min_weeks:4] if len(x) > 2 * min_weeks + 1 else x[len(x) // 2:len(x) // 2 + 1]
+    hinge = np.maximum(0, x[None, :] - candidates[:, None])  # (k, weeks)
+    wy = w * y
+
+    def per_candidate(values):
+        # Broadcasts a (registrars,) sum to (registrars, k)
+        return np.broadcast_to(values[:, None], (len(y), len(candidates)))
+
+    s_1, s_x, s_xx = per_candidate(w.sum(axis=1)), per_candidate(w @ x), per_candidate(w @ x ** 2)
+    s_h, s_xh, s_hh = w @ hinge.T, w @ (x * hinge).T, w @ (hinge ** 2).T
+    normal_matrix = np.stack([np.stack([s_1, s_x, s_h], axis=-1),
+                              np.stack([s_x, s_xx, s_xh], axis=-1),
+                              np.stack([s_h, s_xh, s_hh], axis=-1)], axis=-2) + np.eye(3) * 1e-9
+    normal_vector = np.stack([per_candidate(wy.sum(axis=1)), per_candidate(wy @ x), wy @ hinge.T], axis=-1)
+    coefficients = np.linalg.solve(normal_matrix, normal_vector[..., None])[..., 0]  # (registrars, k, 3)
+
+    # Weighted squared error of each fit, sum(w * (y - fit) ** 2) expanded out
+    errors = (wy * y).sum(axis=1)[:, None] - 2 * (coefficients * normal_vector).sum(axis=-1) + \
+        np.einsum('rki,rkij,rkj->rk', coefficients, normal_matrix, coefficients)
+    # A change point before the registrar started doesn't make sense
+    first_x = np.where(mask.any(axis=1), x[np.argmax(mask, axis=1)], 0.0)
+    errors[candidates[None, :] <= first_x[:, None]] = np.inf
+    best = np.argmin(errors, axis=1)
+    rows = np.arange(len(y))
+    intercept, slope, change = coefficients[rows, best].T
+    break_point = candidates[best]
+
+    # If no change point was allowed the line through everything is used instead
+    no_change_point = ~np.isfinite(errors[rows, best])
+    line_intercept, line_slope = _weighted_line(x, y, w)
+    intercept = np.where(no_change_point, line_intercept, intercept)
+    slope = np.where(no_change_point, line_slope, slope)
+    change = np.where(no_change_point, 0.0, change)
+
+    def predict(days):
+        return intercept[:, None] + slope[:, None] * days + \
+               change[:, None] * np.maximum(0, days[None, :] - break_point[:, None])
+
+    residuals = y - predict(x)
+    # The band is based on the recent line only
+    recent_weights = np.where(x[None, :] >= break_point[:, None], w, 0.0)
+    recent_weights[no_change_point] = w[no_change_point]
+    return predict, residuals, recent_weights
+
+
+def _fit_saturating(x, y, w, ceilings: int = 24):
+    # y = ceiling - exp(a + b * x), with b < 0 so the points level off at the ceiling. For a fixed ceiling this is a
+    # straight line in log(ceiling - y), so every candidate ceiling is fitted at once and the best one kept
+    highest = y.max(axis=1)
+    fractions = np.linspace(0, 1, ceilings)
+    ceiling = highest[:, None] * 1.001 + 1 + fractions[None, :] * (2 * target_points)  # (registrars, ceilings)
+
+    gap = ceiling[:, :, None] - y[:, None, :]
+    log_gap = np.log(gap)
+    # Weighting by the gap squared makes the log fit approximate a fit of the points themselves
+    weights = (w[:, None, :] * gap ** 2).reshape(-1, len(x))
+    intercept, slope = _weighted_line(x, log_gap.reshape(-1, len(x)), weights)
+    intercept = intercept.reshape(ceiling.shape)
+    slope = slope.reshape(ceiling.shape)
+
+    fitted = ceiling[:, :, None] - np.exp(intercept[:, :, None] + slope[:, :, None] * x)
+    errors = (w[:, None, :] * (y[:, None, :] - fitted) ** 2).sum(axis=2)
+    errors[slope >= 0] = np.inf
+    best = np.argmin(errors, axis=1)
+    rows = np.arange(len(y))
+    valid = np.isfinite(errors[rows, best])
+    best_ceiling = ceiling[rows, best]
+    best_intercept = intercept[rows, best]
+    best_slope = slope[rows, best]
+
+    def predict(days):
+        curve = best_ceiling[:, None] - np.exp(best_intercept[:, None] + best_slope[:, None] * days[None, :])
+        # Progress that isn't slowing down can't be described by this model, so it is forecast as flat
+        return np.where(valid[:, None], curve, highest[:, None])
+
+    return predict, y - predict(x), w
+
+
+def fit(series_list, model: str = 'linear', now=None, window: timedelta = timedelta(weeks=26), start_dates=None,
+        history_weeks: int = 312, calendars=None):
+    """
+    Fits a trend model to each cumulative points series
+    :param series_list: List of CumulativePoints, e.g. ProgressSeries.uploaded for each registrar
+    :param model: One of models
+    :param now: Date to forecast from, defaults to now
+    :param window: Half life of the weights, i.e. points this long ago count for half as much as today's
+    :param start_dates: Optional program start date of each registrar
+    :param history_weeks: How far back to look at all
+    :param calendars: Optional ProgramCalendar for each registrar, so the fit and forecast are in effective time
+    :return: Forecast
+    """
+    if model not in models:
+        raise ValueError(f'Unknown forecasting model {model}, expected one of {", ".join(models)}')
+    now = now if now is not None else datetime.now()
+    x, y, mask = sample_weekly(series_list, now, history_weeks, start_dates, calendars)
+    w = np.where(mask, 0.5 ** (-x / (window / timedelta(days=1))), 0.0)
+
+    if model == 'linear':
+        predict, residuals, band_weights = _fit_linear(x, y, w)
+    elif model == 'piecewise':
+        predict, residuals, band_weights = _fit_piecewise(x, y, w, mask)
+    else:
+        predict, residuals, band_weights = _fit_saturating(x, y, w)
+
+    total_weight = band_weights.sum(axis=1)
+    effective_samples = np.maximum(total_weight ** 2 / np.maximum((band_weights ** 2).sum(axis=1), 1e-12), 1)
+    x_mean = (band_weights * x).sum(axis=1) / total_weight
+    sxx = (band_weights * (x - x_mean[:, None]) ** 2).sum(axis=1) / total_weight * effective_samples
+    variance = (w * residuals ** 2).sum(axis=1) / w.sum(axis=1)
+    sigma = np.sqrt(variance * effective_samples / np.maximum(effective_samples - 2, 1))
+    return Forecast(model, to_epoch_seconds(now), predict, sigma, x_mean, sxx, effective_samples, y[:, -1],
+                    calendars)
+
+
+def rank_cohort(cohort, model: str = 'linear', now=None, window: timedelta = timedelta(weeks=26),
+                confidence: float = 0.9, calendars=None):
+    """
+    Forecasts every registrar and sorts them, most at risk of finishing late first
+    :param cohort: List of (name, program length, program start date, ProgressSeries)
+    :param calendars: Optional ProgramCalendar for each registrar, for registrars with pauses or part time work
+    :return: List of dictionaries, one for each registrar
+    """
+    now = now if now is not None else datetime.now()
+    names, lengths, starts, progress = zip(*cohort) if cohort else ((), (), (), ())
+    calendars = calendars if calendars is not None else [ProgramCalendar()] * len(cohort)
+    uploaded = fit([series.uploaded for series in progress], model, now, window, starts, calendars=calendars)
+    graded = fit([series.graded for series in progress], model, now, window, starts, calendars=calendars)
+    completion, earliest, latest = uploaded.completion_dates(confidence=confidence)
+    graded_completion, _, _ = graded.completion_dates(confidence=confidence)
+    # The expected points are looked up where today would be in a full time program
+    nominal_now = [calendar.nominal_dates(start, now) for calendar, start in zip(calendars, starts)]
+    expected = expected_at(lengths, starts, nominal_now)
+
+    results = []
+    for i, name in enumerate(names):
+        program_end = calendars[i].expected_curve(lengths[i], starts[i])[0][-1].astype(datetime)
+        days_late = (completion[i] - np.datetime64(program_end, 's')) / np.timedelta64(1, 'D') \
+            if not np.isnat(completion[i]) else np.inf
+        results.append({'name': name, 'uploaded_points': uploaded.current_points[i],
+                        'graded_points': graded.current_points[i], 'expected_points': expected[i],
+                        'program_end': program_end, 'projected_completion': completion[i],
+                        'earliest_completion': earliest[i], 'latest_completion': latest[i],
+                        'projected_graded_completion': graded_completion[i], 'days_late': days_late})
+    return sorted(results, key=lambda result: (result['days_late'],
+                                               result['expected_points'] - result['uploaded_points']), reverse=True)
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+    import os
+
+    import registrar_files
+    from progress_series import ProgressSeries
+    from tracking_data import generate_tracking_data
+
+    parser = argparse.ArgumentParser(description='Rank cached registrars by their forecast completion date')
+    parser.add_argument('data_directory', help='Directory of registrar JSON files, e.g. cached_data')
+    parser.add_argument('--model', choices=models, default='linear')
+    parser.add_argument('--months', type=int, default=6, help='Half life of the weighting, in months')
+    args = parser.parse_args()
+
+    cohort = []
+    calendars = []
+    for filepath in sorted(glob.glob(os.path.join(args.data_directory, '*.json'))):
+        data = registrar_files.load(filepath)
+        profile = data['profile_data']
+        cohort.append((profile['name'], float(profile['program_length']),
+                       datetime.strptime(str(profile['start_date']), '%Y-%m-%d %H:%M:%S'),
+                       ProgressSeries.from_tracking_df(generate_tracking_data(data))))
+        calendars.append(ProgramCalendar.from_data(data))
+
+    print(f"{'Registrar':30} {'Uploaded':>9} {'Expected':>9} {'Program end':>12} {'Forecast':>12} {'Days late':>10}")
+    for result in rank_cohort(cohort, args.model, window=timedelta(weeks=args.months * 4), calendars=calendars):
+        forecast = str(result['projected_completion'])[0:10] if not np.isnat(result['projected_completion']) \
+            else 'Never'
+        days_late = f"{result['days_late']:.0f}" if np.isfinite(result['days_late']) else '-'
+        print(f"{result['name'][0:30]:30} {result['uploaded_points']:9.1f} {result['expected_points']:9.1f} "
+              f"{result['program_end'].strftime('%Y-%m-%d'):>12} {forecast:>12} {days_late:>10}")
@@ -0,0 +1,433 @@
+# Imports grades for many registrars at once from course level documents a supervisor can download from COMET, rather
+# than downloading every registrars competency pages one at a time:
+#   - Gradebook exports (Grades > Export, as CSV, Excel or OpenDocument), which have a row per registrar and a column
+#     per competency with its grade and optionally feedback
+#   - Grade history exports (Grades > Grade history, as CSV, Excel or OpenDocument), which have a row per grade change
+#     with its date, used for the grading dates
+#   - The grader report page (Grades > Grader report, saved as HTML), which has the grade of every registrar for every
+#     competency
+#
+# The grades are merged into the registrars' existing records in cached_data, matched by COMET user id where the file
+# has it and by name otherwise. Registrars need to have been downloaded once first, as none of these documents have
+# their program start date or length.
+#
+# Headless usage:
+#   python gradebook_import.py cached_data grades.xlsx grade_history.csv grader_report.html
+# Python standard library is PSF licenced
+import csv
+import glob
+import io
+import os
+import posixpath
+import re
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+from bs4 import BeautifulSoup
+
+import registrar_files
+from comet_summary import clear_categories, competency_category
+from GetDataFromComet import set_grade_date
+from competency_store import parse_competency_id
+from instrumentation import instrumented
+
+_xlsx_namespace = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_xlsx_relationship_namespace = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_ods_table_namespace = '{urn:oasis:names:tc:opendocument:xmlns:table:1.0}'
+_ods_office_namespace = '{urn:oasis:names:tc:opendocument:xmlns:office:1.0}'
+_ods_text_namespace = '{urn:oasis:names:tc:opendocument:xmlns:text:1.0}'
+
+_cell_reference_pattern = re.compile(r'^([A-Z]+)(\d+)$')
+# Gradebook export columns look like 'Assignment: 1.1.1.1 Linac output (Real)' or '... (Feedback)'
+_grade_column_pattern = re.compile(r'^(?:[^:]*:\s*)?(.*?)\s*\((Real|Percentage|Feedback)\)\s*$')
+_user_link_pattern = re.compile(r'user/view\.php\?id=(\d+)')
+_number_pattern = re.compile(r'-?\d+(?:\.\d+)?')
+
+date_formats = ('%A, %d %B %Y, %I:%M %p', '%d %B %Y, %I:%M %p', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M:%S',
+                '%d/%m/%Y %H:%M', '%d/%m/%Y')
+_excel_epoch = datetime(1899, 12, 30)
+
+
+def _column_index(column: str):
+    number = 0
+    for letter in column:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number - 1
+
+
+def read_xlsx(file):
+    """
+    :param file: Filepath or file object of an .xlsx workbook
+    :return: Rows of the first worksheet as lists of strings and floats
+    """
+    with zipfile.ZipFile(file, 'r') as z:
+        shared_strings = []
+        if 'xl/sharedStrings.xml' in z.namelist():
+            for item in ElementTree.fromstring(z.read('xl/sharedStrings.xml')).iter(f'{_xlsx_namespace}si'):
+                shared_strings.append(''.join(text.text or '' for text in item.iter(f'{_xlsx_namespace}t')))
+
+        workbook = ElementTree.fromstring(z.read('xl/workbook.xml'))
+        relationships = ElementTree.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+        sheet_id = next(workbook.iter(f'{_xlsx_namespace}sheet')).get(f'{_xlsx_relationship_namespace}id')
+        target = next(relationship.get('Target') for relationship in relationships
+                      if relationship.get('Id') == sheet_id)
+        sheet = ElementTree.fromstring(z.read(target.lstrip('/') if target.startswith('/')
+                                              else posixpath.join('xl', target)))
+
+    rows = []
+    for row in sheet.iter(f'{_xlsx_namespace}row'):
+        values = []
+        for cell in row.iter(f'{_xlsx_namespace}c'):
+            match = _cell_reference_pattern.match(cell.get('r', ''))
+            index = _column_index(match.group(1)) if match else len(values)
+            values.extend([''] * (index - len(values)))
+            cell_type = cell.get('t')
+            value = cell.find(f'{_xlsx_namespace}v')
+            if cell_type == 'inlineStr':
+                values.append(''.join(text.text or '' for text in cell.iter(f'{_xlsx_namespace}t')))
+            elif value is None or value.text is None:
+                values.append('')
+            elif cell_type == 's':
+                values.append(shared_strings[int(value.text)])
+            elif cell_type in ('str', 'e'):
+                values.append(value.text)
+            else:
+                values.append(float(value.text))
+        rows.append(values)
+    return rows
+
+
+def read_ods(file):
+    """
+    :param file: Filepath or file object of an .ods spreadsheet
+    :return: Rows of the first sheet as lists of strings and floats
+    """
+    with zipfile.ZipFile(file, 'r') as z:
+        content = ElementTree.fromstring(z.read('content.xml'))
+
+    table = next(content.iter(f'{_ods_table_namespace}table'))
+    rows = []
+    for row in table.iter(f'{_ods_table_namespace}table-row'):
+        values = []
+        for cell in row:
+            if cell.tag not in (f'{_ods_table_namespace}table-cell', f'{_ods_table_namespace}covered-table-cell'):
+                continue
+            value_type = cell.get(f'{_ods_office_namespace}value-type')
+            if value_type in ('float', 'percentage', 'currency'):
+                value = float(cell.get(f'{_ods_office_namespace}value'))
+            elif value_type == 'date':
+                value = cell.get(f'{_ods_office_namespace}date-value')
+            else:
+                value = '\n'.join(''.join(paragraph.itertext())
+                                  for paragraph in cell.iter(f'{_ods_text_namespace}p'))
+            # Empty cells at the end of a row are stored as one cell repeated to the edge of the sheet
+            repeat = int(cell.get(f'{_ods_table_namespace}number-columns-repeated', '1'))
+            values.extend([value] * (repeat if value != '' or repeat < 100 else 1))
+        while len(values) > 0 and values[-1] == '':
+            values.pop()
+        if len(values) > 0:
+            rows.append(values)
+    return rows
+
+
+def read_csv(file):
+    """
+    :param file: Filepath of a CSV file, in any of the separators COMET can export with
+    :return: Rows as lists of strings
+    """
+    with open(file, 'r', encoding='utf-8-sig', newline='') as f:
+        text = f.read()
+    try:
+        dialect = csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',\t;:')
+    except csv.Error:
+        dialect = csv.excel
+    return list(csv.reader(io.StringIO(text), dialect))
+
+
+def read_table(filepath: str):
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == '.xlsx':
+        return read_xlsx(filepath)
+    if extension == '.ods':
+        return read_ods(filepath)
+    return read_csv(filepath)
+
+
+def parse_date(value):
+    """
+    :param value: Date text in one of the formats COMET uses, or an Excel date number
+    :return: datetime, or None if there isn't a date
+    """
+    if isinstance(value, float):
+        return _excel_epoch + timedelta(days=value)
+    value = str(value).strip()
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            pass
+    return None
+
+
+def parse_grade(value):
+    """
+    :return: The grade as a float, or None if it isn't graded ('-')
+    """
+    if isinstance(value, float):
+        return value
+    match = _number_pattern.search(str(value))
+    return float(match.group(0)) if match else None
+
+
+def _registrar_key(name: str):
+    return ' '.join(str(name).lower().split())
+
+
+def _saved(competency: dict):
+    # The competency as it would be saved, as dates may be datetimes or the strings loaded from the JSON
+    return {key: str(value) if isinstance(value, datetime) else value for key, value in competency.items()}
+
+
+class GradebookImport:
+    """
+    Grades for many registrars, built up from any number of gradebook exports, grade histories and grader reports
+    """
+
+    def __init__(self):
+        # Registrar key (user id if known, otherwise their name) to {'name', 'user_id', 'competencies'}, where
+        # competencies maps a competency ID tuple to a dictionary of whatever was found for it
+        self.registrars = {}
+        # Registrar names to the key they are under, so a registrar found by name and by user id is one record
+        self._keys_by_name = {}
+
+    def _registrar(self, name: str, user_id: str = None):
+        name_key = _registrar_key(name)
+        key = str(user_id) if user_id is not None else self._keys_by_name.get(name_key, name_key)
+        if key not in self.registrars:
+            # A registrar seen by name before their user id turns up is moved to be under their user id
+            self.registrars[key] = self.registrars.pop(name_key, None) or \
+                {'name': name, 'user_id': None, 'competencies': {}}
+        if user_id is not None:
+            self.registrars[key]['user_id'] = str(user_id)
+        self._keys_by_name[name_key] = key
+        return self.registrars[key]
+
+    @staticmethod
+    def _competency(registrar: dict, name: str):
+        competency_id = parse_competency_id(name)
+        if competency_id is None:
+            return None
+        return registrar['competencies'].setdefault(competency_id, {'name': name})
+
+    @instrumented()
+    def add_file(self, filepath: str):
+        """
+        Adds the grades from a gradebook export, grade history export or saved grader report page
+        """
+        if os.path.splitext(filepath)[1].lower() in ('.html', '.htm'):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                self.add_grader_report(f.read())
+            return
+
+        rows = read_table(filepath)
+        if len(rows) == 0:
+            return
+        header = [str(column).strip() for column in rows[0]]
+        if 'Grade item' in header and 'Revised grade' in header:
+            self.add_grade_history(header, rows[1:])
+        elif any(_grade_column_pattern.match(column) for column in header):
+            self.add_gradebook_export(header, rows[1:])
+        else:
+            raise ValueError(f"{filepath} doesn't look like a gradebook export or grade history")
+
+    def add_gradebook_export(self, header: list, rows: list):
+        first_name = header.index('First name') if 'First name' in header else None
+        surname = next((header.index(column) for column in ('Surname', 'Last name') if column in header), None)
+        columns = [(index, _grade_column_pattern.match(column)) for index, column in enumerate(header)]
+        columns = [(index, match.group(1), match.group(2)) for index, match in columns if match is not None]
+
+        for row in rows:
+            if first_name is None or first_name >= len(row):
+                continue
+            name = f'{row[first_name]} {row[surname]}' if surname is not None and surname < len(row) \
+                else str(row[first_name])
+            registrar = self._registrar(name)
+            for index, competency_name, kind in columns:
+                competency = self._competency(registrar, competency_name)
+                if competency is None or index >= len(row):
+                    continue
+                if kind == 'Feedback':
+                    if str(row[index]).strip() != '':
+                        competency['feedback'] = str(row[index])
+                else:
+                    grade = parse_grade(row[index])
+                    # The real grade is preferred, as percentages are rounded
+                    if grade is not None and (kind == 'Real' or 'score' not in competency):
+                        competency['score'] = grade if kind == 'Real' else grade / 100
+
+    def add_grade_history(self, header: list, rows: list):
+        date_column = header.index('Date and time')
+        name_column = header.index('Name')
+        item_column = header.index('Grade item')
+        grade_column = header.index('Revised grade')
+        feedback_column = header.index('Feedback text') if 'Feedback text' in header else None
+
+        for row in rows:
+            if max(date_column, name_column, item_column, grade_column) >= len(row):
+                continue
+            competency = self._competency(self._registrar(row[name_column]), str(row[item_column]))
+            grade_date = parse_date(row[date_column])
+            grade = parse_grade(row[grade_column])
+            if competency is None or grade_date is None or grade is None:
+                continue
+            # The most recent change is the current grade
+            if competency.get('grade_date') is None or grade_date >= competency['grade_date']:
+                competency['grade_date'] = grade_date
+                competency['history_score'] = grade
+                if feedback_column is not None and feedback_column < len(row) and \
+                        str(row[feedback_column]).strip() != '':
+                    competency['feedback'] = str(row[feedback_column])
+
+    def add_grader_report(self, html: str):
+        soup = BeautifulSoup(html, 'html.parser')
+        table = soup.find('table', id='user-grades') or soup.find('table')
+        if table is None:
+            return
+
+        # Grade item columns, by item id where the page has them and by position otherwise
+        items_by_id = {}
+        items_by_position = {}
+        for header_row in table.find_all('tr'):
+            if _user_link_pattern.search(str(header_row)):
+                continue
+            for position, cell in enumerate(header_row.find_all(['th', 'td'])):
+                link = cell.find('a', class_='gradeitemheader')
+                name = (link.get('title') or link.text if link is not None else cell.text).strip()
+                if parse_competency_id(name) is None:
+                    continue
+                if cell.get('data-itemid') is not None:
+                    items_by_id[cell['data-itemid']] = name
+                items_by_position[position] = name
+
+        for row in table.find_all('tr'):
+            link = row.find('a', href=_user_link_pattern)
+            if link is None:
+                continue
+            registrar = self._registrar(link.text.strip(), _user_link_pattern.search(link['href']).group(1))
+            for position, cell in enumerate(row.find_all(['th', 'td'])):
+                name = items_by_id.get(cell.get('data-itemid')) or items_by_position.get(position)
+                if name is None:
+                    continue
+                grade = parse_grade(cell.text)
+                if grade is not None:
+                    self._competency(registrar, name)['score'] = grade
+
+    def apply_to_data(self, data: dict):
+        """
+        Updates a registrars data with any imported grades for them
+        :param data: Registrar data, in the same format as the JSON files in cached_data, modified in place
+        :return: Number of competencies changed, or None if the import has nothing for this registrar
+        """
+        profile = data['profile_data']
+        registrar = self.registrars.get(str(profile.get('user_id'))) or \
+            self.registrars.get(_registrar_key(profile.get('name', '')))
+        if registrar is None:
+            return None
+
+        existing = {parse_competency_id(competency['name']): competency for competency in data['competencies']}
+        updated = 0
+        changed_categories = set()
+        for competency_id, imported in registrar['competencies'].items():
+            competency = existing.get(competency_id)
+            before = _saved(competency) if competency is not None else None
+            if competency is None:
+                competency = {'name': imported['name'], 'score': 0, 'feedback': 'N/A', 'url': None,
+                              'submission_status': 'No attempt', 'grading_status': 'Not graded',
+                              'last_modify_date': None, 'grade_date': None, 'assessor': None}
+                data['competencies'].append(competency)
+                changed_categories.add(competency_category(competency['name']))
+
+            score = imported.get('score', imported.get('history_score'))
+            if score is not None:
+                if score != competency['score']:
+                    changed_categories.add(competency_category(competency['name']))
+                competency['score'] = score
+            if 'feedback' in imported:
+                competency['feedback'] = imported['feedback']
+            if imported.get('grade_date') is not None:
+                # Dates loaded from the JSON are strings
+                if isinstance(competency['last_modify_date'], str):
+                    competency['last_modify_date'] = datetime.strptime(competency['last_modify_date'],
+                                                                       '%Y-%m-%d %H:%M:%S')
+                set_grade_date(competency, imported['grade_date'])
+            if score is not None and score > 0:
+                competency['grading_status'] = 'Graded'
+                if competency['submission_status'] in ('No attempt', 'Invalid'):
+                    competency['submission_status'] = 'Submitted'
+            if _saved(competency) != before:
+                updated += 1
+        # COMET's category totals for these are out of date until the grade reports are downloaded again
+        clear_categories(data, changed_categories)
+        return updated
+
+
+@instrumented()
+def import_files(filepaths, cache_location: str = 'cached_data', history=None):
+    """
+    Merges the grades in the files into every matching registrar in the cache
+    :param filepaths: Gradebook exports, grade histories and grader report pages
+    :param cache_location: Directory of registrar JSON files
+    :param history: SyncHistory the updated registrars are recorded in, if any
+    :return: Tuple of a list of (registrar name, number of competencies changed) for the registrars that changed, and a
+    list of the names of registrars in the files that aren't in the cache
+    """
+    gradebook = GradebookImport()
+    for filepath in filepaths:
+        gradebook.add_file(filepath)
+
+    updated = []
+    matched = set()
+    for data_filepath in sorted(glob.glob(f'{cache_location}/*.json')):
+        counts = []
+
+        def apply(data):
+            counts.append(gradebook.apply_to_data(data))
+            # Only saved (and recorded in the history) if something changed
+            return bool(counts[0])
+
+        # Locked while it's changed, as the GUI or the background sync may be saving it too
+        data, saved = registrar_files.update(data_filepath, apply)
+        if counts[0] is None:
+            continue
+        matched.update((str(data['profile_data'].get('user_id')), _registrar_key(data['profile_data']['name'])))
+        if not saved:
+            continue
+        if history is not None:
+            history.record_sync(data, source='gradebook import')
+        updated.append((data['profile_data']['name'], counts[0]))
+
+    unmatched = [registrar['name'] for key, registrar in gradebook.registrars.items()
+                 if key not in matched and _registrar_key(registrar['name']) not in matched]
+    return updated, unmatched
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Import grades for many registrars from COMET course gradebook files')
+    parser.add_argument('data_directory', help='Directory of registrar JSON files, e.g. cached_data')
+    parser.add_argument('files', nargs='+', help='Gradebook exports (.csv, .xlsx, .ods), grade history exports or '
+                                                 'saved grader report pages (.html)')
+    parser.add_argument('--history', help='Database to record the changes in, e.g. sync_history.db')
+    args = parser.parse_args()
+
+    history = None
+    if args.history is not None:
+        from sync_history import SyncHistory
+        history = SyncHistory(args.history)
+    updated, unmatched = import_files(args.files, args.data_directory, history)
+    for name, count in updated:
+        print(f'{name}: {count} competencies updated')
+    for name in unmatched:
+        print(f"{name}: not in {args.data_directory}, download their data once first")
@@ -0,0 +1,81 @@
+# A tooltip style annotation that follows the mouse over a plot, e.g. to show the training plan notes on the category
+# overview. There is only ever one annotation artist per axes, and moving it only redraws the area it covered and now
+# covers (blitting), rather than the whole figure.
+# Python standard library is PSF licenced
+from matplotlib.transforms import Bbox
+
+
+class HoverAnnotation:
+    """
+    :param canvas: Canvas of the plot
+    :param text_for: Function taking a matplotlib mouse event over the axes, returning the text to show or None
+    """
+
+    def __init__(self, canvas, text_for):
+        self.canvas = canvas
+        self.text_for = text_for
+        self.ax = None
+        self.annotation = None
+        self.background = None
+        # Where the annotation was last drawn, so that area can be cleaned up when it moves or hides
+        self.drawn_bbox = None
+        canvas.mpl_connect('draw_event', self._on_draw)
+        canvas.mpl_connect('motion_notify_event', self._on_move)
+        canvas.mpl_connect('figure_leave_event', lambda event: self.hide())
+
+    def attach(self, ax):
+        """
+        Puts the annotation on the axes. Needs calling again whenever the axes is cleared, as that removes it
+        """
+        self.ax = ax
+        # Animated artists are left out of normal draws, so the saved background never includes the annotation
+        self.annotation = ax.annotate('', xy=(0, 0), xytext=(15, 15), textcoords='offset points', zorder=2000,
+                                      bbox=dict(boxstyle='round', facecolor='white', alpha=1), animated=True,
+                                      visible=False)
+        self.drawn_bbox = None
+
+    def _on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.canvas.figure.bbox)
+        self.drawn_bbox = None
+        if self.annotation is not None:
+            self.annotation.set_visible(False)
+
+    def _on_move(self, event):
+        text = None
+        if self.annotation is not None and event.inaxes is self.ax:
+            text = self.text_for(event)
+        if text is None:
+            self.hide()
+            return
+
+        self.annotation.xy = (event.xdata, event.ydata)
+        self.annotation.set_text(text)
+        # Keep it inside the figure by putting it on the side of the mouse with the most room
+        width, height = self.canvas.figure.bbox.size
+        self.annotation.set_ha('right' if event.x > width / 2 else 'left')
+        self.annotation.set_va('top' if event.y > height / 2 else 'bottom')
+        self.annotation.xyann = (-15 if event.x > width / 2 else 15, -15 if event.y > height / 2 else 15)
+        self.annotation.set_visible(True)
+        self._blit()
+
+    def hide(self):
+        if self.annotation is not None and self.annotation.get_visible():
+            self.annotation.set_visible(False)
+            self._blit()
+
+    def _blit(self):
+        if self.background is None:
+            return
+        renderer = self.canvas.get_renderer()
+        self.canvas.restore_region(self.background)
+        dirty = [] if self.drawn_bbox is None else [self.drawn_bbox]
+        self.drawn_bbox = None
+        if self.annotation.get_visible():
+            self.ax.draw_artist(self.annotation)
+            self.drawn_bbox = Bbox.union([self.annotation.get_window_extent(renderer),
+                                          self.annotation.get_bbox_patch().get_window_extent(renderer)]).padded(2)
+            dirty.append(self.drawn_bbox)
+        if len(dirty) > 0:
+            self.canvas.blit(Bbox.intersection(Bbox.union(dirty), self.canvas.figure.bbox) or
+                             self.canvas.figure.bbox)
+
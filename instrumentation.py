@@ -0,0 +1,155 @@
+# Opt in timing instrumentation, used to find out where time is going in the program. Profiling is turned on by
+# setting the TEAPTRACKER_PROFILE environment variable to 1, or ticking 'Record timings' on the Misc tab (which is
+# saved as Diagnostics/enable_profiling in settings.ini)
+#
+# Usage:
+#     with span('update_tracking_plot'):
+#         ...
+#
+#     @instrumented('parse')
+#     def parse_page(html):
+#         ...
+# Python standard library is PSF licenced
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+_enabled = os.environ.get('TEAPTRACKER_PROFILE', '0').lower() in ('1', 'true', 'yes')
+_spans = []
+_lock = threading.Lock()
+# Used as the zero point for the timestamps in exported traces
+_start_time = time.perf_counter()
+
+# Stops the trace growing forever if profiling is left on for a long time
+max_spans = 100000
+
+
+def enable(enabled: bool = True):
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    return _enabled
+
+
+@contextmanager
+def _record_span(name: str, args: dict):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        thread = threading.current_thread()
+        with _lock:
+            if len(_spans) < max_spans:
+                _spans.append({'name': name, 'start': start - _start_time, 'duration': end - start,
+                               'thread_id': thread.ident, 'thread_name': thread.name, 'args': args})
+
+
+class _NoSpan:
+    # Shared do nothing context manager, so a disabled span costs next to nothing
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+def span(name: str, **args):
+    """
+    Context manager that records how long the code inside it takes, if profiling is enabled
+    :param name: Name of the span, e.g. the function being timed
+    :param args: Any extra information to store with the span, e.g. the url being requested
+    """
+    if not _enabled:
+        return _no_span
+    return _record_span(name, args)
+
+
+def instrumented(name: str = None):
+    """
+    Decorator that wraps every call to the function in a span
+    :param name: Name of the span, defaults to the function name
+    """
+
+    def decorator(function):
+        span_name = name if name is not None else function.__name__
+        # PyQt only passes a slot as many signal arguments as it can take, but it can't tell that through the wrapper,
+        # so drop any extras here in the same way (e.g. the checked argument of a button clicked signal)
+        max_args = None if function.__code__.co_flags & inspect.CO_VARARGS else function.__code__.co_argcount
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            args = args[:max_args]
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _record_span(span_name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def get_spans():
+    with _lock:
+        return list(_spans)
+
+
+def clear():
+    with _lock:
+        _spans.clear()
+
+
+def summarise():
+    """
+    Summarises the recorded spans by name
+    :return: List of dictionaries with the name, count, total, mean and max duration (in seconds) of each span, in
+    descending order of total time
+    """
+    totals = {}
+    for recorded_span in get_spans():
+        total = totals.setdefault(recorded_span['name'], {'name': recorded_span['name'], 'count': 0, 'total': 0.0,
+                                                          'max': 0.0})
+        total['count'] += 1
+        total['total'] += recorded_span['duration']
+        total['max'] = max(total['max'], recorded_span['duration'])
+    for total in totals.values():
+        total['mean'] = total['total'] / total['count']
+    return sorted(totals.values(), key=lambda total: total['total'], reverse=True)
+
+
+def export_chrome_trace(filepath: str):
+    """
+    Writes the recorded spans in the Chrome trace event format, which can be opened in chrome://tracing or
+    https://ui.perfetto.dev
+    """
+    events = []
+    thread_names = {}
+    for recorded_span in get_spans():
+        thread_names[recorded_span['thread_id']] = recorded_span['thread_name']
+        events.append({'name': recorded_span['name'], 'ph': 'X', 'pid': os.getpid(),
+                       'tid': recorded_span['thread_id'], 'ts': recorded_span['start'] * 1e6,
+                       'dur': recorded_span['duration'] * 1e6,
+                       'args': {key: str(value) for key, value in recorded_span['args'].items()}})
+    for thread_id, thread_name in thread_names.items():
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id,
+                       'args': {'name': thread_name}})
+    with open(filepath, 'w') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+
+def export_json(filepath: str):
+    """
+    Writes the recorded spans and their summary as plain JSON
+    """
+    with open(filepath, 'w') as f:
+        json.dump({'summary': summarise(), 'spans': get_spans()}, f, default=str, indent=4)
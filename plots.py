@@ -0,0 +1,324 @@
+# Draws the Category Overview, Module Overview and Tracking plots from an analytics snapshot. Everything the plots
+# depend on is passed in, rather than read from the GUI, so the same functions draw the on screen canvases and the
+# off screen renders in figure_cache.py
+# Python standard library is PSF licenced
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from matplotlib import rcParams
+from matplotlib.patches import Rectangle
+
+import forecasting
+from competency_store import parse_competency_id, pending_status
+from teap_data import teap_categories, competency_reference_data
+
+modules = ('1', '2', '3', '4', '5', '6', '7', '8')
+views = ('category_overview', 'module_overview', 'tracking')
+date_format = '%Y-%m-%d %H:%M:%S'
+
+
+class TrackingSettings:
+    """
+    Everything the tracking plot shows, other than the registrars data
+    :param start_date: Program start date
+    :param program_length: Length of the program in years, as shown in the combo box
+    :param plan: None, or tuple of the plan start date, end date and list of competencies in the plan
+    :param extrapolation: None, or tuple of the forecasting model name and number of months to extrapolate from
+    :param today: Date the uploaded and graded lines are drawn up to, defaults to now
+    """
+
+    def __init__(self, start_date: datetime, program_length: str, plan=None, extrapolation=None, today=None):
+        self.start_date = start_date
+        self.program_length = program_length
+        self.plan = plan
+        self.extrapolation = extrapolation
+        self.today = today if today is not None else datetime.now()
+
+    def key(self):
+        # The lines only move once a day, so the time of day is left out of the key
+        plan = None if self.plan is None else (self.plan[0], self.plan[1], tuple(sorted(self.plan[2])))
+        return self.start_date, str(self.program_length), plan, self.extrapolation, self.today.date()
+
+
+class CompetencyGrid:
+    """
+    Finds the competency under a point on the category overview without checking every rectangle. Each category is a
+    row one unit high, and each level a column one unit wide that is split evenly between its competencies
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self.rectangles = []
+        # Rectangle of each competency, by its position in data['competencies']
+        self.competency_rectangles = {}
+
+    def add(self, row: int, level: int, rectangles: list, competencies=()):
+        """
+        :param competencies: Positions of the rectangles competencies in data['competencies']
+        """
+        self.cells[(row, level - 1)] = rectangles
+        self.rectangles.extend(rectangles)
+        self.competency_rectangles.update(zip(competencies, rectangles))
+
+    def hit(self, x, y):
+        """
+        :param x: Data coordinates, None (e.g. the mouse is outside the axes) finds nothing
+        :return: The rectangle at the point, or None
+        """
+        if x is None or y is None:
+            return None
+        row, column = int(np.floor(y)), int(np.floor(x))
+        rectangles = self.cells.get((row, column))
+        if not rectangles:
+            return None
+        return rectangles[min(int((x - column) * len(rectangles)), len(rectangles) - 1)]
+
+
+def select_rectangle(rec):
+    # A bit hacky, but works. This stores the old edge color back as a property on the rectangle, so if we unselect
+    # it we know what to change it back to this. This method is not ideal, as the old_edgecolor property is made up
+    # by me, and not a standard property of te rectangle
+    rec.old_edgecolor = rec.get_edgecolor()
+    rec.set_edgecolor('Blue')
+    rec.set_linewidth(3.5)
+    rec.set_zorder(1000)
+
+
+def competency_style(module: str, score, submission_status: str):
+    """
+    :param module: e.g. '4'
+    :return: Tuple of the face colour, the other Rectangle options, and whether it has a separate black outline (which
+    hatched competencies need, as the hatch is drawn in the edge colour)
+    """
+    if score == 1:
+        return competency_reference_data[module]['complete_colour'], {'edgecolor': 'Black'}, False
+    # Competencies a sync hasn't checked yet are shown as not attempted until they are
+    if submission_status not in ('No attempt', pending_status):
+        return competency_reference_data[module]['incomplete_colour'], \
+            {'hatch': '///', 'linewidth': 0, 'edgecolor': competency_reference_data[module]['complete_colour']}, True
+    return competency_reference_data[module]['incomplete_colour'], {'edgecolor': 'Black'}, False
+
+
+def update_competency(ax, rec, score, submission_status: str):
+    """
+    Restyles one competency's rectangle on the category overview in place, e.g. as a sync gets its details, which is
+    much cheaper than drawing the whole plot again. The canvas still needs drawing afterwards
+    """
+    face_color, options, outlined = competency_style(rec.get_label().split('.')[0], score, submission_status)
+    rec.set_facecolor(face_color)
+    rec.set_hatch(options.get('hatch'))
+    # Selected (planned) competencies keep their selection outline until they are unselected
+    if hasattr(rec, 'old_edgecolor') and rec.get_zorder() == 1000:
+        rec.old_edgecolor = options['edgecolor']
+    else:
+        rec.set_edgecolor(options['edgecolor'])
+        rec.set_linewidth(options.get('linewidth', rcParams['patch.linewidth']))
+
+    outline = getattr(rec, 'outline', None)
+    if outlined and outline is None:
+        rec.outline = Rectangle(rec.get_xy(), rec.get_width(), rec.get_height(), edgecolor='Black', zorder=100,
+                                facecolor='none')
+        ax.add_patch(rec.outline)
+    elif not outlined and outline is not None:
+        outline.remove()
+        rec.outline = None
+
+
+def category_overview(ax, snapshot, planned_competencies=()):
+    """
+    :param planned_competencies: Competencies in the training plan, e.g. '1.1.1.1', which are outlined
+    :return: CompetencyGrid of the competency rectangles, which are labelled with their competency
+    """
+    ax.cla()
+    grid = CompetencyGrid()
+    planned_competencies = set(planned_competencies)
+
+    row_number = 0
+    labels = []
+
+    # Row positions of the competencies in each (module, category, level), in the order COMET lists them
+    level_rows = snapshot.level_rows
+    scores = snapshot.tracking_df['score'].values
+    submission_statuses = snapshot.tracking_df['submission_status'].values
+
+    for module in reversed(teap_categories.keys()):
+        for category in reversed(teap_categories[module].keys()):
+            for level in (1, 2, 3):
+                rows = level_rows.get((int(module), int(category), level), ())
+                rectangles = []
+                for comp_number, row in enumerate(rows):
+                    offset = (level - 1) + comp_number / len(rows)
+
+                    face_color, extra_options, outlined = competency_style(module, scores[row],
+                                                                           submission_statuses[row])
+                    outline = None
+                    if outlined:
+                        outline = Rectangle((offset, row_number), 1 / len(rows), 1,
+                                            edgecolor='Black',
+                                            zorder=100, facecolor='none')
+                        ax.add_patch(outline)
+
+                    rect = Rectangle((offset, row_number), 1 / len(rows), 1,
+                                     label=f'{module}.{category}.{level}.{comp_number + 1}',
+                                     facecolor=face_color, **extra_options)
+                    rect.outline = outline
+                    ax.add_patch(rect)
+                    if rect.get_label() in planned_competencies:
+                        select_rectangle(rect)
+                    rectangles.append(rect)
+                grid.add(row_number, level, rectangles, rows)
+
+            labels.append(teap_categories[module][category])
+            row_number += 1
+
+    ax.set_xlim((0, 3))
+    ax.set_ylim((0, row_number))
+    ax.set_yticks(list(n + 0.5 for n in range(row_number)))
+    ax.set_yticklabels(labels)
+    ax.set_xticks((0.5, 1.5, 2.5))
+    ax.set_xticklabels(('1', '2', '3'))
+    ax.set_xlabel('Level')
+    ax.autoscale(tight=True)
+    return grid
+
+
+def module_overview(ax, snapshot, relative: bool = False):
+    """
+    :param relative: Show each module as a percentage of its points, rather than the points themselves
+    """
+    ax.cla()
+    ax.set_xlim(-0.5, 7.5)
+    ax.set_ylim(0, 100)
+
+    complete = []
+    uploaded = []
+    unattempted = []
+    for module in modules:
+        total_available_points = competency_reference_data[module]['total_points']
+        uploaded_points = snapshot.uploaded_by_module.get(int(module), 0)
+        graded_points = snapshot.graded_by_module.get(int(module), 0)
+        if relative:
+            uploaded_points = uploaded_points / total_available_points * 100
+            graded_points = graded_points / total_available_points * 100
+            total_available_points = 100
+        # Graded points can come from COMET's totals before it's known what's been uploaded, see compute_snapshot
+        uploaded_points = max(uploaded_points, graded_points)
+        complete.append(graded_points)
+        uploaded.append(uploaded_points - graded_points)
+        unattempted.append(total_available_points - uploaded_points)
+    ax.bar(modules, complete, color=list(competency_reference_data[mod]['complete_colour'] for mod in modules))
+    ax.bar(modules, uploaded, bottom=complete,
+           color=list(competency_reference_data[mod]['incomplete_colour'] for mod in modules), hatch='//',
+           edgecolor=list(competency_reference_data[mod]['complete_colour'] for mod in modules))
+    ax.bar(modules, unattempted, bottom=[sum(x) for x in zip(complete, uploaded)],
+           color=list(competency_reference_data[mod]['incomplete_colour'] for mod in modules))
+
+    ax.set_xlabel('Module')
+    ax.set_ylabel('Percentage complete' if relative else 'Points signed off')
+
+
+def tracking(ax, snapshot, settings: TrackingSettings):
+    ax.cla()
+    ax.set_xlim(settings.start_date, settings.today)
+    ax.set_ylim(0, 400)
+
+    # Modified plot
+    modify_dates, total_modified_points = snapshot.progress_series.uploaded.plot_data(settings.today)
+    ax.plot(modify_dates, total_modified_points, label='Uploaded', drawstyle='steps-post')
+
+    # Graded plot
+    graded_dates, total_accepted_points = snapshot.progress_series.graded.plot_data(settings.today)
+    ax.plot(graded_dates, total_accepted_points, label='Graded', drawstyle='steps-post')
+
+    # Expected
+    # The curve is straight between its corners, so only they need plotting. Pauses and part time work stretch it out
+    expected_dates, expected_points = snapshot.program_calendar.expected_curve(settings.program_length,
+                                                                               settings.start_date)
+    ax.plot(expected_dates, expected_points, label='Expected')
+
+    # Plan
+    if settings.plan is not None and len(settings.plan[2]) > 0:
+        plan_start_date, plan_end_date, competencies = settings.plan
+        tracking_df = snapshot.tracking_df
+        planned_ids = set(parse_competency_id(competency) for competency in competencies)
+        in_plan = pd.MultiIndex.from_frame(tracking_df[['module', 'category', 'level', 'item']]).isin(planned_ids)
+        planned_score = tracking_df[in_plan]['max_uploaded_score'].sum()
+
+        points_start = snapshot.progress_series.uploaded.points_at(plan_start_date)
+        ax.plot((plan_start_date, plan_end_date), (points_start, points_start + planned_score), label='Plan',
+                linestyle='--', color='red')
+
+    # Extrapolation
+    if settings.extrapolation is not None:
+        model, months = settings.extrapolation
+        window = timedelta(weeks=months * 4)
+        forecast = forecasting.fit([snapshot.progress_series.uploaded], model, settings.today, window,
+                                   [settings.start_date], calendars=[snapshot.program_calendar])
+
+        # 638 weeks is just a random magic number to ensure it's off the plot
+        days = 7.0 * np.arange(639)
+        mean, lower, upper = forecast.predict(days)
+        dates = forecast.dates(days[None, :])[0]
+        completion = forecast.completion_dates()[0][0]
+        label = 'Extrapolation' if np.isnat(completion) else \
+            f"Extrapolation (finish {completion.astype(datetime).strftime('%b %Y')})"
+
+        ax.autoscale(tight=True)
+        ylim = ax.get_ylim()
+        xlim = ax.get_xlim()
+
+        ax.plot(dates, mean[0], color='purple', label=label)
+        ax.fill_between(dates, lower[0], upper[0], color='purple', alpha=0.15, linewidth=0)
+
+        ax.set_ylim(ylim)
+        ax.set_xlim(xlim)
+
+    ax.legend()
+
+    # Don't autoscale if it's extrapolating, as the point is off the plot
+    if settings.extrapolation is None:
+        ax.autoscale(tight=True)
+
+
+def draw(view: str, ax, snapshot, settings):
+    """
+    :param settings: The planned competencies for the category overview, whether it's relative for the module
+    overview, or the TrackingSettings
+    """
+    if view == 'category_overview':
+        return category_overview(ax, snapshot, settings)
+    if view == 'module_overview':
+        return module_overview(ax, snapshot, settings)
+    return tracking(ax, snapshot, settings)
+
+
+def settings_key(view: str, settings):
+    # Hashable version of the settings, for figure_cache
+    if view == 'category_overview':
+        return tuple(sorted(settings))
+    if view == 'tracking':
+        return settings.key()
+    return settings
+
+
+def settings_from_data(data: dict, show_plan: bool, extrapolation, relative: bool, today=None):
+    """
+    The settings each view has when a registrars data is loaded, e.g. for drawing it before it's been looked at
+    :param show_plan: Whether the training plan is shown on the tracking plot
+    :param extrapolation: See TrackingSettings
+    :param relative: Whether the module overview is relative
+    :return: Dictionary of view name to its settings
+    """
+    training_plan = data.get('training_plan', {})
+    competencies = list(training_plan.get('competencies', []))
+    start_date = datetime.strptime(data['profile_data']['start_date'], date_format)
+    plan = None
+    if show_plan and len(competencies) > 0 and 'start_date' in training_plan and 'end_date' in training_plan:
+        plan = (datetime.strptime(training_plan['start_date'], date_format).replace(hour=0, minute=0, second=0),
+                datetime.strptime(training_plan['end_date'], date_format).replace(hour=0, minute=0, second=0),
+                competencies)
+    return {'category_overview': competencies,
+            'module_overview': relative,
+            'tracking': TrackingSettings(datetime(start_date.year, start_date.month, start_date.day),
+                                         str(data['profile_data']['program_length']), plan, extrapolation, today)}
@@ -0,0 +1,151 @@
+# Pauses and part time work during a registrars program. Expected points and forecasts are worked out on an
+# "effective time" axis, which only moves forward as fast as the registrar is working: a day at 0.5 FTE counts as half
+# a day, and a day paused (e.g. parental leave) doesn't count at all.
+#
+# The calendar is saved in the registrar JSON as:
+#   "program_calendar": [{"start_date": "2021-03-01 00:00:00", "end_date": "2021-09-01 00:00:00", "fte": 0}]
+# An end_date of null means the period hasn't finished yet.
+# Python standard library is PSF licenced
+from datetime import date, datetime
+
+import numpy as np
+
+from expected_curve import knot_dates
+
+date_format = '%Y-%m-%d %H:%M:%S'
+seconds_per_day = 24 * 60 * 60
+
+# Stands in for the end of an unfinished period. Far enough off for any forecast
+_open_ended = np.datetime64('2200-01-01', 's').astype(np.int64) / seconds_per_day
+
+
+def _days(dates):
+    # Days since 1970 as floats, from datetimes, datetime64s or arrays of either
+    return np.asarray(dates, dtype='datetime64[s]').astype(np.int64) / seconds_per_day
+
+
+def _dates(days):
+    return np.round(np.asarray(days) * seconds_per_day).astype(np.int64).astype('datetime64[s]')
+
+
+class ProgramCalendar:
+    """
+    Periods of part time work or pauses. Outside of the periods the registrar is full time. Where periods overlap
+    the one added last is used
+    :param periods: List of dictionaries with start_date, end_date (or None) and fte (0 for a pause)
+    """
+
+    def __init__(self, periods=None):
+        self.periods = []
+        for period in periods or []:
+            self.periods.append({'start_date': period['start_date'], 'end_date': period.get('end_date'),
+                                 'fte': float(period['fte'])})
+        self._build()
+
+    @classmethod
+    def from_data(cls, data: dict):
+        """
+        :param data: Registrar data, in the same format as the JSON files in cached_data
+        """
+        return cls(data.get('program_calendar') if data is not None else None)
+
+    def to_data(self):
+        return [dict(period) for period in self.periods]
+
+    @property
+    def is_full_time(self):
+        return len(self._knots) == 0
+
+    def _build(self):
+        # Works out the effective time at every period boundary, so any date can be mapped with one interpolation
+        boundaries = set()
+        spans = []
+        for period in self.periods:
+            start = _days(datetime.strptime(str(period['start_date']), date_format))
+            end = _days(datetime.strptime(str(period['end_date']), date_format)) \
+                if period['end_date'] is not None else _open_ended
+            if end > start and period['fte'] != 1:
+                spans.append((start, end, period['fte']))
+                boundaries.update((start, end))
+
+        self._knots = np.array(sorted(boundaries))
+        if len(self._knots) == 0:
+            self._effective = self._knots
+            return
+
+        # FTE between each pair of boundaries, the last period covering it wins
+        fte = np.ones(len(self._knots) - 1)
+        middles = (self._knots[:-1] + self._knots[1:]) / 2
+        for start, end, period_fte in spans:
+            fte[(middles > start) & (middles < end)] = period_fte
+        # Effective time is measured so it matches calendar time before the first period
+        self._effective = self._knots[0] + np.concatenate(([0], np.cumsum(fte * np.diff(self._knots))))
+
+    def effective_days(self, dates):
+        """
+        :param dates: Date or array of dates
+        :return: Effective days since 1970 for each date. Without any periods this is just days since 1970
+        """
+        days = _days(dates)
+        if self.is_full_time:
+            return days
+        # Full time before and after the periods, so the offset there is constant
+        return days + np.interp(days, self._knots, self._effective - self._knots)
+
+    def calendar_days(self, effective_days):
+        """
+        The inverse of effective_days. During a pause no effective time passes, so effective times at a pause map to
+        the day it finishes
+        """
+        effective_days = np.asarray(effective_days, dtype=np.float64)
+        if self.is_full_time:
+            return effective_days
+        index = np.clip(np.searchsorted(self._effective, effective_days, side='right'), 1, len(self._knots) - 1)
+        start_effective, end_effective = self._effective[index - 1], self._effective[index]
+        start_days, end_days = self._knots[index - 1], self._knots[index]
+        fraction = np.divide(effective_days - start_effective, end_effective - start_effective,
+                             out=np.ones_like(effective_days), where=end_effective > start_effective)
+        days = start_days + fraction * (end_days - start_days)
+        before = effective_days < self._effective[0]
+        after = effective_days >= self._effective[-1]
+        days = np.where(before, effective_days, days)
+        return np.where(after, effective_days - self._effective[-1] + self._knots[-1], days)
+
+    def calendar_dates(self, effective_days):
+        return _dates(self.calendar_days(effective_days))
+
+    def shift_date(self, start, effective_days: float):
+        """
+        :return: The calendar date that is effective_days of work after start
+        """
+        return _dates(self.calendar_days(self.effective_days(start) + effective_days))
+
+    def nominal_dates(self, start_date, dates):
+        """
+        Maps dates to where they would be in a full time program with the same start date, e.g. for looking up the
+        expected points with expected_curve
+        """
+        start = _days(start_date)
+        return _dates(start + self.effective_days(dates) - self.effective_days(start_date))
+
+    def expected_curve(self, program_length: float, start_date):
+        """
+        :return: Dates (datetime64[s]) and expected points at the corners of the expected points curve, stretched
+        out by the pauses and part time periods
+        """
+        nominal_dates, points = knot_dates(float(program_length), np.datetime64(start_date, 'D').astype(date))
+        if self.is_full_time:
+            return nominal_dates.astype('datetime64[s]'), points
+
+        start_effective = self.effective_days(start_date)
+        curve_effective = start_effective + (_days(nominal_dates) - _days(nominal_dates[0]))
+        # The curve also bends wherever the FTE changes during the program
+        knot_effective = self._effective[(self._effective > curve_effective[0]) &
+                                         (self._effective < curve_effective[-1])]
+        all_effective = np.union1d(curve_effective, knot_effective)
+        all_days = self.calendar_days(all_effective)
+        # A pause is flat, so it needs both its start and end day
+        pause_starts = self._knots[(all_days[0] < self._knots) & (self._knots < all_days[-1])]
+        all_days = np.union1d(all_days, pause_starts)
+        all_points = np.interp(self.effective_days(_dates(all_days)), curve_effective, points)
+        return _dates(all_days), all_points
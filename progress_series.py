@@ -0,0 +1,91 @@
+# Cumulative uploaded and graded points over time for a registrar. Built once from the tracking dataframe when data is
+# loaded, so the tracking plot, training plan and extrapolation don't need to re-sort and re-sum it on every redraw
+# Python standard library is PSF licenced
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from competency_store import pending_status
+
+
+def to_epoch_seconds(date):
+    """
+    :param date: datetime, numpy datetime64 or pandas Timestamp
+    """
+    return np.datetime64(date, 's').astype(np.int64)
+
+
+class CumulativePoints:
+    """
+    A step function of points against time. times is sorted epoch seconds, points[i] is the total after times[i]
+    """
+
+    def __init__(self, times, points):
+        self.times = times
+        self.points = points
+
+    @classmethod
+    def from_events(cls, dates, points):
+        """
+        :param dates: datetime64 array of when each lot of points were gained, NaT dates are ignored
+        :param points: Points gained at each date
+        """
+        dates = np.asarray(dates, dtype='datetime64[s]')
+        points = np.asarray(points, dtype=np.float64)
+        valid = ~np.isnat(dates)
+        times = dates[valid].astype(np.int64)
+        order = np.argsort(times, kind='stable')
+        return cls(times[order], np.cumsum(points[valid][order]))
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def total(self):
+        return self.points[-1] if len(self.points) > 0 else 0.0
+
+    def points_at(self, date):
+        """
+        :return: The total points at the date, i.e. including everything gained on or before it
+        """
+        index = np.searchsorted(self.times, to_epoch_seconds(date), side='right')
+        return self.points[index - 1] if index > 0 else 0.0
+
+    def rate_over(self, window: timedelta, end=None):
+        """
+        :param window: How far back from the end to look
+        :param end: End of the window, defaults to now
+        :return: Average points gained per day over the window
+        """
+        end = end if end is not None else datetime.now()
+        gained = self.points_at(end) - self.points_at(np.datetime64(end, 's') - np.timedelta64(window))
+        return gained / (window / timedelta(days=1))
+
+    def plot_data(self, end=None):
+        """
+        :return: Dates and points for a steps-post plot, carrying the last total on to the end date (default now)
+        """
+        end = end if end is not None else datetime.now()
+        dates = np.append(self.times.astype('datetime64[s]'), np.datetime64(end, 's'))
+        return dates, np.append(self.points, self.total)
+
+
+class ProgressSeries:
+    """
+    Uploaded and graded points over time for one registrar
+    """
+
+    def __init__(self, uploaded: CumulativePoints, graded: CumulativePoints):
+        self.uploaded = uploaded
+        self.graded = graded
+
+    @classmethod
+    def from_tracking_df(cls, tracking_df):
+        """
+        :param tracking_df: See tracking_data.generate_tracking_data
+        """
+        uploaded_df = tracking_df[~tracking_df['submission_status'].isin(('No attempt', pending_status))]
+        graded_df = tracking_df[tracking_df['grading_status'] == 'Graded']
+        return cls(CumulativePoints.from_events(uploaded_df['last_modify_date'].values,
+                                                uploaded_df['max_uploaded_score'].values),
+                   CumulativePoints.from_events(graded_df['grade_date'].values, graded_df['weighted_score'].values))
@@ -0,0 +1,134 @@
+# Reads and writes the registrar JSON files in cached_data, which can be written by more than one program at once: the
+# GUI, the background sync, a gradebook import, a second copy of the program, or another computer using the same
+# shared folder. So a reader never sees a half written file and two writers don't lose each others changes:
+#   - Files are written to a temporary file and then moved over the old one, which is atomic
+#   - Writes take a lock on a separate .lock file next to the data file (so the data file itself can still be
+#     replaced), which writers have to themselves. Readers don't need it, as they see either the old file or the new
+#     one. Except on Windows, where a file can't be replaced while another program has it open, so readers take the
+#     lock too if they can (they can't on a read only share, but nothing can be writing there either)
+#   - update() holds the lock from reading the file until the changes are saved, for read-modify-write changes
+# The locks are advisory, so only programs using this module respect them. They work on local disks, and on network
+# shares where the server supports locking (most SMB servers, and NFS with lockd).
+# Python standard library is PSF licenced
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+if sys.platform == 'win32':
+    import msvcrt
+else:
+    import fcntl
+
+
+def lock_filepath(filepath: str):
+    return f'{filepath}.lock'
+
+
+def _try_lock(f, exclusive: bool):
+    try:
+        if sys.platform == 'win32':
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), (fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH) | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(f):
+    if sys.platform == 'win32':
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+@contextmanager
+def _hold(f, filepath: str, exclusive: bool, timeout: float):
+    deadline = time.monotonic() + timeout
+    while not _try_lock(f, exclusive):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f'{filepath} is being used by another program')
+        time.sleep(0.05)
+    try:
+        yield
+    finally:
+        _unlock(f)
+
+
+@contextmanager
+def file_lock(filepath: str, exclusive: bool = True, timeout: float = 30):
+    """
+    Holds the lock for a data file. Locks aren't reentrant, so don't take the lock for a file that's already held
+    :param exclusive: False for a shared (read) lock
+    :param timeout: Seconds to wait for the lock, before raising TimeoutError
+    """
+    with open(lock_filepath(filepath), 'a+') as f, _hold(f, filepath, exclusive, timeout):
+        yield
+
+
+@contextmanager
+def read_lock(filepath: str, timeout: float = 30):
+    """
+    Holds the lock for reading a data file where it's needed, i.e. on Windows. It's skipped if the lock file can't be
+    opened, e.g. on a read only share
+    """
+    if sys.platform != 'win32':
+        yield
+        return
+    try:
+        f = open(lock_filepath(filepath), 'a+')
+    except OSError:
+        yield
+        return
+    with f, _hold(f, filepath, False, timeout):
+        yield
+
+
+def _read(filepath: str):
+    with open(filepath, 'r') as f:
+        return json.load(f)
+
+
+def _write(filepath: str, data: dict):
+    temporary_filepath = f'{filepath}.tmp'
+    with open(temporary_filepath, 'w') as f:
+        json.dump(data, f, default=str, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_filepath, filepath)
+
+
+def load(filepath: str):
+    """
+    :return: The registrar data in the file, raises the usual OSError or ValueError if it can't be read
+    """
+    if not os.path.exists(filepath):
+        # Rather than leaving a lock file behind for it
+        raise FileNotFoundError(filepath)
+    with read_lock(filepath):
+        return _read(filepath)
+
+
+def save(filepath: str, data: dict):
+    """
+    Saves registrar data, with dates converted to strings
+    """
+    with file_lock(filepath):
+        _write(filepath, data)
+
+
+def update(filepath: str, change):
+    """
+    Changes the data in a file, with nothing else able to change the file between it being read and saved
+    :param change: Function changing the data in place, returning whether it needs saving
+    :return: The data, and whether it was saved
+    """
+    with file_lock(filepath):
+        data = _read(filepath)
+        saved = bool(change(data))
+        if saved:
+            _write(filepath, data)
+    return data, saved
@@ -0,0 +1,79 @@
+# Watches the cached_data folder for registrar files being added, changed or removed by something else (e.g. another
+# copy of the program, a script, or another computer using a shared folder), so the GUI doesn't need restarting to see
+# them. QFileSystemWatcher is told about changes by the operating system, which doesn't work for every network share,
+# so the folder is also checked on a timer. Either way, only the files whose size or modification time has changed
+# are reported.
+# Python standard library is PSF licenced
+import glob
+import os
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+
+def _signature(filepath: str):
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class RegistrarWatcher(QObject):
+    """
+    :param directory: Folder of registrar JSON files, which doesn't need to exist yet
+    :param poll_interval_ms: How often the folder is checked regardless, 0 to only rely on QFileSystemWatcher
+    :param settle_ms: Changes are only checked once nothing has changed for this long, as one save can be several
+    changes (e.g. writing the temporary file, then moving it over the old one)
+    """
+    added = pyqtSignal(str)
+    changed = pyqtSignal(str)
+    removed = pyqtSignal(str)
+
+    def __init__(self, directory: str, parent=None, poll_interval_ms: int = 10000, settle_ms: int = 300):
+        super(RegistrarWatcher, self).__init__(parent)
+        self.directory = directory
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.schedule_scan)
+        self.watcher.fileChanged.connect(self.schedule_scan)
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(settle_ms)
+        self.settle_timer.timeout.connect(self.scan)
+        self.poll_timer = QTimer(self)
+        self.poll_timer.timeout.connect(self.scan)
+        if poll_interval_ms > 0:
+            self.poll_timer.start(poll_interval_ms)
+        # The files already there aren't reported
+        self.signatures = {filepath: _signature(filepath) for filepath in self.filepaths()}
+        self.watch()
+
+    def filepaths(self):
+        return [os.path.normpath(filepath) for filepath in glob.glob(os.path.join(self.directory, '*.json'))]
+
+    def watch(self):
+        # Files replaced by an atomic save stop being watched, so they are added again after each scan
+        if os.path.isdir(self.directory) and self.directory not in self.watcher.directories():
+            self.watcher.addPath(self.directory)
+        missing = [filepath for filepath in self.signatures if filepath not in self.watcher.files()]
+        if len(missing) > 0:
+            self.watcher.addPaths(missing)
+
+    def schedule_scan(self, path: str = None):
+        self.settle_timer.start()
+
+    def scan(self):
+        """
+        Emits added, changed or removed for each registrar file that's different since the last scan
+        """
+        signatures = {filepath: _signature(filepath) for filepath in self.filepaths()}
+        old_signatures = self.signatures
+        self.signatures = {filepath: signature for filepath, signature in signatures.items() if signature is not None}
+        self.watch()
+        for filepath, signature in self.signatures.items():
+            if filepath not in old_signatures:
+                self.added.emit(filepath)
+            elif signature != old_signatures[filepath]:
+                self.changed.emit(filepath)
+        for filepath in old_signatures:
+            if filepath not in self.signatures:
+                self.removed.emit(filepath)
@@ -0,0 +1,220 @@
+# Renders a progress report for each registrar, with the same category overview, module overview and tracking plots as
+# the GUI (drawn by plots.py with the Agg backend) and a summary of their points. Reports are either a single HTML file
+# with the plots embedded, or a PDF. A whole cohort is rendered in parallel worker processes, e.g. for a nightly job.
+#
+# Headless usage:
+#   python report_renderer.py cached_data progress_reports --format pdf --processes 4
+# Python standard library is PSF licenced
+import base64
+import html
+import io
+import multiprocessing
+import os
+import re
+from datetime import datetime, timedelta
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+import forecasting
+import plots
+import registrar_files
+from analytics import compute_snapshot
+from instrumentation import instrumented
+
+formats = ('html', 'pdf')
+
+# Size of each plot in inches. The category overview has a row for every category, so it needs to be tall
+figure_sizes = {'category_overview': (8, 11), 'module_overview': (8, 5), 'tracking': (10, 6)}
+figure_titles = {'category_overview': 'Category overview', 'module_overview': 'Module overview',
+                 'tracking': 'Tracking'}
+dpi = 100
+
+
+def report_filename(data: dict, report_format: str):
+    # Registrar names can have characters that aren't allowed in filenames on Windows
+    name = re.sub(r'[<>:"/\\|?*]', '_', data['profile_data']['name']).strip()
+    return f"{name} ({data['profile_data']['user_id']}) - Progress report.{report_format}"
+
+
+def report_summary(data: dict, snapshot, tracking_settings, today: datetime):
+    """
+    :return: List of (label, value) rows for the top of the report
+    """
+    profile = data['profile_data']
+    stats = snapshot.misc_stats
+    uploaded = snapshot.progress_series.uploaded
+    expected_dates, expected_points = snapshot.program_calendar.expected_curve(tracking_settings.program_length,
+                                                                               tracking_settings.start_date)
+    expected_now = np.interp(np.datetime64(today, 's').astype(np.int64), expected_dates.astype(np.int64),
+                             expected_points)
+
+    finish = 'N/A'
+    if tracking_settings.extrapolation is not None:
+        model, months = tracking_settings.extrapolation
+        forecast = forecasting.fit([uploaded], model, today, timedelta(weeks=months * 4),
+                                   [tracking_settings.start_date], calendars=[snapshot.program_calendar])
+        completion = forecast.completion_dates()[0][0]
+        finish = 'Never' if np.isnat(completion) else completion.astype(datetime).strftime('%d %b %Y')
+
+    def count(number):
+        return f"{number} [{number * 100 / stats['competencies']:.2f}%]"
+
+    return [('Registrar', profile['name']),
+            ('Program start', tracking_settings.start_date.strftime('%d %b %Y')),
+            ('Program length', f'{tracking_settings.program_length} years'),
+            ('Uploaded points', f'{uploaded.total:.1f}'),
+            ('Graded points', f'{snapshot.progress_series.graded.total:.1f}'),
+            ('Expected points', f'{expected_now:.1f}'),
+            ('Forecast finish', finish),
+            ('Signed off competencies', count(stats['signed_off'])),
+            ('Partially signed off competencies', count(stats['partially_signed_off'])),
+            ('Waiting on grading', count(stats['waiting_on_grading'])),
+            ('Average waiting time for sign off', 'N/A' if stats['average_waiting_days'] is None
+             else f"{stats['average_waiting_days']} days")]
+
+
+def _draw_figures(snapshot, view_settings):
+    # Figures aren't made with pyplot, so nothing is kept around between reports
+    for view in plots.views:
+        figure = Figure(figsize=figure_sizes[view], dpi=dpi)
+        figure.set_tight_layout(True)
+        FigureCanvasAgg(figure)
+        plots.draw(view, figure.add_subplot(111), snapshot, view_settings[view])
+        yield view, figure
+
+
+def _html_report(summary, snapshot, view_settings, today):
+    rows = '\n'.join(f'<tr><th>{html.escape(label)}</th><td>{html.escape(str(value))}</td></tr>'
+                     for label, value in summary)
+    sections = []
+    for view, figure in _draw_figures(snapshot, view_settings):
+        image = io.BytesIO()
+        figure.savefig(image, format='png')
+        sections.append(f'<h2>{figure_titles[view]}</h2>\n'
+                        f'<img alt="{figure_titles[view]}" '
+                        f'src="data:image/png;base64,{base64.b64encode(image.getvalue()).decode("ascii")}">')
+    sections = '\n'.join(sections)
+    title = html.escape(f"{summary[0][1]} - Progress report")
+    return f'''<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+table {{ border-collapse: collapse; }}
+th, td {{ border: 1px solid #ccc; padding: 0.3em 0.8em; text-align: left; }}
+img {{ max-width: 100%; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<p>Generated {today.strftime('%d %b %Y %H:%M')}</p>
+<table>
+{rows}
+</table>
+{sections}
+</body>
+</html>
+'''
+
+
+def _pdf_report(filepath, summary, snapshot, view_settings, today):
+    with PdfPages(filepath) as pdf:
+        # The summary is its own A4 page
+        page = Figure(figsize=(8.27, 11.69))
+        page.text(0.08, 0.94, f'{summary[0][1]} - Progress report', fontsize=16, weight='bold')
+        page.text(0.08, 0.91, f"Generated {today.strftime('%d %b %Y %H:%M')}", fontsize=10)
+        for i, (label, value) in enumerate(summary):
+            page.text(0.08, 0.86 - i * 0.03, label, fontsize=11)
+            page.text(0.55, 0.86 - i * 0.03, str(value), fontsize=11)
+        pdf.savefig(page)
+
+        for view, figure in _draw_figures(snapshot, view_settings):
+            figure.suptitle(figure_titles[view])
+            pdf.savefig(figure)
+
+
+@instrumented()
+def render_report(data: dict, filepath: str, report_format: str = 'html', extrapolation=('linear', 6),
+                  today: datetime = None):
+    """
+    :param data: Registrar data, in the same format as the JSON files in cached_data
+    :param filepath: File to save the report to
+    :param report_format: 'html' or 'pdf'
+    :param extrapolation: Forecasting model and the number of months to fit it to, or None to leave it out
+    :param today: Date the report is worked out for, defaults to now
+    """
+    if report_format not in formats:
+        raise ValueError(f'Unknown report format {report_format}, expected one of {", ".join(formats)}')
+    today = today if today is not None else datetime.now()
+    snapshot = compute_snapshot(data)
+    view_settings = plots.settings_from_data(data, show_plan=True, extrapolation=extrapolation, relative=False,
+                                             today=today)
+    summary = report_summary(data, snapshot, view_settings['tracking'], today)
+
+    if report_format == 'html':
+        with open(filepath, 'w', encoding='utf-8') as f:
+            f.write(_html_report(summary, snapshot, view_settings, today))
+    else:
+        _pdf_report(filepath, summary, snapshot, view_settings, today)
+
+
+def _render_registrar_file(task):
+    data_filepath, output_directory, report_format, extrapolation, today = task
+    try:
+        data = registrar_files.load(data_filepath)
+        output_filepath = os.path.join(output_directory, report_filename(data, report_format))
+        render_report(data, output_filepath, report_format, extrapolation, today)
+        return data_filepath, output_filepath, None
+    except Exception as e:
+        return data_filepath, None, str(e)
+
+
+def render_cohort(data_filepaths, output_directory: str, report_format: str = 'html', processes: int = None,
+                  extrapolation=('linear', 6)):
+    """
+    Renders a report for every registrar data file given, in parallel worker processes
+    :param data_filepaths: List of registrar JSON files, e.g. the files in cached_data
+    :param output_directory: Directory to save the reports to, created if needed
+    :param report_format: 'html' or 'pdf'
+    :param processes: Number of worker processes, defaults to the number of CPUs
+    :param extrapolation: See render_report
+    :return: List of (data filepath, report filepath or None, error message or None) tuples
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    # Every report in a batch is worked out for the same moment
+    today = datetime.now()
+    tasks = [(filepath, output_directory, report_format, extrapolation, today) for filepath in data_filepaths]
+    if len(tasks) == 0:
+        return []
+
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    with multiprocessing.Pool(processes=processes) as pool:
+        return pool.map(_render_registrar_file, tasks)
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description='Render a progress report for every cached registrar')
+    parser.add_argument('data_directory', help='Directory of registrar JSON files, e.g. cached_data')
+    parser.add_argument('output_directory', help='Directory to save the reports to')
+    parser.add_argument('--format', choices=formats, default='html')
+    parser.add_argument('--model', choices=forecasting.models, default='linear',
+                        help='Forecasting model for the extrapolation')
+    parser.add_argument('--months', type=int, default=6, help='Half life of the extrapolation weighting, in months')
+    parser.add_argument('--processes', type=int, default=None, help='Number of worker processes')
+    args = parser.parse_args()
+
+    results = render_cohort(sorted(glob.glob(os.path.join(args.data_directory, '*.json'))), args.output_directory,
+                            args.format, args.processes, (args.model, args.months))
+    for data_filepath, output_filepath, error in results:
+        if error is None:
+            print(f'{data_filepath} -> {output_filepath}')
+        else:
+            print(f'{data_filepath} failed: {error}')
@@ -0,0 +1,221 @@
+# Keeps logged in COMET sessions between syncs, and between runs of the program, so the ACPSEM association login, the
+# COMET key redirect and the proxy discovery in make_session only happen once per session lifetime rather than once per
+# sync. The cookies are saved encrypted:
+#   - On Windows with DPAPI, so only the same Windows user on the same computer can read them
+#   - Elsewhere with Fernet (from the optional cryptography package), with the key in a file only the user can read
+# If neither is available the sessions are only kept in memory, cookies are never saved unencrypted.
+#
+# A restored session is checked with one request for the dashboard headers before it's used, and only if COMET has
+# expired it is the login run again.
+# Python standard library is PSF licenced
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+
+import requests
+from requests.cookies import create_cookie
+
+from GetDataFromComet import comet_url
+from instrumentation import instrumented, span
+
+try:
+    from cryptography.fernet import Fernet
+except ImportError:
+    Fernet = None
+
+
+class DpapiCipher:
+    """
+    Encrypts with the Windows Data Protection API, tied to the current Windows user
+    """
+
+    def __init__(self):
+        import ctypes
+        from ctypes import wintypes
+
+        class DataBlob(ctypes.Structure):
+            _fields_ = [('cbData', wintypes.DWORD), ('pbData', ctypes.POINTER(ctypes.c_char))]
+
+        self.ctypes = ctypes
+        self.DataBlob = DataBlob
+        self.crypt32 = ctypes.windll.crypt32
+        self.kernel32 = ctypes.windll.kernel32
+
+    def _call(self, function, data: bytes):
+        buffer = self.ctypes.create_string_buffer(data, len(data))
+        blob_in = self.DataBlob(len(data), self.ctypes.cast(buffer, self.ctypes.POINTER(self.ctypes.c_char)))
+        blob_out = self.DataBlob()
+        # CRYPTPROTECT_UI_FORBIDDEN, as there is nobody to answer a prompt during a scheduled sync
+        if not function(self.ctypes.byref(blob_in), None, None, None, None, 0x1, self.ctypes.byref(blob_out)):
+            raise self.ctypes.WinError()
+        try:
+            return self.ctypes.string_at(blob_out.pbData, blob_out.cbData)
+        finally:
+            self.kernel32.LocalFree(blob_out.pbData)
+
+    def encrypt(self, data: bytes):
+        return self._call(self.crypt32.CryptProtectData, data)
+
+    def decrypt(self, data: bytes):
+        return self._call(self.crypt32.CryptUnprotectData, data)
+
+
+class FernetCipher:
+    """
+    :param key_filepath: File the key is kept in. It's only read when something is first encrypted or decrypted, and
+    only created (with a new key) when something is first encrypted, so nothing is written until a session is saved
+    """
+
+    def __init__(self, key_filepath: str):
+        self.key_filepath = key_filepath
+        self.fernet = None
+
+    def _fernet(self, create: bool):
+        if self.fernet is None:
+            if create and not os.path.exists(self.key_filepath):
+                os.makedirs(os.path.dirname(self.key_filepath), exist_ok=True)
+                # Only the user can read the key
+                descriptor = os.open(self.key_filepath, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(descriptor, 'wb') as f:
+                    f.write(Fernet.generate_key())
+            # Without a key there's nothing that can be decrypted, which raises FileNotFoundError
+            with open(self.key_filepath, 'rb') as f:
+                self.fernet = Fernet(f.read())
+        return self.fernet
+
+    def encrypt(self, data: bytes):
+        return self._fernet(create=True).encrypt(data)
+
+    def decrypt(self, data: bytes):
+        return self._fernet(create=False).decrypt(data)
+
+
+def default_cipher():
+    """
+    :return: The best cipher available on this computer, or None if sessions can't be saved securely
+    """
+    if sys.platform == 'win32':
+        return DpapiCipher()
+    if Fernet is not None:
+        return FernetCipher(os.path.join(os.path.expanduser('~'), '.teaptracker', 'session.key'))
+    return None
+
+
+def serialise_cookies(cookies):
+    return [{'name': cookie.name, 'value': cookie.value, 'domain': cookie.domain, 'path': cookie.path,
+             'expires': cookie.expires, 'secure': cookie.secure, 'rest': cookie._rest}
+            for cookie in cookies if not cookie.is_expired()]
+
+
+def restore_cookies(session: requests.Session, cookies: list):
+    for cookie in cookies:
+        session.cookies.set_cookie(create_cookie(**cookie))
+
+
+@instrumented()
+def is_logged_in(session: requests.Session, base_url: str = comet_url):
+    """
+    Checks a session is still logged in to COMET with one request, which only asks for the dashboard's headers. COMET
+    redirects to the login page once a session has expired
+    """
+    try:
+        response = session.head(f'{base_url}/totara/dashboard/index.php', allow_redirects=False, timeout=30)
+    except requests.exceptions.RequestException:
+        return False
+    return response.status_code == 200
+
+
+class SessionStore:
+    """
+    Logged in sessions by username, kept in memory and saved encrypted to a file
+    :param filepath: File to save the sessions in
+    :param cipher: Object with encrypt and decrypt methods, defaults to default_cipher()
+    :param session_factory: Makes the empty session cookies are restored into
+    :param is_valid: Function checking a restored session is still logged in
+    """
+
+    def __init__(self, filepath: str = 'session.dat', cipher=None, session_factory=requests.Session,
+                 is_valid=is_logged_in):
+        self.filepath = filepath
+        self.cipher = cipher if cipher is not None else default_cipher()
+        self.session_factory = session_factory
+        self.is_valid = is_valid
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self.cipher is None or not os.path.exists(self.filepath):
+            return {}
+        try:
+            with open(self.filepath, 'rb') as f:
+                return json.loads(self.cipher.decrypt(f.read()).decode('utf-8'))
+        except Exception:
+            # e.g. saved by another user or on another computer, which just means logging in again
+            return {}
+
+    def _save(self, saved: dict):
+        if self.cipher is None:
+            return
+        temporary_filepath = f'{self.filepath}.tmp'
+        with open(temporary_filepath, 'wb') as f:
+            f.write(self.cipher.encrypt(json.dumps(saved).encode('utf-8')))
+        os.replace(temporary_filepath, self.filepath)
+
+    def restore(self, username: str):
+        """
+        :return: The session for the user, from memory or the file, without checking it's still logged in, or None
+        """
+        with self._lock:
+            if username in self._sessions:
+                return self._sessions[username]
+            saved = self._load().get(username)
+            if saved is None:
+                return None
+            session = self.session_factory()
+            restore_cookies(session, saved['cookies'])
+            self._sessions[username] = session
+            return session
+
+    def save(self, username: str, session: requests.Session):
+        with self._lock:
+            self._sessions[username] = session
+            saved = self._load()
+            saved[username] = {'cookies': serialise_cookies(session.cookies),
+                               'saved': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+            self._save(saved)
+
+    def forget(self, username: str = None):
+        """
+        :param username: User to forget, or None to forget everyone
+        """
+        with self._lock:
+            if username is None:
+                self._sessions.clear()
+                if os.path.exists(self.filepath):
+                    os.remove(self.filepath)
+                return
+            self._sessions.pop(username, None)
+            saved = self._load()
+            if saved.pop(username, None) is not None:
+                self._save(saved)
+
+    def session_for(self, username: str, login):
+        """
+        Reuses the users session if it's still logged in, otherwise logs in again
+        :param login: Function taking no arguments that logs in and returns a new session, or None if it failed
+        :return: A logged in session, or None if the login failed
+        """
+        session = self.restore(username)
+        if session is not None:
+            with span('session_store.validate', username=username):
+                if self.is_valid(session):
+                    return session
+            self.forget(username)
+
+        with span('session_store.login', username=username):
+            session = login()
+        if session is not None:
+            self.save(username, session)
+        return session
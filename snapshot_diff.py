@@ -0,0 +1,165 @@
+# Works out what changed in a registrar's competencies between two lots of their data, e.g. before and after
+# downloading them again, so supervisors don't need to look through the whole Scores table for it. Competencies are
+# matched by their page (see sync_history.competency_key) in a dictionary, so it's one pass over each side.
+#
+# Can also be run for every registrar in a folder, against what they were on a date in the sync history:
+#   python snapshot_diff.py cached_data --since 2024-06-01
+# Python standard library is PSF licenced
+from datetime import datetime
+
+from competency_store import pending_status
+from sync_history import competency_key
+
+# Kinds of change, in the order they're listed
+newly_graded = 'newly graded'
+newly_submitted = 'newly submitted'
+score_changed = 'score changed'
+new_feedback = 'new feedback'
+new_competency = 'new competency'
+removed_competency = 'removed competency'
+change_kinds = (newly_graded, newly_submitted, score_changed, new_feedback, new_competency, removed_competency)
+
+
+class CompetencyChange:
+    """
+    :param key: See sync_history.competency_key
+    :param before: The competency in the old data, None if it's new
+    :param after: The competency in the new data, None if it's been removed
+    :param kinds: Tuple of the kinds of change, from change_kinds
+    """
+
+    def __init__(self, key: str, before: dict, after: dict, kinds: tuple):
+        self.key = key
+        self.before = before
+        self.after = after
+        self.kinds = kinds
+
+    @property
+    def name(self):
+        return (self.after if self.after is not None else self.before)['name']
+
+    def describe(self):
+        text = f"{self.name}: {', '.join(self.kinds)}"
+        if score_changed in self.kinds:
+            text += f" ({_score(self.before)} -> {_score(self.after)})"
+        return text
+
+
+def _score(competency: dict):
+    return float(competency['score']) if competency.get('score') is not None else None
+
+
+def _text(value):
+    # Dates may be datetimes or the strings they're saved as
+    return str(value) if value is not None else None
+
+
+def competency_change_kinds(before: dict, after: dict):
+    """
+    :return: Tuple of the kinds of change between two versions of a competency, empty if there aren't any
+    """
+    if before is None:
+        return (new_competency,)
+    if after is None:
+        return (removed_competency,)
+    # A competency that's still being downloaded hasn't changed yet
+    if pending_status in (before['submission_status'], after['submission_status']):
+        return ()
+
+    kinds = []
+    if after['grading_status'] == 'Graded' and (before['grading_status'] != 'Graded' or
+                                                _text(before.get('grade_date')) != _text(after.get('grade_date'))):
+        kinds.append(newly_graded)
+    if after['submission_status'] == 'Submitted' and (
+            before['submission_status'] != 'Submitted' or
+            _text(before.get('last_modify_date')) != _text(after.get('last_modify_date'))):
+        kinds.append(newly_submitted)
+    if _score(before) != _score(after):
+        kinds.append(score_changed)
+    if after.get('feedback') not in (None, '', 'N/A') and str(after['feedback']) != str(before.get('feedback')):
+        kinds.append(new_feedback)
+    return tuple(kinds)
+
+
+def diff_competencies(before, after):
+    """
+    :param before: The old competencies, either a list in the same format as data['competencies'] or a dictionary of
+    them by competency_key (e.g. from SyncHistory.as_of)
+    :param after: The new competencies, in either format
+    :return: List of CompetencyChange for the competencies that changed, in the order of the new competencies, then
+    the removed ones
+    """
+    if not isinstance(before, dict):
+        before = {competency_key(competency['url'], competency['name']): competency for competency in before}
+    if not isinstance(after, dict):
+        after = {competency_key(competency['url'], competency['name']): competency for competency in after}
+
+    changes = []
+    for key, competency in after.items():
+        if before.get(key) == competency:
+            continue
+        kinds = competency_change_kinds(before.get(key), competency)
+        if len(kinds) > 0:
+            changes.append(CompetencyChange(key, before.get(key), competency, kinds))
+    changes.extend(CompetencyChange(key, competency, None, (removed_competency,))
+                   for key, competency in before.items() if key not in after)
+    return changes
+
+
+def diff_data(old_data: dict, new_data: dict):
+    """
+    :param old_data: Registrar data, in the same format as the JSON files in cached_data
+    :param new_data: The same registrar's newer data
+    """
+    return diff_competencies(old_data['competencies'], new_data['competencies'])
+
+
+def summarise(changes):
+    """
+    :return: Text with the number of competencies with each kind of change, e.g. '2 newly graded, 1 new feedback', or
+    'No changes'
+    """
+    counts = {kind: sum(kind in change.kinds for change in changes) for kind in change_kinds}
+    text = ', '.join(f'{count} {kind}' for kind, count in counts.items() if count > 0)
+    return text if text != '' else 'No changes'
+
+
+def diff_cohort(cache_location: str, history, since: datetime):
+    """
+    Compares every registrar in the folder against their competencies as they were at the date
+    :param cache_location: Directory of registrar JSON files
+    :param history: SyncHistory the older competencies come from
+    :return: List of (registrar name, list of CompetencyChange), for the registrars that changed. Registrars that hadn't
+    been synced by the date are compared against nothing, so everything is new
+    """
+    import glob
+
+    import registrar_files
+
+    cohort = []
+    for filepath in sorted(glob.glob(f'{cache_location}/*.json')):
+        data = registrar_files.load(filepath)
+        changes = diff_competencies(history.as_of(data['profile_data']['user_id'], since), data['competencies'])
+        if len(changes) > 0:
+            cohort.append((data['profile_data']['name'], changes))
+    return cohort
+
+
+if __name__ == '__main__':
+    import argparse
+
+    from sync_history import SyncHistory
+
+    parser = argparse.ArgumentParser(description="List what's changed for each registrar since a date")
+    parser.add_argument('data_directory', help='Directory of registrar JSON files, e.g. cached_data')
+    parser.add_argument('--since', required=True, help='Date to compare against, e.g. 2024-06-01')
+    parser.add_argument('--history', default='sync_history.db', help='Sync history database')
+    parser.add_argument('--summary', action='store_true', help='Only show the number of each kind of change')
+    args = parser.parse_args()
+
+    for name, changes in diff_cohort(args.data_directory, SyncHistory(args.history),
+                                     datetime.strptime(args.since, '%Y-%m-%d')):
+        print(f'{name}: {summarise(changes)}')
+        if not args.summary:
+            for change in changes:
+                print(f'    {change.describe()}')
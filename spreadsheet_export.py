@@ -0,0 +1,127 @@
+# Exports the official CTG progression monitor spreadsheet, pre-filled with a registrars points. Exports for a whole
+# cohort are done in parallel worker processes. The template is only read once per process, and exports only patch the
+# cells that change (see xlsx_template.py) rather than loading the whole workbook into openpyxl.
+#
+# Headless usage:
+#   python spreadsheet_export.py cached_data exported_spreadsheets --processes 4
+# Python standard library is PSF licenced
+import multiprocessing
+import os
+import re
+from datetime import datetime
+
+import registrar_files
+from competency_store import parse_competency_id
+from teap_data import spreadsheet_cells
+from tracking_data import generate_tracking_data
+from instrumentation import instrumented
+from xlsx_template import XlsxTemplate
+
+template_filepath = 'resources/CTG v3.6 Progression Monitor Tool.xlsx'
+
+# Loaded templates by filepath, so each process only reads and splits up a template once
+_templates = {}
+
+
+def spreadsheet_values(data: dict, tracking_df):
+    """
+    Works out the value of every cell that is filled in on the spreadsheet
+    :param data: Registrar data, in the same format as the JSON files in cached_data
+    :param tracking_df: The tracking dataframe for the data, see tracking_data.generate_tracking_data
+    :return: Dictionary of cell reference (e.g. 'C12') to value
+    """
+    program_length = float(data['profile_data']['program_length'])
+    values = {spreadsheet_cells['name']: data['profile_data']['name'],
+              spreadsheet_cells['program_length']: int(program_length) if program_length.is_integer() else
+              program_length,
+              spreadsheet_cells['start_date']: datetime.strptime(str(data['profile_data']['start_date']),
+                                                                 '%Y-%m-%d %H:%M:%S'),
+              spreadsheet_cells['todays_date']: datetime.now(),
+              spreadsheet_cells['intended_brachy_level']: 'Level 2'}
+
+    # One groupby gets the mean score of every category/level, rather than filtering the dataframe once per cell
+    mean_scores = tracking_df.groupby(['module', 'category', 'level'])['score'].mean()
+    for competency_start, cell in spreadsheet_cells['competencies'].items():
+        key = parse_competency_id(competency_start)[0:3]
+        # Leave the cell blank if the registrar doesn't have any competencies for it
+        values[cell] = float(mean_scores[key]) if key in mean_scores.index else None
+
+    return values
+
+
+def get_template(template: str = template_filepath):
+    """
+    :return: The XlsxTemplate for the spreadsheet, loaded the first time it is needed
+    """
+    if template not in _templates:
+        cells = [cell for key, cell in spreadsheet_cells.items() if key != 'competencies']
+        cells.extend(spreadsheet_cells['competencies'].values())
+        _templates[template] = XlsxTemplate(template, cells)
+    return _templates[template]
+
+
+@instrumented()
+def export_spreadsheet(data: dict, tracking_df, filepath: str, template: str = template_filepath):
+    """
+    Exports the spreadsheet for a single registrar
+    """
+    get_template(template).save(spreadsheet_values(data, tracking_df), filepath)
+
+
+def spreadsheet_filename(data: dict):
+    # Registrar names can have characters that aren't allowed in filenames on Windows
+    name = re.sub(r'[<>:"/\\|?*]', '_', data['profile_data']['name']).strip()
+    return f"{name} ({data['profile_data']['user_id']}) - CTG v3.6 Progression Monitor Tool.xlsx"
+
+
+def _init_worker(template):
+    get_template(template)
+
+
+def _export_registrar_file(task):
+    data_filepath, output_directory, template = task
+    try:
+        data = registrar_files.load(data_filepath)
+        output_filepath = os.path.join(output_directory, spreadsheet_filename(data))
+        export_spreadsheet(data, generate_tracking_data(data), output_filepath, template)
+        return data_filepath, output_filepath, None
+    except Exception as e:
+        return data_filepath, None, str(e)
+
+
+def export_cohort(data_filepaths, output_directory: str, processes: int = None, template: str = template_filepath):
+    """
+    Exports the spreadsheet for every registrar data file given, in parallel worker processes
+    :param data_filepaths: List of registrar JSON files, e.g. the files in cached_data
+    :param output_directory: Directory to save the spreadsheets to, created if needed
+    :param processes: Number of worker processes, defaults to the number of CPUs
+    :param template: The blank spreadsheet to fill in
+    :return: List of (data filepath, spreadsheet filepath or None, error message or None) tuples
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    tasks = [(filepath, output_directory, template) for filepath in data_filepaths]
+    if len(tasks) == 0:
+        return []
+
+    processes = min(processes or os.cpu_count() or 1, len(tasks))
+    with multiprocessing.Pool(processes=processes, initializer=_init_worker, initargs=(template,)) as pool:
+        return pool.map(_export_registrar_file, tasks)
+
+
+if __name__ == '__main__':
+    import argparse
+    import glob
+
+    parser = argparse.ArgumentParser(description='Export the official CTG spreadsheet for every cached registrar')
+    parser.add_argument('data_directory', help='Directory of registrar JSON files, e.g. cached_data')
+    parser.add_argument('output_directory', help='Directory to save the spreadsheets to')
+    parser.add_argument('--processes', type=int, default=None, help='Number of worker processes')
+    args = parser.parse_args()
+
+    results = export_cohort(sorted(glob.glob(os.path.join(args.data_directory, '*.json'))), args.output_directory,
+                            args.processes)
+    for data_filepath, output_filepath, error in results:
+        if error is None:
+            print(f'{data_filepath} -> {output_filepath}')
+        else:
+            print(f'{data_filepath} failed: {error}')
@@ -0,0 +1,268 @@
+# Keeps every version of each registrar's competencies, rather than only the latest like the files in cached_data, so
+# resubmissions, score changes and feedback revisions aren't lost. It's a SQLite database, only ever added to:
+#   - records has each distinct version of a competency, keyed by a hash of its contents, and feedback has each distinct
+#     feedback text, so unchanged competencies (and feedback repeated between them) are only stored once
+#   - syncs has a row for each time a registrar's data was synced
+#   - versions says which record each competency had from one sync until the sync it changed in (valid_to is NULL
+#     while it's still current)
+# So a sync where nothing changed only adds its row to syncs, and the database grows with the changes, not the number
+# of syncs. The state as of any sync, and the changes between two syncs, are then indexed lookups.
+#
+# Command line usage, e.g. what changed in the last sync of registrar 1000, or their competencies as of a date:
+#   python sync_history.py 1000 --changes
+#   python sync_history.py 1000 --as-of 2024-06-30
+# Python standard library is PSF licenced
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+
+from instrumentation import instrumented
+
+date_format = '%Y-%m-%d %H:%M:%S'
+
+schema = '''
+CREATE TABLE IF NOT EXISTS feedback (hash TEXT PRIMARY KEY, text TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS records (hash TEXT PRIMARY KEY, name TEXT, score REAL, feedback_hash TEXT, url TEXT,
+                                    submission_status TEXT, grading_status TEXT, last_modify_date TEXT,
+                                    grade_date TEXT, assessor TEXT);
+CREATE TABLE IF NOT EXISTS syncs (id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, synced TEXT NOT NULL,
+                                  source TEXT);
+CREATE TABLE IF NOT EXISTS versions (user_id TEXT NOT NULL, key TEXT NOT NULL, record_hash TEXT NOT NULL,
+                                     valid_from INTEGER NOT NULL, valid_to INTEGER);
+CREATE INDEX IF NOT EXISTS syncs_by_user ON syncs (user_id, synced);
+CREATE INDEX IF NOT EXISTS versions_from ON versions (user_id, valid_from);
+CREATE INDEX IF NOT EXISTS versions_to ON versions (user_id, valid_to);
+CREATE INDEX IF NOT EXISTS versions_by_key ON versions (user_id, key, valid_from);
+'''
+
+record_columns = ('name', 'score', 'url', 'submission_status', 'grading_status', 'last_modify_date', 'grade_date',
+                  'assessor')
+
+
+def _hash(text: str):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+_url_pattern = re.compile(r'(?:[A-Za-z][A-Za-z0-9+.-]*://[^/?#]*)?([^?#]*)(?:\?([^#]*))?')
+
+
+def competency_key(url: str, name: str = None):
+    # Competencies are matched between syncs by their page, without the site address. Ones added by a gradebook import
+    # don't have a page yet, so go by their name
+    if url is None:
+        return f'name:{name}'
+    # The same path and query as urllib.parse.urlsplit, which is several times slower and it's done for every
+    # competency each time
+    match = _url_pattern.match(url)
+    return f"{match.group(1)}?{match.group(2) or ''}"
+
+
+def _record(competency: dict):
+    # The competency as it's saved in the JSON (e.g. dates as strings), with its feedback split off
+    competency = json.loads(json.dumps(competency, default=str))
+    record = {column: competency.get(column) for column in record_columns}
+    if record['score'] is not None:
+        record['score'] = float(record['score'])
+    feedback = str(competency.get('feedback'))
+    record['feedback_hash'] = _hash(feedback)
+    return _hash(json.dumps(record, sort_keys=True)), record, feedback
+
+
+class SyncHistory:
+    """
+    :param filepath: SQLite database file, created when the first sync is recorded. Until then there's no history
+    """
+
+    def __init__(self, filepath: str = 'sync_history.db'):
+        self.filepath = filepath
+        self._schema_created = False
+
+    @contextmanager
+    def _connection(self):
+        # A connection each time, so it can be used from any thread. Changes are committed if there's no exception
+        connection = sqlite3.connect(self.filepath, timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @instrumented()
+    def record_sync(self, data: dict, source: str = None, synced: datetime = None):
+        """
+        Adds a sync of a registrar's data, only storing the competencies that changed since their last one
+        :param data: Registrar data, in the same format as the JSON files in cached_data
+        :param source: What the data came from, e.g. 'comet'
+        :param synced: When it was synced, defaults to now
+        :return: The sync's id
+        """
+        user_id = str(data['profile_data']['user_id'])
+        synced = (synced if synced is not None else datetime.now()).strftime(date_format)
+        records = {competency_key(competency['url'], competency['name']): _record(competency)
+                   for competency in data['competencies']}
+
+        with self._connection() as connection:
+            if not self._schema_created:
+                connection.executescript(schema)
+                self._schema_created = True
+            sync_id = connection.execute('INSERT INTO syncs (user_id, synced, source) VALUES (?, ?, ?)',
+                                         (user_id, synced, source)).lastrowid
+            current = {row['key']: (row['rowid'], row['record_hash']) for row in connection.execute(
+                'SELECT rowid, key, record_hash FROM versions WHERE user_id = ? AND valid_to IS NULL', (user_id,))}
+
+            ended = [(sync_id, rowid) for key, (rowid, record_hash) in current.items()
+                     if key not in records or records[key][0] != record_hash]
+            connection.executemany('UPDATE versions SET valid_to = ? WHERE rowid = ?', ended)
+
+            changed = [(key, record) for key, record in records.items()
+                       if key not in current or current[key][1] != record[0]]
+            connection.executemany('INSERT OR IGNORE INTO feedback (hash, text) VALUES (?, ?)',
+                                   [(record['feedback_hash'], feedback) for _, (_, record, feedback) in changed])
+            connection.executemany(
+                f"INSERT OR IGNORE INTO records (hash, feedback_hash, {', '.join(record_columns)}) "
+                f"VALUES (?, ?, {', '.join('?' for _ in record_columns)})",
+                [(record_hash, record['feedback_hash'], *(record[column] for column in record_columns))
+                 for _, (record_hash, record, _) in changed])
+            connection.executemany('INSERT INTO versions (user_id, key, record_hash, valid_from) VALUES (?, ?, ?, ?)',
+                                   [(user_id, key, record_hash, sync_id) for key, (record_hash, _, _) in changed])
+        return sync_id
+
+    def syncs(self, user_id: str):
+        """
+        :return: List of (sync id, when it was synced, source), oldest first
+        """
+        if not os.path.exists(self.filepath):
+            return []
+        with self._connection() as connection:
+            return [(row['id'], datetime.strptime(row['synced'], date_format), row['source']) for row in
+                    connection.execute('SELECT id, synced, source FROM syncs WHERE user_id = ? ORDER BY id',
+                                       (str(user_id),))]
+
+    def sync_as_of(self, user_id: str, when: datetime):
+        """
+        :return: Id of the last sync at or before when, or None if there wasn't one
+        """
+        if not os.path.exists(self.filepath):
+            return None
+        with self._connection() as connection:
+            row = connection.execute('SELECT MAX(id) AS id FROM syncs WHERE user_id = ? AND synced <= ?',
+                                     (str(user_id), when.strftime(date_format))).fetchone()
+        return row['id']
+
+    @staticmethod
+    def _competency(row):
+        competency = {column: row[column] for column in record_columns}
+        competency['feedback'] = row['feedback']
+        return competency
+
+    @instrumented()
+    def state(self, user_id: str, sync_id: int):
+        """
+        :return: The competencies as they were at the sync, by competency_key
+        """
+        if not os.path.exists(self.filepath):
+            return {}
+        with self._connection() as connection:
+            return {row['key']: self._competency(row) for row in connection.execute(
+                'SELECT versions.key, records.*, feedback.text AS feedback FROM versions '
+                'JOIN records ON records.hash = versions.record_hash '
+                'JOIN feedback ON feedback.hash = records.feedback_hash '
+                'WHERE versions.user_id = ? AND versions.valid_from <= ? '
+                'AND (versions.valid_to IS NULL OR versions.valid_to > ?)', (str(user_id), sync_id, sync_id))}
+
+    def as_of(self, user_id: str, when: datetime):
+        """
+        :return: The competencies as they were last synced at or before when, by competency_key. Empty if the
+        registrar hadn't been synced by then
+        """
+        sync_id = self.sync_as_of(user_id, when)
+        return self.state(user_id, sync_id) if sync_id is not None else {}
+
+    @instrumented()
+    def changes(self, user_id: str, from_sync: int, to_sync: int):
+        """
+        :param from_sync: Sync id to compare from, or None for before the first sync
+        :return: List of (competency_key, competency at from_sync, competency at to_sync), with None for a competency
+        that didn't exist at that sync
+        """
+        if not os.path.exists(self.filepath):
+            return []
+        from_sync = from_sync if from_sync is not None else 0
+        with self._connection() as connection:
+            # Only the versions starting or ending between the two syncs
+            rows = connection.execute(
+                'SELECT versions.key, versions.valid_from, versions.valid_to, records.*, feedback.text AS feedback '
+                'FROM versions JOIN records ON records.hash = versions.record_hash '
+                'JOIN feedback ON feedback.hash = records.feedback_hash '
+                'WHERE versions.user_id = ? AND ((versions.valid_from > ? AND versions.valid_from <= ?) OR '
+                '(versions.valid_to > ? AND versions.valid_to <= ?))',
+                (str(user_id), from_sync, to_sync, from_sync, to_sync)).fetchall()
+
+        before = {}
+        after = {}
+        for row in rows:
+            if row['valid_from'] <= from_sync:
+                before[row['key']] = self._competency(row)
+            if row['valid_to'] is None or row['valid_to'] > to_sync:
+                after[row['key']] = self._competency(row)
+        return [(key, before.get(key), after.get(key)) for key in sorted(set(before) | set(after))
+                if before.get(key) != after.get(key)]
+
+    def history(self, user_id: str, key: str):
+        """
+        :param key: See competency_key
+        :return: List of (when the version was first synced, competency), oldest first
+        """
+        if not os.path.exists(self.filepath):
+            return []
+        with self._connection() as connection:
+            return [(datetime.strptime(row['synced'], date_format), self._competency(row)) for row in connection.execute(
+                'SELECT syncs.synced, records.*, feedback.text AS feedback FROM versions '
+                'JOIN syncs ON syncs.id = versions.valid_from '
+                'JOIN records ON records.hash = versions.record_hash '
+                'JOIN feedback ON feedback.hash = records.feedback_hash '
+                'WHERE versions.user_id = ? AND versions.key = ? ORDER BY versions.valid_from', (str(user_id), key))]
+
+
+def describe_change(before: dict, after: dict):
+    if before is None:
+        return f"{after['name']}: new"
+    if after is None:
+        return f"{before['name']}: removed"
+    return f"{after['name']}: " + ', '.join(f'{column} {before[column]} -> {after[column]}'
+                                            for column in ('score', 'submission_status', 'grading_status',
+                                                           'last_modify_date', 'grade_date', 'assessor')
+                                            if before[column] != after[column]) + \
+        (', feedback changed' if before['feedback'] != after['feedback'] else '')
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show a registrar's sync history")
+    parser.add_argument('user_id')
+    parser.add_argument('--database', default='sync_history.db')
+    parser.add_argument('--as-of', help='Show the competencies as they were on this date, e.g. 2024-06-30')
+    parser.add_argument('--changes', action='store_true', help='Show what changed in each sync')
+    args = parser.parse_args()
+
+    sync_history = SyncHistory(args.database)
+    if args.as_of is not None:
+        state = sync_history.as_of(args.user_id, datetime.strptime(args.as_of, '%Y-%m-%d').replace(hour=23, minute=59))
+        for competency in sorted(state.values(), key=lambda competency: competency['name']):
+            print(f"{competency['name']}: {competency['score']}, {competency['submission_status']}, "
+                  f"{competency['grading_status']}")
+    else:
+        previous = None
+        for sync_id, synced, source in sync_history.syncs(args.user_id):
+            changes = sync_history.changes(args.user_id, previous, sync_id)
+            print(f'{synced:%Y-%m-%d %H:%M} ({source}): {len(changes)} changes')
+            if args.changes:
+                for _, before, after in changes:
+                    print(f'    {describe_change(before, after)}')
+            previous = sync_id
@@ -0,0 +1,394 @@
+# Keeps every saved registrar up to date in the background, within a budget of requests per hour, rather than someone
+# pressing Get from Comet and waiting for a full sync. Rather than syncing everything, it polls each competency page
+# on its own interval, worked out from its state and the registrars history:
+#   - Competencies waiting on grading are polled the most, around a quarter of the registrars usual wait for grading
+#   - Drafts and partially signed off competencies are polled every 3 days, as they are likely to be resubmitted
+#   - Competencies not attempted yet are polled every few days for registrars uploading regularly, otherwise fortnightly
+#   - Signed off competencies are only polled monthly
+# The grade reports (which have the scores, feedback and any new competencies) are polled daily while anything is
+# waiting on grading, otherwise weekly. The most overdue work is done first, and all the requests go through the shared
+# FetchPool, so they are coalesced with any sync running at the same time.
+#
+# A registrar is only polled if there is a saved, still logged in session for the COMET login that downloaded them
+# (see session_store.py), as that is who can see their pages.
+#
+# Headless usage, using the logins the GUI saved in settings.ini:
+#   python sync_scheduler.py cached_data --requests-per-hour 60
+# Python standard library is PSF licenced
+import glob
+import os
+import statistics
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import registrar_files
+from competency_store import parse_competency_id
+from GetDataFromComet import comet_url, parse_competency_page, parse_grade_report_page, status_ids
+from instrumentation import instrumented, span
+
+date_format = '%Y-%m-%d %H:%M:%S'
+
+# How long a session is trusted before checking it's still logged in again
+session_check_interval = timedelta(minutes=30)
+
+# Stands for the grade reports in the work that's due, alongside the competency urls
+grade_reports = object()
+
+# Where COMET redirects to once a session has expired, which it does between the session checks too
+login_path = '/login/index.php'
+
+
+class SessionExpired(Exception):
+    """
+    A page came back as the login page (or something else that isn't the page asked for), so the session has expired
+    """
+
+
+def _date(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.strptime(value, date_format)
+
+
+def grading_turnaround_days(competencies, default: float = 14):
+    """
+    :return: The registrars median number of days between uploading a competency and it being graded
+    """
+    waits = [(_date(c['grade_date']) - _date(c['last_modify_date'])).total_seconds() / 86400
+             for c in competencies if c.get('grade_date') is not None and c.get('last_modify_date') is not None]
+    waits = [wait for wait in waits if wait > 0]
+    return statistics.median(waits) if len(waits) > 0 else default
+
+
+def is_active(competencies, now: datetime, days: int = 60):
+    """
+    :return: Whether the registrar has uploaded anything recently
+    """
+    return any(c.get('last_modify_date') is not None and now - _date(c['last_modify_date']) < timedelta(days=days)
+               for c in competencies)
+
+
+def poll_interval(competency: dict, turnaround_days: float, active: bool):
+    """
+    :param turnaround_days: See grading_turnaround_days
+    :param active: See is_active
+    :return: How often the competency page should be checked
+    """
+    if competency.get('grading_status') == 'Graded':
+        return timedelta(days=30) if competency.get('score', 0) >= 1 else timedelta(days=3)
+    if competency.get('submission_status') == 'Submitted':
+        return timedelta(days=min(max(turnaround_days / 4, 0.5), 3))
+    if competency.get('submission_status') == 'Draft (not submitted)':
+        return timedelta(days=3)
+    return timedelta(days=3) if active else timedelta(days=14)
+
+
+def merge_grade_reports(data: dict, report_data: dict):
+    """
+    Updates a registrars data with freshly parsed grade reports
+    :param report_data: Data built up by parse_grade_report_page
+    :return: Whether anything changed
+    """
+    existing = {competency['url']: competency for competency in data['competencies'] if competency['url'] is not None}
+    # Competencies added by a gradebook import don't have their page yet, so are matched by their ID
+    without_url = {parse_competency_id(competency['name']): competency for competency in data['competencies']
+                   if competency['url'] is None and parse_competency_id(competency['name']) is not None}
+    changed = False
+    for competency in report_data['competencies']:
+        current = existing.get(competency['url'])
+        if current is None:
+            current = without_url.pop(parse_competency_id(competency['name']), None)
+            if current is not None:
+                current['url'] = competency['url']
+                changed = True
+        if current is None:
+            # New competencies get their details the next time their page is polled
+            competency.update({'submission_status': 'No attempt', 'grading_status': 'Not graded',
+                               'last_modify_date': None, 'grade_date': None, 'assessor': None})
+            data['competencies'].append(competency)
+            changed = True
+        elif (current['score'], current['feedback']) != (competency['score'], competency['feedback']):
+            current['score'] = competency['score']
+            current['feedback'] = competency['feedback']
+            changed = True
+    data['points'] = report_data['points']
+    return changed
+
+
+class RegistrarSchedule:
+    """
+    When each of a registrars pages was last polled, and how often they should be
+    """
+
+    def __init__(self, filepath: str, data: dict, polled: datetime):
+        self.filepath = filepath
+        self.user_id = str(data['profile_data']['user_id'])
+        self.mtime = os.path.getmtime(filepath)
+        self.reports_polled = polled
+        # Competency url to when it was last polled. Competencies without a page yet get one from the grade reports
+        self.polled = {competency['url']: polled for competency in data['competencies']
+                       if competency['url'] is not None}
+        self.in_progress = set()
+        self.update(data)
+
+    def update(self, data: dict):
+        now = datetime.now()
+        turnaround = grading_turnaround_days(data['competencies'])
+        active = is_active(data['competencies'], now)
+        self.intervals = {competency['url']: poll_interval(competency, turnaround, active)
+                          for competency in data['competencies'] if competency['url'] is not None}
+        # New competencies are due straight away, to get their details
+        for url in self.intervals:
+            self.polled.setdefault(url, datetime.min)
+        waiting = any(c.get('submission_status') == 'Submitted' and c.get('grading_status') != 'Graded'
+                      for c in data['competencies'])
+        self.reports_interval = timedelta(days=1) if waiting else timedelta(days=7)
+
+    def due(self, now: datetime):
+        """
+        :return: List of (how overdue, url or grade_reports) for the work that is due
+        """
+        work = [(now - self.polled[url] - interval, url) for url, interval in self.intervals.items()
+                if url not in self.in_progress and now - self.polled[url] >= interval]
+        if grade_reports not in self.in_progress and now - self.reports_polled >= self.reports_interval:
+            work.append((now - self.reports_polled - self.reports_interval, grade_reports))
+        return work
+
+
+class SyncScheduler:
+    """
+    :param cache_location: Directory of registrar JSON files
+    :param fetch_pool: FetchPool the requests are made through
+    :param session_store: SessionStore with the saved COMET sessions
+    :param logins: Dictionary of registrar user id to the COMET username whose session can see their pages
+    :param requests_per_hour: Most requests made in an hour, on average
+    :param on_updated: Function called with the user id of a registrar whose saved data changed. It's called from the
+    fetch pool's threads
+    :param history: SyncHistory each change is recorded in, if any
+    """
+
+    def __init__(self, cache_location: str, fetch_pool, session_store, logins: dict, requests_per_hour: float = 60,
+                 base_url: str = comet_url, on_updated=None, history=None):
+        self.cache_location = cache_location
+        self.fetch_pool = fetch_pool
+        self.session_store = session_store
+        self.logins = logins
+        self.requests_per_hour = requests_per_hour
+        self.base_url = base_url
+        self.on_updated = on_updated
+        self.history = history
+        self.registrars = {}
+        self.sessions_checked = {}
+        # Token bucket for the request budget, which can save up ten minutes worth of requests (or enough for the grade
+        # reports, if that's more)
+        self.tokens = 0
+        self.last_tick = None
+        # Reentrant, as a fetch that has already finished (e.g. coalesced with another) calls back straight away
+        self._lock = threading.RLock()
+
+    def _forget_session(self, user_id: str):
+        # It needs a login from the GUI before it's used again
+        username = self.logins.get(user_id)
+        if username is not None:
+            self.session_store.forget(username)
+            self.sessions_checked.pop(username, None)
+
+    def _session(self, user_id: str, now: datetime):
+        username = self.logins.get(user_id)
+        if username is None:
+            return None
+        session = self.session_store.restore(username)
+        if session is None:
+            return None
+        if now - self.sessions_checked.get(username, datetime.min) > session_check_interval:
+            if not self.session_store.is_valid(session):
+                self._forget_session(user_id)
+                return None
+            self.sessions_checked[username] = now
+        return session
+
+    def scan(self, now: datetime):
+        """
+        Picks up registrars added to the cache, or saved since they were last looked at
+        """
+        for filepath in glob.glob(f'{self.cache_location}/*.json'):
+            schedule = self.registrars.get(filepath)
+            if schedule is not None and schedule.mtime == os.path.getmtime(filepath):
+                continue
+            try:
+                data = registrar_files.load(filepath)
+            except (OSError, ValueError):
+                continue
+            if schedule is None:
+                # Everything was as fresh as the file when it was saved
+                self.registrars[filepath] = RegistrarSchedule(filepath, data,
+                                                              datetime.fromtimestamp(os.path.getmtime(filepath)))
+            else:
+                schedule.mtime = os.path.getmtime(filepath)
+                schedule.update(data)
+
+    @instrumented('sync_scheduler.tick')
+    def tick(self, now: datetime = None):
+        """
+        Queues the most overdue work the request budget allows. Call this regularly, e.g. every 30 seconds
+        :return: Number of requests queued
+        """
+        now = now if now is not None else datetime.now()
+        with self._lock:
+            if self.last_tick is not None:
+                self.tokens += (now - self.last_tick).total_seconds() * self.requests_per_hour / 3600
+            self.tokens = min(self.tokens, max(self.requests_per_hour / 6, len(status_ids)))
+            self.last_tick = now
+
+            self.scan(now)
+            work = []
+            for schedule in self.registrars.values():
+                work.extend((overdue, schedule, url) for overdue, url in schedule.due(now))
+            work.sort(key=lambda item: item[0], reverse=True)
+
+            queued = 0
+            for overdue, schedule, url in work:
+                cost = len(status_ids) if url is grade_reports else 1
+                if self.tokens < cost:
+                    break
+                session = self._session(schedule.user_id, now)
+                if session is None:
+                    continue
+                self.tokens -= cost
+                queued += cost
+                schedule.in_progress.add(url)
+                if url is grade_reports:
+                    self._poll_grade_reports(schedule, session, now)
+                else:
+                    self._poll_competency(schedule, session, url, now)
+            return queued
+
+    def _poll_competency(self, schedule: RegistrarSchedule, session, url: str, now: datetime):
+        def done(future):
+            try:
+                response = future.result()
+                if response.status_code == 200:
+                    if login_path in response.url:
+                        raise SessionExpired(url)
+                    self._apply(schedule, lambda data: self._apply_competency_page(data, url, response.text))
+            except SessionExpired:
+                self._forget_session(schedule.user_id)
+            except Exception:
+                # Tried again next time it's due
+                pass
+            finally:
+                with self._lock:
+                    schedule.polled[url] = now
+                    schedule.in_progress.discard(url)
+
+        self.fetch_pool.get(session, url.replace(comet_url, self.base_url)).add_done_callback(done)
+
+    @staticmethod
+    def _apply_competency_page(data: dict, url: str, html: str):
+        """
+        :return: Whether the competency changed. Raises SessionExpired, without changing it, if the page isn't a
+        competency page
+        """
+        for competency in data['competencies']:
+            if competency['url'] == url:
+                # Parsed into a copy, so a page that doesn't parse doesn't wipe the saved statuses and dates
+                parsed = dict(competency, last_modify_date=_date(competency.get('last_modify_date')))
+                parse_competency_page(html, parsed)
+                if parsed['submission_status'] == 'Invalid':
+                    raise SessionExpired(url)
+                before = {key: str(competency.get(key)) for key in competency}
+                competency.update(parsed)
+                return {key: str(competency.get(key)) for key in competency} != before
+        return False
+
+    def _poll_grade_reports(self, schedule: RegistrarSchedule, session, now: datetime):
+        futures = [self.fetch_pool.get(session, f'{self.base_url}/grade/report/user/index.php?id={course_id}'
+                                                f'&userid={schedule.user_id}')
+                   for course_id in status_ids]
+        remaining = [len(futures)]
+
+        def done(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            try:
+                report_data = {'competencies': [],
+                               'points': {'modules': defaultdict(dict), 'summary': defaultdict(dict)}}
+                for future in futures:
+                    response = future.result()
+                    if response.status_code != 200:
+                        return
+                    if login_path in response.url:
+                        raise SessionExpired(response.url)
+                    parse_grade_report_page(response.text.replace(self.base_url, comet_url), report_data)
+                self._apply(schedule, lambda data: merge_grade_reports(data, report_data))
+            except SessionExpired:
+                self._forget_session(schedule.user_id)
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    schedule.reports_polled = now
+                    schedule.in_progress.discard(grade_reports)
+
+        for future in futures:
+            future.add_done_callback(done)
+
+    def _apply(self, schedule: RegistrarSchedule, update):
+        """
+        :param update: Function changing the registrars data in place, returning whether anything changed
+        """
+        with span('sync_scheduler.apply', user_id=schedule.user_id):
+            with self._lock:
+                # Locked while it's changed, as the GUI or another program may be saving it too
+                data, changed = registrar_files.update(schedule.filepath, update)
+                if not changed:
+                    return
+                schedule.mtime = os.path.getmtime(schedule.filepath)
+                schedule.update(data)
+        if self.history is not None:
+            self.history.record_sync(data, source='background sync')
+        if self.on_updated is not None:
+            self.on_updated(schedule.user_id)
+
+
+def logins_from_settings(settings_filepath: str):
+    """
+    Reads the registrar user id to COMET username mapping the GUI saves in settings.ini
+    """
+    import configparser
+    parser = configparser.ConfigParser()
+    parser.optionxform = str
+    parser.read(settings_filepath)
+    return dict(parser['SyncLogins']) if parser.has_section('SyncLogins') else {}
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    import pypac
+
+    from fetch_pool import FetchPool
+    from session_store import SessionStore
+    from sync_history import SyncHistory
+
+    parser = argparse.ArgumentParser(description='Keep saved registrars up to date with COMET in the background')
+    parser.add_argument('data_directory', help='Directory of registrar JSON files, e.g. cached_data')
+    parser.add_argument('--settings', default='settings.ini', help='Settings file with the saved logins')
+    parser.add_argument('--session-file', default='session.dat', help='Saved COMET sessions')
+    parser.add_argument('--requests-per-hour', type=float, default=60)
+    parser.add_argument('--interval', type=float, default=30, help='Seconds between checking for due work')
+    parser.add_argument('--history', help='Database to record every change in, e.g. sync_history.db')
+    args = parser.parse_args()
+
+    scheduler = SyncScheduler(args.data_directory, FetchPool(),
+                              SessionStore(args.session_file, session_factory=pypac.PACSession),
+                              logins_from_settings(args.settings), args.requests_per_hour,
+                              on_updated=lambda user_id: print(f'{datetime.now():%Y-%m-%d %H:%M} updated {user_id}'),
+                              history=SyncHistory(args.history) if args.history is not None else None)
+    while True:
+        scheduler.tick()
+        time.sleep(args.interval)
@@ -54,6 +54,18 @@ teap_weights = {
     '8': 5
 }
 
+# Colours and total available points for each module
+competency_reference_data = {
+    '1': {'complete_colour': '#948a54', 'incomplete_colour': '#eeece1', 'total_points': 15},
+    '2': {'complete_colour': '#f79646', 'incomplete_colour': '#fde9d9', 'total_points': 50},
+    '3': {'complete_colour': '#4bacc6', 'incomplete_colour': '#daeef3', 'total_points': 80},
+    '4': {'complete_colour': '#76923c', 'incomplete_colour': '#eaf1dd', 'total_points': 100},
+    '5': {'complete_colour': '#8064a2', 'incomplete_colour': '#e5dfec', 'total_points': 80},
+    '6': {'complete_colour': '#c0504d', 'incomplete_colour': '#f2dbdb', 'total_points': 35},
+    '7': {'complete_colour': '#4f81bd', 'incomplete_colour': '#dbe5f1', 'total_points': 15},
+    '8': {'complete_colour': '#f6dd4e', 'incomplete_colour': '#ffffcc', 'total_points': 25}
+}
+
 # Expected points to be at any point in the program. Key is years, y is an array of expected points after index +1 years
 # For example, teap_required_points['4'][2] would be the expected number of points a registrar would have after 3 years
 # in a four year program
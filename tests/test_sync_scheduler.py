@@ -0,0 +1,105 @@
+# Checks the background sync doesn't save pages that came back from an expired session, and handles competencies a
+# gradebook import added without their page
+#   python -m unittest discover tests
+# Python standard library is PSF licenced
+import os
+import tempfile
+import unittest
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import registrar_files
+from GetDataFromComet import comet_url
+from sync_scheduler import RegistrarSchedule, SessionExpired, SyncScheduler, grade_reports, login_path, \
+    merge_grade_reports
+
+competency_url = f'{comet_url}/mod/assign/view.php?id=1234'
+
+login_page = ('<html><body><div id="page-login-index"><form action="/login/index.php" method="post" id="login">'
+              '<input type="text" name="username" id="username"><input type="password" name="password" id="password">'
+              '<button type="submit" id="loginbtn">Log in</button></form></div></body></html>')
+
+
+def registrar_data():
+    return {'profile_data': {'user_id': '1000', 'name': 'Test Registrar'},
+            'competencies': [{'name': '1.2.3.1 Test competency', 'score': 1.0, 'feedback': 'Well done',
+                              'url': competency_url, 'submission_status': 'Submitted', 'grading_status': 'Graded',
+                              'last_modify_date': '2024-03-01 10:00:00', 'grade_date': '2024-03-08 09:30:00',
+                              'assessor': 'An Assessor'}],
+            'points': {}}
+
+
+class FakeSessionStore:
+    def __init__(self):
+        self.forgotten = []
+
+    def forget(self, username: str):
+        self.forgotten.append(username)
+
+
+class FakeFetchPool:
+    """
+    Answers every request straight away with the same response
+    """
+
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, session, url: str):
+        future = Future()
+        future.set_result(self.response)
+        return future
+
+
+class TestLoginPage(unittest.TestCase):
+    def test_login_page_isnt_applied(self):
+        data = registrar_data()
+        with self.assertRaises(SessionExpired):
+            SyncScheduler._apply_competency_page(data, competency_url, login_page)
+        self.assertEqual(data, registrar_data())
+
+    def test_expired_session_is_forgotten(self):
+        # Whether or not the redirect to the login page shows in the final url
+        for url in (f'{comet_url}{login_path}', competency_url):
+            with self.subTest(url=url), tempfile.TemporaryDirectory() as directory:
+                filepath = os.path.join(directory, '1000.json')
+                registrar_files.save(filepath, registrar_data())
+                with open(filepath, 'r') as f:
+                    saved = f.read()
+
+                session_store = FakeSessionStore()
+                response = SimpleNamespace(status_code=200, url=url, text=login_page)
+                scheduler = SyncScheduler(directory, FakeFetchPool(response), session_store, {'1000': 'supervisor'})
+                schedule = RegistrarSchedule(filepath, registrar_files.load(filepath), datetime.min)
+                scheduler._poll_competency(schedule, object(), competency_url, datetime.now())
+
+                self.assertEqual(session_store.forgotten, ['supervisor'])
+                with open(filepath, 'r') as f:
+                    self.assertEqual(f.read(), saved)
+                self.assertNotIn(competency_url, schedule.in_progress)
+
+
+class TestImportedCompetency(unittest.TestCase):
+    def imported_data(self):
+        data = registrar_data()
+        data['competencies'][0]['url'] = None
+        return data
+
+    def test_not_polled_without_url(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filepath = os.path.join(directory, '1000.json')
+            registrar_files.save(filepath, self.imported_data())
+            schedule = RegistrarSchedule(filepath, self.imported_data(), datetime.now())
+            self.assertEqual([url for _, url in schedule.due(datetime.now() + timedelta(days=60))], [grade_reports])
+
+    def test_grade_reports_fill_in_url(self):
+        data = self.imported_data()
+        report_data = {'competencies': [{'name': '1.2.3.1 Test competency', 'score': 1.0, 'feedback': 'Well done',
+                                         'url': competency_url}], 'points': {}}
+        self.assertTrue(merge_grade_reports(data, report_data))
+        self.assertEqual(data, registrar_data())
+
+
+if __name__ == '__main__':
+    unittest.main()
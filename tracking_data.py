@@ -0,0 +1,82 @@
+# Builds the tracking dataframe used by the plots, stats and spreadsheet export. This doesn't depend on Qt, so it can
+# be used by the GUI and by headless tools such as the batch spreadsheet export
+import numpy as np
+import pandas as pd
+
+from competency_store import CompetencyStore
+from teap_data import teap_weights, competency_reference_data
+from instrumentation import instrumented
+
+# teap_weights has the relative weight of each category within its module, this scales them so each category weight is
+# the number of points the category is worth. Keyed by (module, category)
+category_weights = {}
+for cat in teap_weights:
+    if '.' in cat:
+        module, category = cat.split('.')
+        category_weights[(int(module), int(category))] = teap_weights[cat] * \
+            competency_reference_data[module]['total_points'] / teap_weights[module]
+
+# How a categories points are split between its levels. Modules 1, 7 and 8 don't follow the usual 20/50/30 split, and
+# some of their levels are weighted individually instead. Keyed by (module, category, level)
+standard_level_weights = {1: 0.2, 2: 0.5, 3: 0.3}
+modules_without_standard_level_weights = (1, 7, 8)
+level_weights = {(1, 1, 1): 0.8, (1, 1, 2): 0.2, (1, 2, 1): 0.4, (1, 2, 2): 0.6,
+                 (7, 2, 1): 0.6, (7, 2, 2): 0.4, (7, 4, 1): 0.3, (7, 4, 2): 0.7}
+
+
+def _weight_tables(shape):
+    # Lookup arrays indexed by the integer IDs, sized to fit the data so two digit IDs work. Unknown categories get a
+    # NaN weight
+    category_table = np.full(shape[0:2], np.nan)
+    for (module, category), weight in category_weights.items():
+        if module < shape[0] and category < shape[1]:
+            category_table[module, category] = weight
+
+    level_table = np.ones(shape)
+    for level, weight in standard_level_weights.items():
+        if level < shape[2]:
+            level_table[:, :, level] = weight
+    for module in modules_without_standard_level_weights:
+        if module < shape[0]:
+            level_table[module, :, :] = 1
+    for (module, category, level), weight in level_weights.items():
+        if module < shape[0] and category < shape[1] and level < shape[2]:
+            level_table[module, category, level] = weight
+    return category_table, level_table
+
+
+@instrumented()
+def generate_tracking_data(data, store: CompetencyStore = None):
+    # This takes the normal data object (i.e. the dictionary returned from the GetDataFromComet dialog or parsed
+    # from the saved JSON) and generates a dataframe showing how the points have been updating over time. If the
+    # CompetencyStore for the data has already been built it can be passed in to save building it again
+
+    if data is None:
+        return None
+    if store is None:
+        store = CompetencyStore.from_data(data)
+
+    tracking_df = pd.DataFrame({
+        'submission_status': pd.Categorical.from_codes(store.submission_status, store.submission_categories),
+        'grading_status': pd.Categorical.from_codes(store.grading_status, store.grading_categories),
+        'score': store.scores.astype(np.float64),
+        'last_modify_date': store.as_datetime64(store.last_modify_date).astype('datetime64[ns]'),
+        'grade_date': store.as_datetime64(store.grade_date).astype('datetime64[ns]'),
+        'name': store.names,
+        'module': store.module,
+        'category': store.category,
+        'level': store.level,
+        'item': store.item})
+
+    shape = (max(store.module.max(initial=0), 8) + 1, max(store.category.max(initial=0), 7) + 1,
+             max(store.level.max(initial=0), 3) + 1)
+    category_table, level_table = _weight_tables(shape)
+    tracking_df['weight'] = category_table[store.module, store.category] * \
+        level_table[store.module, store.category, store.level]
+
+    # Each levels points are shared between the competencies in it
+    competencies_in_level = tracking_df.groupby(['module', 'category', 'level'])['module'].transform('size')
+    tracking_df['weighted_score'] = tracking_df['score'] * tracking_df['weight'] / competencies_in_level
+    tracking_df['max_uploaded_score'] = 1 * tracking_df['weight'] / competencies_in_level
+
+    return tracking_df
@@ -103,6 +103,9 @@ class Ui_MainWindow(object):
         self.dateEditProgramStart.setDateTime(QtCore.QDateTime(QtCore.QDate(2017, 1, 1), QtCore.QTime(0, 0, 0)))
         self.dateEditProgramStart.setObjectName("dateEditProgramStart")
         self.horizontalLayout_2.addWidget(self.dateEditProgramStart)
+        self.pushButtonProgramCalendar = QtWidgets.QPushButton(self.tab_6)
+        self.pushButtonProgramCalendar.setObjectName("pushButtonProgramCalendar")
+        self.horizontalLayout_2.addWidget(self.pushButtonProgramCalendar)
         self.verticalLayout_5.addLayout(self.horizontalLayout_2)
         self.MplWidgetTracking = MplWidget(self.tab_6)
         self.MplWidgetTracking.setObjectName("MplWidgetTracking")
@@ -135,6 +138,12 @@ class Ui_MainWindow(object):
         self.checkBoxShowExtrapolation = QtWidgets.QCheckBox(self.tab_6)
         self.checkBoxShowExtrapolation.setObjectName("checkBoxShowExtrapolation")
         self.horizontalLayout_7.addWidget(self.checkBoxShowExtrapolation)
+        self.comboBoxExtrapolationModel = QtWidgets.QComboBox(self.tab_6)
+        self.comboBoxExtrapolationModel.setObjectName("comboBoxExtrapolationModel")
+        self.comboBoxExtrapolationModel.addItem("")
+        self.comboBoxExtrapolationModel.addItem("")
+        self.comboBoxExtrapolationModel.addItem("")
+        self.horizontalLayout_7.addWidget(self.comboBoxExtrapolationModel)
         spacerItem = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
         self.horizontalLayout_7.addItem(spacerItem)
         self.label_17 = QtWidgets.QLabel(self.tab_6)
@@ -206,6 +215,34 @@ class Ui_MainWindow(object):
         self.label_12 = QtWidgets.QLabel(self.tab_5)
         self.label_12.setObjectName("label_12")
         self.gridLayout.addWidget(self.label_12, 8, 0, 1, 1)
+        self.groupBoxDiagnostics = QtWidgets.QGroupBox(self.tab_5)
+        self.groupBoxDiagnostics.setObjectName("groupBoxDiagnostics")
+        self.verticalLayout_8 = QtWidgets.QVBoxLayout(self.groupBoxDiagnostics)
+        self.verticalLayout_8.setObjectName("verticalLayout_8")
+        self.horizontalLayout_8 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_8.setObjectName("horizontalLayout_8")
+        self.checkBoxEnableProfiling = QtWidgets.QCheckBox(self.groupBoxDiagnostics)
+        self.checkBoxEnableProfiling.setObjectName("checkBoxEnableProfiling")
+        self.horizontalLayout_8.addWidget(self.checkBoxEnableProfiling)
+        self.checkBoxWarmFigureCache = QtWidgets.QCheckBox(self.groupBoxDiagnostics)
+        self.checkBoxWarmFigureCache.setObjectName("checkBoxWarmFigureCache")
+        self.horizontalLayout_8.addWidget(self.checkBoxWarmFigureCache)
+        spacerItem2 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayout_8.addItem(spacerItem2)
+        self.pushButtonRefreshDiagnostics = QtWidgets.QPushButton(self.groupBoxDiagnostics)
+        self.pushButtonRefreshDiagnostics.setObjectName("pushButtonRefreshDiagnostics")
+        self.horizontalLayout_8.addWidget(self.pushButtonRefreshDiagnostics)
+        self.pushButtonClearDiagnostics = QtWidgets.QPushButton(self.groupBoxDiagnostics)
+        self.pushButtonClearDiagnostics.setObjectName("pushButtonClearDiagnostics")
+        self.horizontalLayout_8.addWidget(self.pushButtonClearDiagnostics)
+        self.pushButtonExportDiagnostics = QtWidgets.QPushButton(self.groupBoxDiagnostics)
+        self.pushButtonExportDiagnostics.setObjectName("pushButtonExportDiagnostics")
+        self.horizontalLayout_8.addWidget(self.pushButtonExportDiagnostics)
+        self.verticalLayout_8.addLayout(self.horizontalLayout_8)
+        self.tableViewDiagnostics = QtWidgets.QTableView(self.groupBoxDiagnostics)
+        self.tableViewDiagnostics.setObjectName("tableViewDiagnostics")
+        self.verticalLayout_8.addWidget(self.tableViewDiagnostics)
+        self.gridLayout.addWidget(self.groupBoxDiagnostics, 9, 0, 1, 2)
         self.tabWidgetMain.addTab(self.tab_5, "")
         self.tab_7 = QtWidgets.QWidget()
         self.tab_7.setObjectName("tab_7")
@@ -233,6 +270,36 @@ class Ui_MainWindow(object):
         self.pushButtonLoadPreviousData.setObjectName("pushButtonLoadPreviousData")
         self.horizontalLayout.addWidget(self.pushButtonLoadPreviousData)
         self.verticalLayout_2.addLayout(self.horizontalLayout)
+        self.horizontalLayoutWebService = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutWebService.setObjectName("horizontalLayoutWebService")
+        self.labelCometToken = QtWidgets.QLabel(self.tab_7)
+        self.labelCometToken.setObjectName("labelCometToken")
+        self.horizontalLayoutWebService.addWidget(self.labelCometToken)
+        self.lineEditCometToken = QtWidgets.QLineEdit(self.tab_7)
+        self.lineEditCometToken.setEchoMode(QtWidgets.QLineEdit.Password)
+        self.lineEditCometToken.setObjectName("lineEditCometToken")
+        self.horizontalLayoutWebService.addWidget(self.lineEditCometToken)
+        self.pushButtonGetDataWithToken = QtWidgets.QPushButton(self.tab_7)
+        self.pushButtonGetDataWithToken.setObjectName("pushButtonGetDataWithToken")
+        self.horizontalLayoutWebService.addWidget(self.pushButtonGetDataWithToken)
+        self.verticalLayout_2.addLayout(self.horizontalLayoutWebService)
+        self.horizontalLayoutBackgroundSync = QtWidgets.QHBoxLayout()
+        self.horizontalLayoutBackgroundSync.setObjectName("horizontalLayoutBackgroundSync")
+        self.checkBoxBackgroundSync = QtWidgets.QCheckBox(self.tab_7)
+        self.checkBoxBackgroundSync.setObjectName("checkBoxBackgroundSync")
+        self.horizontalLayoutBackgroundSync.addWidget(self.checkBoxBackgroundSync)
+        self.labelSyncRequestsPerHour = QtWidgets.QLabel(self.tab_7)
+        self.labelSyncRequestsPerHour.setObjectName("labelSyncRequestsPerHour")
+        self.horizontalLayoutBackgroundSync.addWidget(self.labelSyncRequestsPerHour)
+        self.spinBoxSyncRequestsPerHour = QtWidgets.QSpinBox(self.tab_7)
+        self.spinBoxSyncRequestsPerHour.setMinimum(10)
+        self.spinBoxSyncRequestsPerHour.setMaximum(600)
+        self.spinBoxSyncRequestsPerHour.setProperty("value", 60)
+        self.spinBoxSyncRequestsPerHour.setObjectName("spinBoxSyncRequestsPerHour")
+        self.horizontalLayoutBackgroundSync.addWidget(self.spinBoxSyncRequestsPerHour)
+        spacerItem3 = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        self.horizontalLayoutBackgroundSync.addItem(spacerItem3)
+        self.verticalLayout_2.addLayout(self.horizontalLayoutBackgroundSync)
         self.horizontalLayout_3 = QtWidgets.QHBoxLayout()
         self.horizontalLayout_3.setObjectName("horizontalLayout_3")
         self.label_5 = QtWidgets.QLabel(self.tab_7)
@@ -245,8 +312,8 @@ class Ui_MainWindow(object):
         self.pushButtonLoadSelectedCachedFile.setObjectName("pushButtonLoadSelectedCachedFile")
         self.horizontalLayout_3.addWidget(self.pushButtonLoadSelectedCachedFile)
         self.verticalLayout_2.addLayout(self.horizontalLayout_3)
-        spacerItem2 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
-        self.verticalLayout_2.addItem(spacerItem2)
+        spacerItem4 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.verticalLayout_2.addItem(spacerItem4)
         self.tabWidgetMain.addTab(self.tab_7, "")
         self.verticalLayout.addWidget(self.tabWidgetMain)
         MainWindow.setCentralWidget(self.centralwidget)
@@ -261,7 +328,18 @@ class Ui_MainWindow(object):
         MainWindow.setStatusBar(self.statusbar)
         self.actionExport_official_spreadsheet = QtWidgets.QAction(MainWindow)
         self.actionExport_official_spreadsheet.setObjectName("actionExport_official_spreadsheet")
+        self.actionExport_all_official_spreadsheets = QtWidgets.QAction(MainWindow)
+        self.actionExport_all_official_spreadsheets.setObjectName("actionExport_all_official_spreadsheets")
+        self.actionImport_gradebook_exports = QtWidgets.QAction(MainWindow)
+        self.actionImport_gradebook_exports.setObjectName("actionImport_gradebook_exports")
+        self.actionForget_saved_login = QtWidgets.QAction(MainWindow)
+        self.actionForget_saved_login.setObjectName("actionForget_saved_login")
         self.menuFile.addAction(self.actionExport_official_spreadsheet)
+        self.menuFile.addAction(self.actionExport_all_official_spreadsheets)
+        self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionImport_gradebook_exports)
+        self.menuFile.addSeparator()
+        self.menuFile.addAction(self.actionForget_saved_login)
         self.menubar.addAction(self.menuFile.menuAction())
 
         self.retranslateUi(MainWindow)
@@ -280,6 +358,7 @@ class Ui_MainWindow(object):
         self.tabWidgetMain.setTabText(self.tabWidgetMain.indexOf(self.tab_4), _translate("MainWindow", "Module Overview"))
         self.label_7.setText(_translate("MainWindow", "Length of program"))
         self.label_10.setText(_translate("MainWindow", "Start of program"))
+        self.pushButtonProgramCalendar.setText(_translate("MainWindow", "Pauses and part time..."))
         self.label_14.setText(_translate("MainWindow", "Note that \'Uploaded\' points assumes any competency that is waiting for grading has had all the work done to sign it off completely"))
         self.checkBoxShowPlan.setText(_translate("MainWindow", "Show plan"))
         self.label_18.setText(_translate("MainWindow", "Start"))
@@ -287,7 +366,10 @@ class Ui_MainWindow(object):
         self.label_19.setText(_translate("MainWindow", "Finish"))
         self.dateEditPlanEnd.setDisplayFormat(_translate("MainWindow", "yyyy-MM-dd"))
         self.checkBoxShowExtrapolation.setText(_translate("MainWindow", "Show extrapolation"))
-        self.label_17.setText(_translate("MainWindow", "Months to use for extrapolation"))
+        self.comboBoxExtrapolationModel.setItemText(0, _translate("MainWindow", "Weighted linear"))
+        self.comboBoxExtrapolationModel.setItemText(1, _translate("MainWindow", "Piecewise linear"))
+        self.comboBoxExtrapolationModel.setItemText(2, _translate("MainWindow", "Slowing down"))
+        self.label_17.setText(_translate("MainWindow", "Months of recent progress to weight most"))
         self.tabWidgetMain.setTabText(self.tabWidgetMain.indexOf(self.tab_6), _translate("MainWindow", "Tracking"))
         self.label_9.setText(_translate("MainWindow", "Non-signed off competencies"))
         self.label_11.setText(_translate("MainWindow", "Waiting on grading"))
@@ -300,14 +382,29 @@ class Ui_MainWindow(object):
         self.labelAverageWaitingTimeForSignOff.setText(_translate("MainWindow", "0 days"))
         self.labelWaitingOnGradingCompetencies.setText(_translate("MainWindow", "0 [%]"))
         self.label_12.setText(_translate("MainWindow", "*This is calculated as mean time between last modified date and date graded"))
+        self.groupBoxDiagnostics.setTitle(_translate("MainWindow", "Diagnostics"))
+        self.checkBoxEnableProfiling.setText(_translate("MainWindow", "Record timings"))
+        self.checkBoxWarmFigureCache.setToolTip(_translate("MainWindow", "Draws the plots for every saved registrar in the background, so switching between them is quicker"))
+        self.checkBoxWarmFigureCache.setText(_translate("MainWindow", "Pre-render plots for all registrars"))
+        self.pushButtonRefreshDiagnostics.setText(_translate("MainWindow", "Refresh"))
+        self.pushButtonClearDiagnostics.setText(_translate("MainWindow", "Clear"))
+        self.pushButtonExportDiagnostics.setText(_translate("MainWindow", "Export timings"))
         self.tabWidgetMain.setTabText(self.tabWidgetMain.indexOf(self.tab_5), _translate("MainWindow", "Misc"))
         self.label_4.setText(_translate("MainWindow", "Load new data from COMET"))
         self.label.setText(_translate("MainWindow", "Username"))
         self.label_2.setText(_translate("MainWindow", "Password"))
         self.pushButtonLoadPreviousData.setText(_translate("MainWindow", "Get from Comet"))
+        self.labelCometToken.setText(_translate("MainWindow", "Or with a COMET web service token"))
+        self.pushButtonGetDataWithToken.setText(_translate("MainWindow", "Get from Comet with token"))
+        self.checkBoxBackgroundSync.setToolTip(_translate("MainWindow", "Checks COMET for changes to saved registrars while the program is open, polling competencies waiting on grading the most. Only registrars downloaded with a username and password that is still logged in are checked"))
+        self.checkBoxBackgroundSync.setText(_translate("MainWindow", "Keep saved registrars up to date in the background"))
+        self.labelSyncRequestsPerHour.setText(_translate("MainWindow", "Requests per hour"))
         self.label_5.setText(_translate("MainWindow", "Load previously saved data"))
         self.pushButtonLoadSelectedCachedFile.setText(_translate("MainWindow", "Load"))
         self.tabWidgetMain.setTabText(self.tabWidgetMain.indexOf(self.tab_7), _translate("MainWindow", "Get data"))
         self.menuFile.setTitle(_translate("MainWindow", "File"))
         self.actionExport_official_spreadsheet.setText(_translate("MainWindow", "Export official spreadsheet"))
+        self.actionExport_all_official_spreadsheets.setText(_translate("MainWindow", "Export official spreadsheets for all saved registrars"))
+        self.actionImport_gradebook_exports.setText(_translate("MainWindow", "Import gradebook exports for saved registrars"))
+        self.actionForget_saved_login.setText(_translate("MainWindow", "Forget saved COMET login"))
 from widgets.MplWidget import MplWidget
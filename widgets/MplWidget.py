@@ -7,7 +7,11 @@ from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as Canvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 from matplotlib.widgets import Cursor
+from matplotlib.backend_bases import DrawEvent
 import matplotlib
+import numpy as np
+from figure_cache import RenderedFigure
+from instrumentation import span
 
 # Ensure using PyQt5 backend
 matplotlib.use('QT5Agg')
@@ -28,6 +32,36 @@ class MplCanvas(Canvas):
         Canvas.setSizePolicy(self, QSizePolicy.Expanding, QSizePolicy.Expanding)
         Canvas.updateGeometry(self)
 
+    def draw(self):
+        with span('canvas.draw', widget=self.parent().objectName() if self.parent() is not None else ''):
+            Canvas.draw(self)
+
+    def draw_cached(self, cache, key):
+        """
+        Draws the canvas, reusing the pixels from the cache if this figure has been rendered before at this size. The
+        artists must already match what was rendered, see figure_cache.py
+        :param cache: FigureCache
+        :param key: See figure_cache.figure_key
+        """
+        rendered = cache.get(key)
+        renderer = self.get_renderer()
+        buffer = np.asarray(renderer.buffer_rgba())
+        if rendered is None or rendered.image.shape != buffer.shape:
+            self.draw()
+            cache.put(key, RenderedFigure.from_canvas(self))
+            return
+
+        with span('canvas.draw_cached', widget=self.parent().objectName() if self.parent() is not None else ''):
+            # Put the axes back where the layout had them, and bring their limits up to date, so mouse events map to
+            # the right data coordinates without a full draw
+            self.fig.subplots_adjust(**rendered.subplot_params)
+            for ax in self.fig.axes:
+                ax.get_xlim()
+            buffer[:] = rendered.image
+            self.update()
+            # Anything saving the background for blitting needs to know there are new pixels
+            self.callbacks.process('draw_event', DrawEvent('draw_event', self, renderer))
+
 class MplToolbar(NavigationToolbar):
     """
     Small inherited toolbar class to remove some of the tools we don't need
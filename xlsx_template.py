@@ -0,0 +1,216 @@
+# Fills in a fixed set of cells of an .xlsx template without loading it into openpyxl. The template is read and split
+# up once, so each export only has to render the cells that change and write the zip back out, rather than parsing and
+# re-serialising every style and formula in the workbook.
+#
+# Usage:
+#     template = XlsxTemplate('template.xlsx', ['B2', 'D3'])
+#     template.save({'B2': 'Name', 'D3': 3}, 'filled_in.xlsx')
+# Python standard library is PSF licenced
+import posixpath
+import re
+import zipfile
+from datetime import date, datetime, time, timedelta
+from xml.sax.saxutils import escape
+
+_sheet_data_pattern = re.compile(r'<sheetData\s*/>|<sheetData>(.*?)</sheetData>', re.S)
+_row_pattern = re.compile(r'<row\b[^>]*?\br="(\d+)"[^>]*?(?:/>|>(.*?)</row>)', re.S)
+_cell_pattern = re.compile(r'<c\b[^>]*?\br="([A-Z]+)(\d+)"[^>]*?(?:/>|>.*?</c>)', re.S)
+_style_pattern = re.compile(r'\bs="(\d+)"')
+_cell_reference_pattern = re.compile(r'^([A-Z]+)(\d+)$')
+
+_epoch_1900 = datetime(1899, 12, 30)
+_epoch_1904 = datetime(1904, 1, 1)
+
+
+def _column_number(column: str):
+    number = 0
+    for letter in column:
+        number = number * 26 + ord(letter) - ord('A') + 1
+    return number
+
+
+def _split_reference(reference: str):
+    match = _cell_reference_pattern.match(reference)
+    if match is None:
+        raise ValueError(f'{reference} is not a cell reference')
+    return match.group(1), int(match.group(2))
+
+
+def _sheet_order(reference: str):
+    # Cells are in the sheet XML by row, then column number (so Z1 comes before AA1)
+    column, row_number = _split_reference(reference)
+    return row_number, _column_number(column)
+
+
+def _xml_attribute(xml: str, name: str):
+    match = re.search(rf'\b{name}="([^"]*)"', xml)
+    return match.group(1) if match else None
+
+
+class XlsxTemplate:
+    """
+    An .xlsx file held in memory, with the cells that will be filled in cut out of its worksheet
+    :param filepath: The template to load
+    :param cells: Every cell reference (e.g. 'C12') that may be filled in
+    :param sheet_name: Worksheet the cells are on, defaults to the sheet that is active when the file is opened
+    """
+
+    def __init__(self, filepath: str, cells, sheet_name: str = None):
+        with zipfile.ZipFile(filepath, 'r') as z:
+            self.parts = [(info, z.read(info.filename)) for info in z.infolist()]
+        contents = {info.filename: data for info, data in self.parts}
+
+        workbook_xml = contents['xl/workbook.xml'].decode('utf-8')
+        workbook_properties = re.search(r'<workbookPr\b[^>]*>', workbook_xml)
+        # Dates are stored as days since 1900 or 1904 depending on the workbook
+        self.date1904 = workbook_properties is not None and \
+            _xml_attribute(workbook_properties.group(0), 'date1904') in ('1', 'true')
+        self.sheet_part = self._find_sheet_part(workbook_xml, contents['xl/_rels/workbook.xml.rels'].decode('utf-8'),
+                                                sheet_name)
+
+        # Excel trusts the cached values of formulas, so ask it to recalculate everything that depends on the filled
+        # in cells when it opens the file
+        self.workbook_xml = self._force_recalculation(workbook_xml).encode('utf-8')
+
+        self.cells = sorted(set(cells), key=_sheet_order)
+        self.chunks, self.styles = self._split_sheet(contents[self.sheet_part].decode('utf-8'))
+
+    @staticmethod
+    def _find_sheet_part(workbook_xml: str, workbook_rels: str, sheet_name: str = None):
+        sheets = re.findall(r'<sheet\b[^>]*>', workbook_xml)
+        if sheet_name is None:
+            view = re.search(r'<workbookView\b[^>]*>', workbook_xml)
+            active_tab = _xml_attribute(view.group(0), 'activeTab') if view else None
+            sheet = sheets[int(active_tab or 0)]
+        else:
+            matches = [sheet for sheet in sheets if _xml_attribute(sheet, 'name') == escape(sheet_name)]
+            if len(matches) == 0:
+                raise KeyError(f'No worksheet called {sheet_name}')
+            sheet = matches[0]
+
+        relationship_id = _xml_attribute(sheet, 'r:id')
+        for relationship in re.findall(r'<Relationship\b[^>]*>', workbook_rels):
+            if _xml_attribute(relationship, 'Id') == relationship_id:
+                target = _xml_attribute(relationship, 'Target')
+                return target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+        raise KeyError(f'No worksheet part for {relationship_id}')
+
+    @staticmethod
+    def _force_recalculation(workbook_xml: str):
+        calc = re.search(r'<calcPr\b[^>]*?/?>', workbook_xml)
+        if calc is None:
+            return workbook_xml.replace('</workbook>', '<calcPr fullCalcOnLoad="1"/></workbook>')
+        calc_xml = calc.group(0)
+        if 'fullCalcOnLoad=' in calc_xml:
+            new_calc_xml = re.sub(r'fullCalcOnLoad="[^"]*"', 'fullCalcOnLoad="1"', calc_xml)
+        else:
+            new_calc_xml = calc_xml.replace('<calcPr', '<calcPr fullCalcOnLoad="1"', 1)
+        return workbook_xml[:calc.start()] + new_calc_xml + workbook_xml[calc.end():]
+
+    def _split_sheet(self, sheet_xml: str):
+        """
+        Cuts the template cells out of the worksheet XML, adding any cells (and rows) the template doesn't have yet
+        :return: List of the XML between the cells (one longer than self.cells), and the style index of each cell
+        """
+        sheet_data = _sheet_data_pattern.search(sheet_xml)
+        if sheet_data is None:
+            raise ValueError(f'{self.sheet_part} has no sheetData')
+
+        # Existing rows of the sheet, as row number -> [opening tag, [(column number, cell xml)], closing tag]
+        rows = {}
+        for row in _row_pattern.finditer(sheet_data.group(1) or ''):
+            row_xml = row.group(0)
+            if row_xml.endswith('/>'):
+                rows[int(row.group(1))] = [row_xml[:-2] + '>', [], '</row>']
+            else:
+                opening_tag = row_xml[:row_xml.index('>') + 1]
+                rows[int(row.group(1))] = [opening_tag, [(_column_number(cell.group(1)), cell.group(0))
+                                                         for cell in _cell_pattern.finditer(row.group(2))], '</row>']
+
+        # None marks a template cell, which is filled in when the workbook is saved
+        styles = []
+        for reference in self.cells:
+            column, row_number = _split_reference(reference)
+            row = rows.setdefault(row_number, [f'<row r="{row_number}">', [], '</row>'])
+            existing = [i for i, (number, _) in enumerate(row[1]) if number == _column_number(column)]
+            if existing:
+                style = _style_pattern.search(row[1][existing[0]][1].split('>', 1)[0])
+                row[1][existing[0]] = (_column_number(column), None)
+            else:
+                # The template has no formatting for this cell, so fall back to the row style if it has one
+                style = _style_pattern.search(row[0]) if 'customFormat="1"' in row[0] else None
+                row[1].append((_column_number(column), None))
+                row[1].sort(key=lambda cell: cell[0])
+            styles.append(style.group(1) if style else None)
+
+        chunks = []
+        current = [sheet_xml[:sheet_data.start()], '<sheetData>']
+        for row_number in sorted(rows):
+            opening_tag, cells, closing_tag = rows[row_number]
+            current.append(opening_tag)
+            for column_number, cell_xml in cells:
+                if cell_xml is None:
+                    chunks.append(''.join(current))
+                    current = []
+                else:
+                    current.append(cell_xml)
+            current.append(closing_tag)
+        current.extend(['</sheetData>', sheet_xml[sheet_data.end():]])
+        chunks.append(''.join(current))
+        return chunks, styles
+
+    def _serial_date(self, value):
+        if isinstance(value, datetime):
+            value = value.replace(tzinfo=None)
+        else:
+            value = datetime.combine(value, time())
+        epoch = _epoch_1904 if self.date1904 else _epoch_1900
+        serial = (value - epoch) / timedelta(days=1)
+        # Excel's 1900 date system thinks 1900 was a leap year, so dates before March 1900 are a day out
+        if not self.date1904 and serial < 61:
+            serial -= 1
+        return serial
+
+    def _render_cell(self, reference: str, style: str, value):
+        attributes = f'r="{reference}"' + (f' s="{style}"' if style is not None else '')
+        if value is None:
+            return f'<c {attributes}/>'
+        elif isinstance(value, bool):
+            return f'<c {attributes} t="b"><v>{int(value)}</v></c>'
+        elif isinstance(value, (int, float)):
+            return f'<c {attributes}><v>{repr(value)}</v></c>'
+        elif isinstance(value, (datetime, date)):
+            return f'<c {attributes}><v>{repr(self._serial_date(value))}</v></c>'
+        return f'<c {attributes} t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+    def render_sheet(self, values: dict):
+        """
+        :param values: Dictionary of cell reference to value (str, int, float, bool, date or None for blank). Cells
+        that aren't given are left blank
+        :return: The filled in worksheet XML
+        """
+        unknown = set(values) - set(self.cells)
+        if unknown:
+            raise KeyError(f'Cells not in the template: {", ".join(sorted(unknown))}')
+
+        parts = [self.chunks[0]]
+        for reference, style, chunk in zip(self.cells, self.styles, self.chunks[1:]):
+            parts.append(self._render_cell(reference, style, values.get(reference)))
+            parts.append(chunk)
+        return ''.join(parts)
+
+    def save(self, values: dict, file, compresslevel: int = 1):
+        """
+        Writes a copy of the template with the cells filled in
+        :param values: See render_sheet
+        :param file: Filepath or writable file object
+        :param compresslevel: Deflate level for the zip, low levels are much faster and barely any bigger
+        """
+        sheet_xml = self.render_sheet(values).encode('utf-8')
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as z:
+            for info, data in self.parts:
+                if info.filename == self.sheet_part:
+                    data = sheet_xml
+                elif info.filename == 'xl/workbook.xml':
+                    data = self.workbook_xml
+                z.writestr(info, data, compress_type=zipfile.ZIP_DEFLATED, compresslevel=compresslevel)